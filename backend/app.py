@@ -2,7 +2,10 @@ from pathlib import Path
 
 from flask import Flask
 
+from database import lentas, migrations
 from database.config import load_config
+from herramientas import bench, carga, choques, presupuesto_sql, seed
+from models import assets, fotos, memoria, metricas, perfilador, presupuesto, render, trazas, vigia
 from routes.crud_routes import bp as crud_bp
 
 
@@ -16,6 +19,28 @@ def create_app():
 		static_url_path="/static",
 	)
 	load_config(app)
+
+	# Bytecode de plantillas en disco: los workers nuevos no recompilan
+	app.jinja_env.bytecode_cache = render.bytecode_cache(app.config["JINJA_CACHE_DIR"])
+	# fotos registra el filtro foto_url que usan las macros precompiladas
+	assets.init_app(app)
+	fotos.init_app(app)
+	render.init_app(app)
+
+	trazas.init_app(app)
+	metricas.init_app(app)
+	perfilador.init_app(app)
+	memoria.init_app(app)
+	lentas.init_app(app)
+	vigia.init_app(app)
+	presupuesto.init_app(app)
+	migrations.init_app(app)
+	bench.init_app(app)
+	choques.init_app(app)
+	carga.init_app(app)
+	presupuesto_sql.init_app(app)
+	seed.init_app(app)
+
 	app.register_blueprint(crud_bp)
 
 	return app
@@ -0,0 +1,157 @@
+from __future__ import annotations
+
+import fcntl
+import os
+import threading
+import time
+from pathlib import Path
+
+from flask import current_app
+
+from database.connection import get_connection
+
+
+# Tablas de referencia (pocas filas, casi nunca cambian) y su consulta completa.
+# Los llamadores filtran/proyectan en Python sobre estas filas.
+REFERENCE_SQL = {
+    "especialidades": "SELECT IdEsp, Descripcion, Dias, Franja_HI, Franja_HF FROM especialidades ORDER BY Descripcion",
+    "medicamentos": "SELECT IdMedicamento, Nombre, Tipo FROM medicamentos ORDER BY Nombre",
+    "roles": "SELECT IdRol, Nombre, Accion FROM roles ORDER BY IdRol",
+}
+
+# tabla -> (versión, vence_en, filas)
+_cache: dict[str, tuple[int, float, list[dict]]] = {}
+_lock = threading.Lock()
+
+# tabla -> [aciertos, recargas] de get_reference en este proceso
+_stats: dict[str, list[int]] = {}
+
+
+def _version_file(table: str) -> Path:
+    return Path(current_app.config["CACHE_VERSION_DIR"]) / f"{table}.version"
+
+
+def _leer_version(fd: int) -> int:
+    st = os.fstat(fd)
+    if st.st_size == 8:
+        return int.from_bytes(os.pread(fd, 8, 0), "big")
+    # Formato anterior (un byte agregado por invalidación) o archivo recién creado
+    return st.st_size
+
+
+def _leer(table: str) -> tuple[int, os.stat_result] | None:
+    """(versión, stat) del archivo de `table`, o None si nunca se invalidó."""
+
+    try:
+        fd = os.open(_version_file(table), os.O_RDONLY)
+    except FileNotFoundError:
+        return None
+    try:
+        fcntl.flock(fd, fcntl.LOCK_SH)
+        return _leer_version(fd), os.fstat(fd)
+    finally:
+        os.close(fd)
+
+
+def table_version(table: str) -> int:
+    """Versión actual de `table` compartida por todos los workers del host.
+
+    La versión es un contador de 8 bytes en `<tabla>.version` que se lee y
+    se incrementa bajo flock: el archivo no crece con las invalidaciones.
+    """
+
+    leido = _leer(table)
+    return leido[0] if leido else 0
+
+
+def bump_version(*tables: str) -> None:
+    """Marca las tablas como modificadas para todos los workers del host."""
+
+    for table in tables:
+        path = _version_file(table)
+        path.parent.mkdir(parents=True, exist_ok=True)
+        fd = os.open(path, os.O_RDWR | os.O_CREAT, 0o644)
+        try:
+            fcntl.flock(fd, fcntl.LOCK_EX)
+            os.pwrite(fd, (_leer_version(fd) + 1).to_bytes(8, "big"), 0)
+            os.ftruncate(fd, 8)
+        finally:
+            os.close(fd)
+
+
+def tables_stamp(tables) -> tuple[str, float | None]:
+    """Huella de versión de varias tablas y fecha (epoch) del último cambio.
+
+    Incluye el mtime además del contador para que un directorio de versiones
+    recreado no repita huellas antiguas. Se usa para ETag/Last-Modified y
+    para el perfil guardado en la sesión. Con CACHE_VERSION_TTL la huella
+    cambia también cada TTL segundos: un cambio hecho en otro host (que no
+    ve estos archivos) se nota a lo sumo tras ese tiempo.
+    """
+
+    ttl = current_app.config.get("CACHE_VERSION_TTL", 0)
+    parts: list[str] = [f"t:{int(time.time() // ttl)}"] if ttl > 0 else []
+    last: float | None = None
+    for table in tables:
+        leido = _leer(table)
+        if leido is None:
+            parts.append(f"{table}:0")
+            continue
+        version, st = leido
+        parts.append(f"{table}:{version}:{st.st_mtime_ns}")
+        last = st.st_mtime if last is None else max(last, st.st_mtime)
+    return ";".join(parts), last
+
+
+def invalidate(table: str) -> None:
+    """Descarta la caché local de `table` y avisa al resto de workers."""
+
+    with _lock:
+        _cache.pop(table, None)
+    bump_version(table)
+
+
+def get_reference(table: str, cn=None) -> list[dict]:
+    """Filas de una tabla de referencia desde la caché del proceso.
+
+    Se recarga si otro worker cambió la versión o si venció el TTL
+    (REFERENCE_CACHE_TTL, por cambios hechos fuera de la aplicación).
+    Sin `cn`, solo se abre conexión cuando hay que recargar.
+    """
+
+    version = table_version(table)
+    now = time.monotonic()
+
+    entry = _cache.get(table)
+    hit = bool(entry and entry[0] == version and entry[1] > now)
+    with _lock:
+        _stats.setdefault(table, [0, 0])[0 if hit else 1] += 1
+    if hit:
+        rows = entry[2]  # type: ignore[index]
+    else:
+        if cn is None:
+            with get_connection(current_app) as new_cn:
+                rows = _load(new_cn, table)
+        else:
+            rows = _load(cn, table)
+        ttl = current_app.config.get("REFERENCE_CACHE_TTL", 300)
+        with _lock:
+            _cache[table] = (version, now + ttl, rows)
+
+    # Copias: los llamadores pueden modificar los dict sin tocar la caché
+    return [dict(r) for r in rows]
+
+
+def cache_stats() -> dict[str, tuple[int, int]]:
+    """(aciertos, recargas) de la caché de referencia por tabla en este proceso."""
+
+    with _lock:
+        return {table: (s[0], s[1]) for table, s in _stats.items()}
+
+
+def _load(cn, table: str) -> list[dict]:
+    cur = cn.cursor(dictionary=True)
+    cur.execute(REFERENCE_SQL[table])
+    rows = cur.fetchall() or []
+    cur.close()
+    return rows
@@ -1,4 +1,5 @@
 import os
+import tempfile
 
 
 class Config:
@@ -12,6 +13,95 @@ class Config:
     DB_NAME = os.getenv("DB_NAME", "humanas")
     DB_PORT = int(os.getenv("DB_PORT", "3306"))
 
+    # Aplicar las migraciones pendientes al crear la app (si no, `flask db-upgrade`)
+    DB_MIGRATE_ON_START = os.getenv("DB_MIGRATE_ON_START", "0") == "1"
+
+    # Caché persistente del bytecode de plantillas Jinja (compartida entre workers).
+    # Vacío: la carpeta por usuario de Jinja (0700, verifica el dueño). Una
+    # carpeta explícita debe ser del usuario del proceso y no escribible por otros
+    JINJA_CACHE_DIR = os.getenv("JINJA_CACHE_DIR", "")
+
+    # Filas por lote (fetchmany) en las exportaciones CSV/NDJSON del administrador
+    EXPORT_BATCH_SIZE = int(os.getenv("EXPORT_BATCH_SIZE", "1000"))
+
+    # Filas por transacción (executemany) en la importación masiva CSV
+    IMPORT_CHUNK_SIZE = int(os.getenv("IMPORT_CHUNK_SIZE", "500"))
+
+    # Caché de tablas de referencia (especialidades, medicamentos, roles):
+    # TTL en segundos y carpeta con las versiones compartidas entre workers.
+    # Las versiones son archivos locales: solo los workers del mismo host ven
+    # una invalidación. Con varios hosts detrás de un balanceador, otro nodo
+    # puede seguir respondiendo 304 (ETag), perfiles de sesión y tablas de
+    # referencia viejos hasta CACHE_VERSION_TTL (ETag y perfil) y
+    # REFERENCE_CACHE_TTL (referencias) segundos; 0 quita el vencimiento de
+    # las versiones y solo es seguro con un único host.
+    REFERENCE_CACHE_TTL = int(os.getenv("REFERENCE_CACHE_TTL", "300"))
+    CACHE_VERSION_DIR = os.getenv("CACHE_VERSION_DIR", os.path.join(tempfile.gettempdir(), "veris-cache-versions"))
+    CACHE_VERSION_TTL = int(os.getenv("CACHE_VERSION_TTL", "60"))
+
+    # Fotos subidas: lado mayor máximo del original y miniaturas generadas (px)
+    FOTO_MAX_PX = int(os.getenv("FOTO_MAX_PX", "1024"))
+    FOTO_THUMB_SIZES = (64, 256)
+    # Segundos que un worker recuerda que una miniatura no existe (evita los
+    # stat por foto en cada listado hasta que corra fotos-backfill)
+    FOTO_SIN_MINIATURA_TTL = int(os.getenv("FOTO_SIN_MINIATURA_TTL", "30"))
+
+    # Procesamiento de fotos en segundo plano: hilos, tope de la cola (si se
+    # llena se procesa en la petición) y carpeta donde esperan las subidas
+    FOTO_WORKERS = int(os.getenv("FOTO_WORKERS", "2"))
+    FOTO_QUEUE_MAX = int(os.getenv("FOTO_QUEUE_MAX", "32"))
+    # Intentos por foto; si todos fallan el registro vuelve a su foto anterior
+    FOTO_REINTENTOS = int(os.getenv("FOTO_REINTENTOS", "3"))
+    FOTO_STAGING_DIR = os.getenv("FOTO_STAGING_DIR", os.path.join(tempfile.gettempdir(), "veris-fotos-staging"))
+
+    # Subidas en staging que no se promovieron (registro rechazado) se borran
+    # pasado este tiempo en segundos
+    FOTO_STAGING_MAX_AGE = int(os.getenv("FOTO_STAGING_MAX_AGE", "3600"))
+
+    # Tamaño máximo de una petición (fotos y CSV de importación); Flask responde 413
+    MAX_CONTENT_LENGTH = int(os.getenv("MAX_CONTENT_LENGTH", str(8 * 1024 * 1024)))
+
+    # Token para leer /metrics (cabecera "Authorization: Bearer <token>"); sin
+    # token solo un administrador con sesión iniciada puede verlas
+    METRICS_TOKEN = os.getenv("METRICS_TOKEN", "")
+
+    # Perfilado bajo demanda (?_perfil=1 de un administrador): carpeta y
+    # cantidad de perfiles que se conservan (los más antiguos se borran)
+    PERFIL_DIR = os.getenv("PERFIL_DIR", os.path.join(tempfile.gettempdir(), "veris-perfiles"))
+    PERFIL_MAX = int(os.getenv("PERFIL_MAX", "50"))
+
+    # Fracción de peticiones medidas con tracemalloc (0 = desactivado; 0.01 =
+    # una de cada cien). Resultados por ruta en /admin/memoria. tracemalloc es
+    # global al proceso: solo se mide una petición que empieza sin otra en
+    # curso en el worker y se descarta si llega otra mientras tanto; con
+    # workers de muchos hilos y tráfico alto casi no habrá muestras (los hilos
+    # de fondo, como el pool de fotos, también quedan en la medición)
+    MEMORIA_MUESTREO = float(os.getenv("MEMORIA_MUESTREO", "0"))
+
+    # Sentencias SQL más lentas que esto (ms) se registran con su EXPLAIN y se
+    # resumen por huella en /admin/sql-lentas (0 = desactivado)
+    SQL_LENTA_MS = float(os.getenv("SQL_LENTA_MS", "0"))
+
+    # Vigía de peticiones: las que pasan de VIGIA_SEGUNDOS se capturan (pila del
+    # hilo y SQL en curso) en el log y en /admin/vigia, que guarda las últimas
+    # VIGIA_MAX (0 = desactivado)
+    VIGIA_SEGUNDOS = float(os.getenv("VIGIA_SEGUNDOS", "0"))
+    VIGIA_MAX = int(os.getenv("VIGIA_MAX", "50"))
+
+    # Presupuesto de sentencias SQL por ruta (models/presupuesto.py): "log"
+    # avisa en el log, "error" hace fallar la petición, vacío no cuenta (ver
+    # también `flask presupuesto-sql`)
+    PRESUPUESTO_SQL = os.getenv("PRESUPUESTO_SQL", "")
+
+    # Trazas por petición en OTLP/JSON, una línea por petición (vacío =
+    # desactivado) y fracción de peticiones trazadas; un traceparent entrante
+    # con la marca de muestreo siempre se traza
+    TRAZAS_ARCHIVO = os.getenv("TRAZAS_ARCHIVO", "")
+    TRAZAS_MUESTREO = float(os.getenv("TRAZAS_MUESTREO", "1"))
+
+    # Usar los assets con huella de static/dist (generados con `flask assets-build`)
+    ASSETS_FINGERPRINT = os.getenv("ASSETS_FINGERPRINT", "1") != "0"
+
 
 def load_config(app):
     app.config.from_object(Config)
@@ -1,8 +1,127 @@
 from __future__ import annotations
 
+import threading
+import time
 from contextlib import contextmanager
 
 import mysql.connector
+from flask import g, has_app_context
+
+
+# Conexiones de este proceso (se exportan en /metrics, ver models/metricas.py)
+_stats_lock = threading.Lock()
+_stats = {"abiertas": 0, "total": 0, "errores": 0, "segundos_conexion": 0.0}
+
+# Observadores de SQL: fn(evento, sql, params, segundos, filas) con evento
+# "execute", "executemany" o "fetch". Los globales se instalan con
+# `observar_sql`; los de una sola petición se agregan a `g.sql_observadores`.
+# Sin observadores la conexión se entrega sin envolver.
+_observadores: list = []
+
+# Sentencia que ejecuta cada hilo ahora mismo (thread id -> (sql, inicio)); solo
+# se lleva tras `seguir_sql_en_curso()`, que además hace envolver las conexiones
+_en_curso: dict[int, tuple[str, float]] = {}
+_seguir_en_curso = False
+
+
+def observar_sql(fn) -> None:
+    _observadores.append(fn)
+
+
+def seguir_sql_en_curso() -> None:
+    global _seguir_en_curso
+    _seguir_en_curso = True
+
+
+def sql_en_curso(thread_id: int) -> tuple[str, float] | None:
+    """(sql, segundos corriendo) de la sentencia que ejecuta ese hilo, si hay una."""
+
+    actual = _en_curso.get(thread_id)
+    if actual is None:
+        return None
+    return actual[0], time.perf_counter() - actual[1]
+
+
+def _observadores_activos() -> list:
+    if has_app_context() and "sql_observadores" in g:
+        return _observadores + g.sql_observadores
+    return _observadores
+
+
+class _CursorObservado:
+    """Cursor que mide cada execute/fetch y avisa a los observadores."""
+
+    def __init__(self, cursor, observadores: list):
+        self._cursor = cursor
+        self._observadores = observadores
+        self._sql = ""
+
+    def _avisar(self, evento: str, sql: str, params, t0: float, filas: int | None) -> None:
+        if _seguir_en_curso:
+            _en_curso.pop(threading.get_ident(), None)
+        segundos = time.perf_counter() - t0
+        for fn in self._observadores:
+            fn(evento, sql, params, segundos, filas)
+
+    def _empezar(self, sql: str) -> float:
+        t0 = time.perf_counter()
+        if _seguir_en_curso:
+            _en_curso[threading.get_ident()] = (sql, t0)
+        return t0
+
+    def execute(self, sql, params=None, *args, **kwargs):
+        self._sql = sql
+        t0 = self._empezar(sql)
+        try:
+            return self._cursor.execute(sql, params, *args, **kwargs)
+        finally:
+            self._avisar("execute", sql, params, t0, None)
+
+    def executemany(self, sql, seq_params, *args, **kwargs):
+        self._sql = sql
+        t0 = self._empezar(sql)
+        try:
+            return self._cursor.executemany(sql, seq_params, *args, **kwargs)
+        finally:
+            self._avisar("executemany", sql, None, t0, len(seq_params))
+
+    def _fetch(self, method: str, *args):
+        t0 = self._empezar(self._sql)
+        try:
+            rows = getattr(self._cursor, method)(*args)
+        except BaseException:
+            _en_curso.pop(threading.get_ident(), None)
+            raise
+        n = len(rows) if isinstance(rows, list) else int(rows is not None)
+        self._avisar("fetch", self._sql, None, t0, n)
+        return rows
+
+    def fetchone(self):
+        return self._fetch("fetchone")
+
+    def fetchall(self):
+        return self._fetch("fetchall")
+
+    def fetchmany(self, size: int = 1):
+        return self._fetch("fetchmany", size)
+
+    def __iter__(self):
+        return iter(self._cursor)
+
+    def __getattr__(self, name):
+        return getattr(self._cursor, name)
+
+
+class _ConexionObservada:
+    def __init__(self, conn, observadores: list):
+        self._conn = conn
+        self._observadores = observadores
+
+    def cursor(self, *args, **kwargs):
+        return _CursorObservado(self._conn.cursor(*args, **kwargs), self._observadores)
+
+    def __getattr__(self, name):
+        return getattr(self._conn, name)
 
 
 @contextmanager
@@ -11,15 +130,35 @@ def get_connection(app=None):
     if app is None:
         raise RuntimeError("Se requiere `app` para leer config de DB")
 
-    conn = mysql.connector.connect(
-        host=app.config["DB_HOST"],
-        user=app.config["DB_USER"],
-        password=app.config["DB_PASSWORD"],
-        database=app.config["DB_NAME"],
-        port=app.config.get("DB_PORT", 3306),
-    )
+    t0 = time.perf_counter()
+    try:
+        conn = mysql.connector.connect(
+            host=app.config["DB_HOST"],
+            user=app.config["DB_USER"],
+            password=app.config["DB_PASSWORD"],
+            database=app.config["DB_NAME"],
+            port=app.config.get("DB_PORT", 3306),
+        )
+    except Exception:
+        with _stats_lock:
+            _stats["errores"] += 1
+        raise
+    with _stats_lock:
+        _stats["abiertas"] += 1
+        _stats["total"] += 1
+        _stats["segundos_conexion"] += time.perf_counter() - t0
 
+    observadores = _observadores_activos()
     try:
-        yield conn
+        yield _ConexionObservada(conn, observadores) if observadores or _seguir_en_curso else conn
     finally:
         conn.close()
+        with _stats_lock:
+            _stats["abiertas"] -= 1
+
+
+def conexion_stats() -> dict:
+    """Conexiones abiertas ahora, abiertas en total, errores y tiempo total de conexión."""
+
+    with _stats_lock:
+        return dict(_stats)
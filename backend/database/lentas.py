@@ -0,0 +1,213 @@
+from __future__ import annotations
+
+import hashlib
+import json
+import re
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+
+from flask import Response, current_app, flash, has_app_context, has_request_context, redirect, request, session, url_for
+
+from database.connection import get_connection, observar_sql
+
+
+# Se vuelve a pedir el EXPLAIN de una huella pasado este tiempo
+_PLAN_TTL = 600
+# EXPLAIN pendientes como máximo; con más, se registra la sentencia sin plan
+_MAX_PENDIENTES = 20
+# Huellas distintas que se conservan (se descarta la de menor tiempo total)
+_MAX_HUELLAS = 500
+_EXPLICABLES = ("SELECT", "UPDATE", "DELETE", "INSERT", "REPLACE")
+
+_lock = threading.Lock()
+_resumen: dict[str, dict] = {}
+_pendientes = 0
+_executor: ThreadPoolExecutor | None = None
+_umbral = 0.0  # segundos; 0 = sin observador
+# Último execute de cada hilo, para sumarle el tiempo de sus fetch
+_local = threading.local()
+
+_RE_CADENA = re.compile(r"'(?:[^'\\]|\\.|'')*'|\"(?:[^\"\\]|\\.)*\"")
+_RE_NUMERO = re.compile(r"\b\d+(?:\.\d+)?\b")
+_RE_PARAM = re.compile(r"%\(\w+\)s|%s")
+_RE_LISTA = re.compile(r"\(\s*\?(?:\s*,\s*\?)+\s*\)")
+_RE_FILAS = re.compile(r"(\(\?\.\.\.\))(?:\s*,\s*\(\?\.\.\.\))+")
+
+
+def normalizar(sql: str) -> str:
+    """SQL sin literales ni parámetros (`?`), listas colapsadas y espacios simples."""
+
+    sql = " ".join(sql.split())
+    sql = _RE_CADENA.sub("?", sql)
+    sql = _RE_PARAM.sub("?", sql)
+    sql = _RE_NUMERO.sub("?", sql)
+    sql = _RE_LISTA.sub("(?...)", sql)
+    return _RE_FILAS.sub(r"\1...", sql)
+
+
+def huella(normalizada: str) -> str:
+    return hashlib.sha1(normalizada.encode()).hexdigest()[:12]
+
+
+def forma_params(params) -> str:
+    """Tipos de los parámetros sin sus valores, p. ej. `(int, str, date)`."""
+
+    if params is None:
+        return "-"
+    if isinstance(params, dict):
+        return "{" + ", ".join(f"{k}: {type(v).__name__}" for k, v in params.items()) + "}"
+    if isinstance(params, (list, tuple)):
+        return "(" + ", ".join(type(v).__name__ for v in params) + ")"
+    return type(params).__name__
+
+
+def _plan_texto(plan: list[dict] | None) -> str:
+    if not plan:
+        return "  (sin plan)"
+    return "\n".join(
+        f"  {p.get('table')} type={p.get('type')} key={p.get('key')} rows={p.get('rows')} {p.get('Extra') or ''}".rstrip()
+        for p in plan
+    )
+
+
+def _registrar_log(app, h: str, normalizada: str, forma: str, ms: float, ruta: str, plan) -> None:
+    app.logger.warning(
+        "SQL lenta %.0f ms [%s] huella=%s params=%s\n  %s\n%s", ms, ruta, h, forma, normalizada, _plan_texto(plan)
+    )
+
+
+def _explicar(app, h: str, sql: str, params, normalizada: str, forma: str, ms: float, ruta: str) -> None:
+    global _pendientes
+    plan = None
+    try:
+        # Conexión propia: la de la petición puede seguir con resultados pendientes
+        with get_connection(app) as cn:
+            cur = cn.cursor(dictionary=True)
+            cur.execute("EXPLAIN " + sql, params)
+            plan = [{k: v if isinstance(v, (int, float)) or v is None else str(v) for k, v in r.items()} for r in cur.fetchall()]
+            cur.close()
+    except Exception as ex:
+        plan = [{"error": str(ex)}]
+    finally:
+        with _lock:
+            _pendientes -= 1
+            if h in _resumen:
+                _resumen[h]["plan"] = plan
+                _resumen[h]["plan_epoch"] = time.time()
+    _registrar_log(app, h, normalizada, forma, ms, ruta, plan)
+
+
+def _registrar(sql: str, params, segundos: float) -> None:
+    global _pendientes
+    normalizada = normalizar(sql)
+    h = huella(normalizada)
+    forma = forma_params(params)
+    ms = segundos * 1000
+    ruta = (request.endpoint or "-") if has_request_context() else "-"
+    app = current_app._get_current_object() if has_app_context() else None  # type: ignore[attr-defined]
+
+    with _lock:
+        r = _resumen.get(h)
+        if r is None:
+            if len(_resumen) >= _MAX_HUELLAS:
+                del _resumen[min(_resumen, key=lambda k: _resumen[k]["total_ms"])]
+            r = _resumen[h] = {
+                "huella": h, "sql": normalizada, "n": 0, "total_ms": 0.0, "max_ms": 0.0,
+                "rutas": {}, "formas": {}, "ultima": None, "plan": None, "plan_epoch": 0.0,
+            }
+        r["n"] += 1
+        r["total_ms"] += ms
+        r["max_ms"] = max(r["max_ms"], ms)
+        r["rutas"][ruta] = r["rutas"].get(ruta, 0) + 1
+        r["formas"][forma] = r["formas"].get(forma, 0) + 1
+        r["ultima"] = datetime.now().isoformat(timespec="seconds")
+
+        explicar = (
+            app is not None
+            and _executor is not None
+            and (params is not None or not _RE_PARAM.search(sql))  # executemany: sin valores
+            and sql.lstrip().split(None, 1)[0].upper() in _EXPLICABLES
+            and time.time() - r["plan_epoch"] > _PLAN_TTL
+            and _pendientes < _MAX_PENDIENTES
+        )
+        if explicar:
+            _pendientes += 1
+            r["plan_epoch"] = time.time()  # evita pedir el mismo plan dos veces seguidas
+        plan = r["plan"]
+
+    if explicar:
+        _executor.submit(_explicar, app, h, sql, params, normalizada, forma, ms, ruta)  # type: ignore[union-attr]
+    elif app is not None:
+        _registrar_log(app, h, normalizada, forma, ms, ruta, plan)
+
+
+def _observar(evento: str, sql: str, params, segundos: float, filas: int | None) -> None:
+    if sql.lstrip()[:8].upper() == "EXPLAIN ":
+        return
+    if evento == "fetch":
+        # Con cursores sin buffer el tiempo de la consulta se reparte entre execute y fetch
+        pend = getattr(_local, "pendiente", None)
+        if pend is None or pend[0] != sql:
+            return
+        pend[2] += segundos
+        if not pend[3] and pend[2] >= _umbral:
+            pend[3] = True
+            _registrar(sql, pend[1], pend[2])
+        return
+    lenta = segundos >= _umbral
+    _local.pendiente = [sql, params, segundos, lenta]
+    if lenta:
+        _registrar(sql, params, segundos)
+
+
+def resumen(q: str = "", orden: str = "total_ms", top: int = 50) -> list[dict]:
+    """Huellas lentas filtradas por texto (SQL o ruta) y ordenadas de mayor a menor."""
+
+    q = q.lower()
+    with _lock:
+        filas = [
+            dict(r, rutas=dict(r["rutas"]), formas=dict(r["formas"]))
+            for r in _resumen.values()
+            if not q or q in r["sql"].lower() or any(q in ruta.lower() for ruta in r["rutas"]) or q == r["huella"]
+        ]
+    if orden not in ("total_ms", "max_ms", "n"):
+        orden = "total_ms"
+    filas.sort(key=lambda r: -r[orden])
+    for r in filas:
+        r["medio_ms"] = r["total_ms"] / r["n"]
+        r.pop("plan_epoch")
+    return filas[:top]
+
+
+def admin_sql_lentas():
+    """JSON con las sentencias lentas de este worker (`?q=texto&orden=total_ms|max_ms|n&top=N`)."""
+
+    if "user_id" not in session:
+        return redirect(url_for("crud.login", next=request.path))
+
+    if session.get("user_role") != 1:
+        flash("No tiene permiso para acceder al módulo Administrador", "danger")
+        return redirect(url_for("crud.index"))
+
+    data = {
+        "umbral_ms": current_app.config["SQL_LENTA_MS"],
+        "huellas": resumen(request.args.get("q", ""), request.args.get("orden", "total_ms"), request.args.get("top", 50, type=int)),
+    }
+    resp = Response(json.dumps(data), mimetype="application/json")
+    resp.headers["Cache-Control"] = "no-store"
+    return resp
+
+
+def init_app(app) -> None:
+    """Con SQL_LENTA_MS > 0 registra las sentencias más lentas; resumen en `/admin/sql-lentas`."""
+
+    global _executor, _umbral
+    app.add_url_rule("/admin/sql-lentas", "admin_sql_lentas", admin_sql_lentas)
+    umbral = app.config.get("SQL_LENTA_MS", 0)
+    if umbral > 0:
+        if _executor is None:
+            _executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="sql-lentas")
+            observar_sql(_observar)
+        _umbral = umbral / 1000
@@ -0,0 +1,281 @@
+from __future__ import annotations
+
+import click
+import mysql.connector
+from flask import current_app
+from flask.cli import with_appcontext
+
+from database.connection import get_connection
+from models.usuario import LOGIN_KEY_MAX, login_key
+
+
+def _columna_existe(cn, tabla: str, columna: str) -> bool:
+    cur = cn.cursor()
+    cur.execute(
+        "SELECT 1 FROM information_schema.COLUMNS WHERE TABLE_SCHEMA=DATABASE() AND TABLE_NAME=%s AND COLUMN_NAME=%s",
+        (tabla, columna),
+    )
+    found = cur.fetchone() is not None
+    cur.close()
+    return found
+
+
+def _indice_existe(cn, tabla: str, indice: str) -> bool:
+    cur = cn.cursor()
+    cur.execute(
+        "SELECT 1 FROM information_schema.STATISTICS WHERE TABLE_SCHEMA=DATABASE() AND TABLE_NAME=%s AND INDEX_NAME=%s",
+        (tabla, indice),
+    )
+    found = cur.fetchone() is not None
+    cur.close()
+    return found
+
+
+# NFKC y casefold pueden alargar el nombre (ver LOGIN_KEY_MAX)
+_NOMBRE_CLAVE = f"varchar({LOGIN_KEY_MAX}) CHARACTER SET utf8mb4 COLLATE utf8mb4_bin"
+
+
+def migrar_login_key(cn, chunk_size: int = 500) -> str:
+    """usuarios.NombreClave: nombre normalizado (ver `login_key`) con índice único.
+
+    Agrega la columna, la rellena desde Nombre por lotes y recién entonces la
+    hace NOT NULL con el índice. Es idempotente. Si dos usuarios existentes
+    normalizan al mismo valor, o a uno más largo que LOGIN_KEY_MAX, no se
+    crea el índice y se informa cuáles son.
+
+    La columna usa collation binaria: la de la tabla no distingue mayúsculas
+    ni tildes y haría chocar en el índice claves que `login_key` distingue
+    ("jose" y "josé"); las claves ya están normalizadas.
+    """
+
+    if not _columna_existe(cn, "usuarios", "NombreClave"):
+        cur = cn.cursor()
+        cur.execute(f"ALTER TABLE usuarios ADD COLUMN NombreClave {_NOMBRE_CLAVE} NULL AFTER Nombre")
+        cur.close()
+
+    cur = cn.cursor()
+    cur.execute("SELECT IdUsuario, Nombre, NombreClave FROM usuarios")
+    rows = cur.fetchall() or []
+    cur.close()
+
+    # Duplicados después de normalizar: el índice único no se podría crear
+    vistos: dict[str, int] = {}
+    choques: list[str] = []
+    largos: list[str] = []
+    for id_, nombre, _ in rows:
+        key = login_key(nombre)
+        if len(key) > LOGIN_KEY_MAX:
+            largos.append(str(id_))
+        if key in vistos:
+            choques.append(f"{vistos[key]} y {id_} ({key})")
+        vistos.setdefault(key, id_)
+    if choques:
+        raise RuntimeError("Usuarios duplicados tras normalizar el nombre: " + "; ".join(choques))
+    if largos:
+        raise RuntimeError(f"Usuarios con nombre normalizado de más de {LOGIN_KEY_MAX} caracteres: " + ", ".join(largos))
+
+    pendientes = [(login_key(nombre), id_) for id_, nombre, clave in rows if clave != login_key(nombre)]
+    cur = cn.cursor()
+    for i in range(0, len(pendientes), chunk_size):
+        cur.executemany("UPDATE usuarios SET NombreClave=%s WHERE IdUsuario=%s", pendientes[i : i + chunk_size])
+        cn.commit()
+    if not _indice_existe(cn, "usuarios", "uq_usuarios_nombreclave"):
+        cur.execute(
+            f"ALTER TABLE usuarios MODIFY NombreClave {_NOMBRE_CLAVE} NOT NULL, "
+            "ADD UNIQUE KEY uq_usuarios_nombreclave (NombreClave)"
+        )
+    cur.close()
+    return f"usuarios.NombreClave: {len(pendientes)} filas actualizadas"
+
+
+def _crear_indices(*indices: tuple[str, str, str]):
+    """Migración que crea índices (tabla, nombre, columnas) que aún no existan."""
+
+    def up(cn) -> str:
+        creados = []
+        cur = cn.cursor()
+        for tabla, nombre, columnas in indices:
+            if not _indice_existe(cn, tabla, nombre):
+                cur.execute(f"ALTER TABLE {tabla} ADD KEY {nombre} ({columnas})")
+                creados.append(nombre)
+        cur.close()
+        return "índices creados: " + (", ".join(creados) or "ninguno (ya existían)")
+
+    return up
+
+
+# (versión, nombre, función up(cn) -> mensaje). Nunca se edita una versión ya
+# publicada: los cambios van en una nueva. Las funciones son idempotentes
+# porque el DDL de MySQL no es transaccional.
+MIGRACIONES = [
+    (1, "usuarios_nombre_clave", migrar_login_key),
+    (
+        2,
+        "indices_consultas",
+        _crear_indices(
+            # Horarios libres y choques del médico; panel del médico (ORDER BY FechaConsulta)
+            ("consultas", "ix_consultas_medico_fecha_hi", "IdMedico, FechaConsulta, HI"),
+            # Choques del paciente y panel del paciente
+            ("consultas", "ix_consultas_paciente_fecha_hi", "IdPaciente, FechaConsulta, HI"),
+        ),
+    ),
+]
+
+# Consultas críticas y el índice que deben usar (se verifican con EXPLAIN)
+HOT_QUERIES = [
+    (
+        "login",
+        "SELECT IdUsuario, Nombre, Rol FROM usuarios WHERE NombreClave=%s AND Password=%s",
+        ("adm", "x"),
+        "uq_usuarios_nombreclave",
+    ),
+    (
+        "horarios libres del médico",
+        "SELECT HI, HF FROM consultas WHERE IdMedico=%s AND FechaConsulta=%s",
+        (1, "2030-01-02"),
+        "ix_consultas_medico_fecha_hi",
+    ),
+    (
+        "calendario del mes del médico",
+        "SELECT FechaConsulta, HI, HF FROM consultas WHERE IdMedico=%s AND FechaConsulta BETWEEN %s AND %s",
+        (1, "2030-01-01", "2030-01-31"),
+        "ix_consultas_medico_fecha_hi",
+    ),
+    (
+        "panel del médico",
+        "SELECT c.IdConsulta FROM consultas c WHERE c.IdMedico=%s ORDER BY c.FechaConsulta DESC",
+        (1,),
+        "ix_consultas_medico_fecha_hi",
+    ),
+    (
+        "panel del paciente",
+        "SELECT c.IdConsulta FROM consultas c WHERE c.IdPaciente=%s ORDER BY c.FechaConsulta DESC",
+        (1,),
+        "ix_consultas_paciente_fecha_hi",
+    ),
+    (
+        "choque del médico",
+        "SELECT 1 FROM consultas WHERE IdMedico=%s AND FechaConsulta=%s AND HI < %s AND HF > %s LIMIT 1",
+        (1, "2030-01-02", "10:00:00", "09:30:00"),
+        "ix_consultas_medico_fecha_hi",
+    ),
+    (
+        "choque del paciente",
+        "SELECT 1 FROM consultas WHERE IdPaciente=%s AND FechaConsulta=%s AND HI < %s AND HF > %s LIMIT 1",
+        (1, "2030-01-02", "10:00:00", "09:30:00"),
+        "ix_consultas_paciente_fecha_hi",
+    ),
+]
+
+_LOCK = "veris_migraciones"
+
+
+def aplicadas(cn) -> set[int]:
+    cur = cn.cursor()
+    cur.execute(
+        "CREATE TABLE IF NOT EXISTS schema_migrations ("
+        "version int NOT NULL PRIMARY KEY, nombre varchar(100) NOT NULL, "
+        "aplicada_en datetime NOT NULL DEFAULT CURRENT_TIMESTAMP)"
+    )
+    cur.execute("SELECT version FROM schema_migrations")
+    versiones = {int(r[0]) for r in cur.fetchall() or []}
+    cur.close()
+    return versiones
+
+
+def upgrade(cn, echo=print) -> int:
+    """Aplica en orden las migraciones pendientes y devuelve cuántas aplicó.
+
+    Un lock con nombre de MySQL evita que dos workers que arrancan a la vez
+    apliquen la misma versión.
+    """
+
+    cur = cn.cursor()
+    cur.execute("SELECT GET_LOCK(%s, 60)", (_LOCK,))
+    if not (cur.fetchone() or [0])[0]:
+        cur.close()
+        raise RuntimeError("No se pudo obtener el lock de migraciones")
+    try:
+        hechas = aplicadas(cn)
+        n = 0
+        for version, nombre, up in MIGRACIONES:
+            if version in hechas:
+                continue
+            echo(f"{version:04d} {nombre}: {up(cn)}")
+            cur.execute("INSERT INTO schema_migrations(version, nombre) VALUES(%s,%s)", (version, nombre))
+            cn.commit()
+            n += 1
+        return n
+    finally:
+        cur.execute("SELECT RELEASE_LOCK(%s)", (_LOCK,))
+        cur.fetchall()
+        cur.close()
+
+
+def explain(cn) -> list[tuple[str, str, str | None, int | None, bool]]:
+    """EXPLAIN de HOT_QUERIES: (nombre, índice esperado, índice usado, filas estimadas, ok)."""
+
+    result = []
+    cur = cn.cursor(dictionary=True)
+    for nombre, sql, params, indice in HOT_QUERIES:
+        cur.execute("EXPLAIN " + sql, params)
+        plan = cur.fetchall() or []
+        # La primera fila es la tabla principal de la consulta
+        key = plan[0].get("key") if plan else None
+        rows = plan[0].get("rows") if plan else None
+        result.append((nombre, indice, key, rows, key == indice))
+    cur.close()
+    return result
+
+
+@click.command("db-upgrade")
+@with_appcontext
+def db_upgrade() -> None:
+    """Aplica las migraciones pendientes del esquema sobre la base configurada."""
+
+    try:
+        with get_connection(current_app) as cn:
+            n = upgrade(cn, click.echo)
+    except (RuntimeError, mysql.connector.Error) as ex:
+        raise click.ClickException(str(ex)) from ex
+    click.echo(f"{n} migraciones aplicadas")
+
+
+@click.command("db-status")
+@with_appcontext
+def db_status() -> None:
+    """Lista las migraciones y si están aplicadas."""
+
+    with get_connection(current_app) as cn:
+        hechas = aplicadas(cn)
+    for version, nombre, _ in MIGRACIONES:
+        click.echo(f"{'[x]' if version in hechas else '[ ]'} {version:04d} {nombre}")
+
+
+@click.command("db-explain")
+@with_appcontext
+def db_explain() -> None:
+    """Verifica con EXPLAIN que cada consulta crítica usa su índice.
+
+    Con tablas casi vacías MySQL puede preferir recorrerlas completas: conviene
+    correrlo sobre datos de volumen realista.
+    """
+
+    with get_connection(current_app) as cn:
+        result = explain(cn)
+    for nombre, indice, key, rows, ok in result:
+        click.echo(f"{'OK   ' if ok else 'FALLA'} {nombre}: usa {key or 'ningún índice'} (esperado {indice}), ~{rows} filas")
+    if not all(r[4] for r in result):
+        raise click.ClickException("Hay consultas que no usan su índice")
+
+
+def init_app(app) -> None:
+    """Registra los comandos `flask db-*` y, con DB_MIGRATE_ON_START, migra al arrancar."""
+
+    app.cli.add_command(db_upgrade)
+    app.cli.add_command(db_status)
+    app.cli.add_command(db_explain)
+
+    if app.config.get("DB_MIGRATE_ON_START"):
+        with get_connection(app) as cn:
+            upgrade(cn, app.logger.info)
@@ -224,6 +224,7 @@ INSERT INTO `roles` (`IdRol`, `Nombre`, `Accion`) VALUES
 CREATE TABLE `usuarios` (
   `IdUsuario` int(11) NOT NULL,
   `Nombre` varchar(50) NOT NULL,
+  `NombreClave` varchar(150) CHARACTER SET utf8mb4 COLLATE utf8mb4_bin NOT NULL,
   `Password` varchar(64) NOT NULL,
   `Rol` int(11) NOT NULL
 ) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4;
@@ -232,18 +233,18 @@ CREATE TABLE `usuarios` (
 -- Volcado de datos para la tabla `usuarios`
 --
 
-INSERT INTO `usuarios` (`IdUsuario`, `Nombre`, `Password`, `Rol`) VALUES
-(1, 'ADM', '123', 1),
-(2, 'jgarcia', '123', 2),
-(3, 'ltorres', '123', 3),
-(4, 'amarquez', '123', 3),
-(5, 'aperez', '123', 2),
-(6, 'agomez', '123', 3),
-(7, 'ouribe', '123', 3),
-(8, 'olopez', '123', 2),
-(9, 'lquintana', '123', 2),
-(10, 'jarmijos', '123', 2),
-(11, 'xxx', '123', 2);
+INSERT INTO `usuarios` (`IdUsuario`, `Nombre`, `NombreClave`, `Password`, `Rol`) VALUES
+(1, 'ADM', 'adm', '123', 1),
+(2, 'jgarcia', 'jgarcia', '123', 2),
+(3, 'ltorres', 'ltorres', '123', 3),
+(4, 'amarquez', 'amarquez', '123', 3),
+(5, 'aperez', 'aperez', '123', 2),
+(6, 'agomez', 'agomez', '123', 3),
+(7, 'ouribe', 'ouribe', '123', 3),
+(8, 'olopez', 'olopez', '123', 2),
+(9, 'lquintana', 'lquintana', '123', 2),
+(10, 'jarmijos', 'jarmijos', '123', 2),
+(11, 'xxx', 'xxx', '123', 2);
 
 --
 -- Índices para tablas volcadas
@@ -255,7 +256,9 @@ INSERT INTO `usuarios` (`IdUsuario`, `Nombre`, `Password`, `Rol`) VALUES
 ALTER TABLE `consultas`
   ADD PRIMARY KEY (`IdConsulta`),
   ADD KEY `IdMedico_FK_idx` (`IdMedico`),
-  ADD KEY `IdPaciente_idx` (`IdPaciente`);
+  ADD KEY `IdPaciente_idx` (`IdPaciente`),
+  ADD KEY `ix_consultas_medico_fecha_hi` (`IdMedico`,`FechaConsulta`,`HI`),
+  ADD KEY `ix_consultas_paciente_fecha_hi` (`IdPaciente`,`FechaConsulta`,`HI`);
 
 --
 -- Indices de la tabla `especialidades`
@@ -303,6 +306,7 @@ ALTER TABLE `roles`
 --
 ALTER TABLE `usuarios`
   ADD PRIMARY KEY (`IdUsuario`),
+  ADD UNIQUE KEY `uq_usuarios_nombreclave` (`NombreClave`),
   ADD KEY `fk_rol_idx` (`Rol`);
 
 --
@@ -0,0 +1 @@
+# Paquete herramientas (comandos de desarrollo: benchmarks, pruebas de carga, datos sintéticos)
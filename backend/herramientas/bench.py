@@ -0,0 +1,241 @@
+from __future__ import annotations
+
+import json
+import platform
+import statistics
+import subprocess
+import time
+from datetime import date, datetime, timedelta
+from typing import Callable
+
+import click
+from flask import current_app
+from flask.cli import with_appcontext
+
+from models.consulta import Consulta
+from models.especialidad import Especialidad
+from models.medicamento import Medicamento
+from models.medico import Medico
+from models.paciente import Paciente
+from models.receta import Receta
+from models.rol import Rol
+from models.usuario import Usuario
+from routes.crud_routes import _build_calendar, _get_available_slots_30m, _rows_to_jsonable, _time_to_minutes
+
+
+class _MemoriaCursor:
+    def __init__(self, rows: list[dict]):
+        self.rows = rows
+
+    def execute(self, sql, params=None) -> None:
+        pass
+
+    def fetchall(self) -> list[dict]:
+        return self.rows
+
+    def close(self) -> None:
+        pass
+
+
+class _MemoriaCN:
+    """Conexión en memoria: toda consulta devuelve `rows` (mide solo el código Python)."""
+
+    def __init__(self, rows: list[dict]):
+        self.rows = rows
+
+    def cursor(self, dictionary: bool = False) -> _MemoriaCursor:
+        return _MemoriaCursor(self.rows)
+
+
+def _horas(n: int) -> list[timedelta]:
+    # MySQL devuelve las columnas TIME como timedelta
+    return [timedelta(minutes=(8 * 60 + (i % 20) * 30)) for i in range(n)]
+
+
+def _filas_listado(model, n: int) -> list[dict]:
+    """Filas sintéticas con las columnas del listado del modelo."""
+
+    rows = []
+    for i in range(1, n + 1):
+        row = {model.pk: i}
+        for _, key, kind in model.list_columns:
+            if kind == "foto":
+                row[key] = f"{i % 100:02d}/abcdefghijklm.jpg"
+            elif kind == "trunc":
+                row[key] = f"Texto largo {i} " * 10
+            elif kind == "num":
+                row[key] = i
+            else:
+                row[key] = f"{key} {i}"
+        rows.append(row)
+    return rows
+
+
+def _bench_slots(n: int) -> Callable[[], object]:
+    cn = _MemoriaCN([{"HI": hi, "HF": hi + timedelta(minutes=30)} for hi in _horas(n)])
+    return lambda: _get_available_slots_30m(cn, 1, "2030-01-02", timedelta(hours=7), timedelta(hours=19))
+
+
+def _bench_calendar(n: int) -> Callable[[], object]:
+    hoy = date(2030, 3, 10)
+    dias = {date(2030, 3, 1 + i % 31).isoformat(): i for i in range(min(n, 31))}
+    return lambda: _build_calendar(2030, 3, hoy, "2030-03-15", dias)
+
+
+def _bench_jsonable(n: int) -> Callable[[], object]:
+    rows = [
+        {"IdConsulta": i, "FechaConsulta": date(2030, 1, 1), "HI": hi, "HF": hi, "Creado": datetime(2030, 1, 1), "Diagnostico": "x"}
+        for i, hi in enumerate(_horas(n))
+    ]
+    return lambda: _rows_to_jsonable(rows)
+
+
+def _bench_time_to_minutes(n: int) -> Callable[[], object]:
+    values = _horas(n)
+    return lambda: [_time_to_minutes(v) for v in values]
+
+
+def _bench_fmt_time(n: int) -> Callable[[], object]:
+    values = _horas(n)
+    fmt = Especialidad(None)._fmt_time_value
+    return lambda: [fmt(v) for v in values]
+
+
+def _bench_get_list(model_cls) -> Callable[[int], Callable[[], object]]:
+    def setup(n: int) -> Callable[[], object]:
+        model = model_cls(_MemoriaCN(_filas_listado(model_cls, n)))
+        return model.get_list
+
+    return setup
+
+
+# nombre -> setup(n) que arma los datos sintéticos y devuelve la función a medir
+BENCHMARKS: dict[str, Callable[[int], Callable[[], object]]] = {
+    "slots_30m": _bench_slots,
+    "build_calendar": _bench_calendar,
+    "rows_to_jsonable": _bench_jsonable,
+    "time_to_minutes": _bench_time_to_minutes,
+    "especialidad_fmt_time_value": _bench_fmt_time,
+}
+for _cls in (Consulta, Especialidad, Medicamento, Medico, Paciente, Receta, Rol, Usuario):
+    BENCHMARKS[f"get_list_{_cls.__name__.lower()}"] = _bench_get_list(_cls)
+
+
+def medir(fn: Callable[[], object], rondas: int, min_ronda: float = 0.05) -> dict:
+    """Tiempos por llamada (s) de `fn` en `rondas` rondas de al menos `min_ronda` segundos.
+
+    Como pytest-benchmark: calibra las iteraciones por ronda y reporta mínimo,
+    mediana, media y desviación.
+    """
+
+    fn()  # calentamiento (compila macros, llena cachés de Jinja)
+    iteraciones = 1
+    while True:
+        t0 = time.perf_counter()
+        for _ in range(iteraciones):
+            fn()
+        if time.perf_counter() - t0 >= min_ronda:
+            break
+        iteraciones *= 2
+
+    tiempos = []
+    for _ in range(rondas):
+        t0 = time.perf_counter()
+        for _ in range(iteraciones):
+            fn()
+        tiempos.append((time.perf_counter() - t0) / iteraciones)
+    return {
+        "min": min(tiempos),
+        "median": statistics.median(tiempos),
+        "mean": statistics.fmean(tiempos),
+        "stddev": statistics.stdev(tiempos) if len(tiempos) > 1 else 0.0,
+        "rounds": rondas,
+        "iterations": iteraciones,
+    }
+
+
+def _commit() -> str | None:
+    try:
+        out = subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True, check=True)
+    except (OSError, subprocess.CalledProcessError):
+        return None
+    return out.stdout.strip()
+
+
+def comparar(base: dict, nuevo: dict, umbral: float) -> list[tuple[str, float, float, float, bool]]:
+    """(nombre, mediana base, mediana nueva, cambio relativo, regresión) por benchmark común."""
+
+    result = []
+    for nombre, b in base["benchmarks"].items():
+        n = nuevo["benchmarks"].get(nombre)
+        if not n:
+            continue
+        cambio = n["median"] / b["median"] - 1 if b["median"] else 0.0
+        result.append((nombre, b["median"], n["median"], cambio, cambio > umbral))
+    return result
+
+
+def _imprimir_comparacion(result, umbral: float) -> None:
+    for nombre, b, n, cambio, regresion in result:
+        click.echo(f"{'REGRESIÓN' if regresion else 'ok       '} {nombre:32s} {b * 1e6:10.1f} -> {n * 1e6:10.1f} µs ({cambio:+.1%})")
+    if any(r[4] for r in result):
+        raise click.ClickException(f"Benchmarks más lentos que la base en más de {umbral:.0%}")
+
+
+@click.command("bench-run")
+@click.option("--n", "n", default=1000, show_default=True, help="Tamaño de los datos sintéticos (filas, horarios).")
+@click.option("--rondas", default=10, show_default=True)
+@click.option("-k", "filtro", default="", help="Solo benchmarks cuyo nombre contenga este texto.")
+@click.option("--salida", type=click.Path(dir_okay=False), default="bench.json", show_default=True)
+@click.option("--base", type=click.Path(exists=True, dir_okay=False), help="Resultado guardado contra el que comparar.")
+@click.option("--umbral", default=0.10, show_default=True, help="Regresión tolerada (0.10 = 10% más lento).")
+@with_appcontext
+def bench_run(n: int, rondas: int, filtro: str, salida: str, base: str | None, umbral: float) -> None:
+    """Micro-benchmarks de agenda y render sobre datos sintéticos (no usa la BD)."""
+
+    resultados = {}
+    with current_app.test_request_context("/"):
+        for nombre, setup in BENCHMARKS.items():
+            if filtro not in nombre:
+                continue
+            r = medir(setup(n), rondas)
+            resultados[nombre] = r
+            click.echo(f"{nombre:32s} mediana {r['median'] * 1e6:10.1f} µs  (±{r['stddev'] * 1e6:.1f}, {r['iterations']} it x {rondas})")
+
+    data = {
+        "meta": {
+            "fecha": datetime.now().isoformat(timespec="seconds"),
+            "commit": _commit(),
+            "python": platform.python_version(),
+            "n": n,
+        },
+        "benchmarks": resultados,
+    }
+    with open(salida, "w", encoding="utf-8") as f:
+        json.dump(data, f, indent=2)
+    click.echo(f"Resultados en {salida}")
+
+    if base:
+        with open(base, encoding="utf-8") as f:
+            _imprimir_comparacion(comparar(json.load(f), data, umbral), umbral)
+
+
+@click.command("bench-compare")
+@click.argument("base", type=click.Path(exists=True, dir_okay=False))
+@click.argument("nuevo", type=click.Path(exists=True, dir_okay=False))
+@click.option("--umbral", default=0.10, show_default=True, help="Regresión tolerada (0.10 = 10% más lento).")
+def bench_compare(base: str, nuevo: str, umbral: float) -> None:
+    """Compara dos resultados de `bench-run` (medianas) y falla si hay regresiones."""
+
+    with open(base, encoding="utf-8") as f, open(nuevo, encoding="utf-8") as g:
+        b, n = json.load(f), json.load(g)
+    if b["meta"].get("n") != n["meta"].get("n"):
+        click.echo(f"Aviso: tamaños distintos (n={b['meta'].get('n')} vs n={n['meta'].get('n')})")
+    _imprimir_comparacion(comparar(b, n, umbral), umbral)
+
+
+def init_app(app) -> None:
+    """Registra `flask bench-run` y `flask bench-compare`."""
+
+    app.cli.add_command(bench_run)
+    app.cli.add_command(bench_compare)
@@ -0,0 +1,287 @@
+from __future__ import annotations
+
+import http.cookiejar
+import json
+import random
+import re
+import threading
+import time
+import urllib.error
+import urllib.parse
+import urllib.request
+from datetime import date
+
+import click
+
+
+# Hosts permitidos: la prueba se corre contra una instancia local, nunca producción
+_LOCALES = {"localhost", "127.0.0.1", "::1"}
+
+_OPCION_RE = r'<option value="(\d+)"'
+_FECHA_RE = re.compile(r"seleccionarFecha\('(\d{4}-\d{2}-\d{2})'\)")
+_HORARIO_RE = re.compile(r"seleccionarHorario\(this, '(\d{2}:\d{2})'\)")
+_CONFIRMAR_RE = re.compile(r'<form method="post" action="([^"]+)" id="formConfirmar">(.*?)</form>', re.S)
+_HIDDEN_RE = re.compile(r'<input type="hidden" name="(\w+)" value="([^"]*)">')
+_ATENDER_RE = re.compile(r"/medicos/consultas/(\d+)/atender")
+_ALERTA_RE = re.compile(r'class="alert alert-(\w+) mb-2"')
+
+
+def _opciones(html: str, select: str) -> list[str]:
+    m = re.search(rf'name="{select}".*?</select>', html, re.S)
+    return re.findall(_OPCION_RE, m.group(0)) if m else []
+
+
+def _alertas(html: str) -> set[str]:
+    return set(_ALERTA_RE.findall(html))
+
+
+class Resultados:
+    """Latencias y resultados por paso, compartidos por todos los usuarios virtuales."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.pasos: dict[str, dict] = {}
+
+    def registrar(self, paso: str, segundos: float, resultado: str) -> None:
+        with self._lock:
+            p = self.pasos.setdefault(paso, {"latencias": [], "ok": 0, "error": 0, "conflicto": 0})
+            p["latencias"].append(segundos)
+            p[resultado] += 1
+
+    def resumen(self, duracion: float) -> list[dict]:
+        filas = []
+        with self._lock:
+            for paso, p in self.pasos.items():
+                lat = sorted(p["latencias"])
+                n = len(lat)
+
+                def pct(q: float) -> float:
+                    return lat[min(n - 1, int(q * n))] * 1000 if n else 0.0
+
+                filas.append(
+                    {
+                        "paso": paso,
+                        "n": n,
+                        "rps": n / duracion if duracion else 0.0,
+                        "p50_ms": pct(0.50),
+                        "p90_ms": pct(0.90),
+                        "p95_ms": pct(0.95),
+                        "p99_ms": pct(0.99),
+                        "max_ms": lat[-1] * 1000 if n else 0.0,
+                        "errores": p["error"],
+                        "conflictos": p["conflicto"],
+                        "error_pct": 100.0 * p["error"] / n if n else 0.0,
+                    }
+                )
+        return filas
+
+
+class _Fallo(Exception):
+    """El paso no devolvió lo esperado; el flujo del usuario virtual vuelve a empezar."""
+
+
+class Cliente:
+    """Usuario virtual: sesión con cookies propia contra la app."""
+
+    def __init__(self, base: str, resultados: Resultados, timeout: float):
+        self.base = base.rstrip("/")
+        self.resultados = resultados
+        self.timeout = timeout
+        self.opener = urllib.request.build_opener(urllib.request.HTTPCookieProcessor(http.cookiejar.CookieJar()))
+
+    def pedir(self, paso: str, path: str, data: dict | None = None, conflicto: str | None = None) -> tuple[str, str]:
+        """GET (o POST con `data`) siguiendo redirecciones; devuelve (url final, html).
+
+        Una alerta flash "danger" cuenta como error; una de categoría `conflicto`
+        (por ejemplo "warning" al agendar un horario recién ocupado) como conflicto.
+        """
+
+        body = urllib.parse.urlencode(data).encode("utf-8") if data is not None else None
+        t0 = time.perf_counter()
+        try:
+            with self.opener.open(self.base + path, data=body, timeout=self.timeout) as resp:
+                html = resp.read().decode("utf-8", "replace")
+                url = resp.geturl()
+        except (urllib.error.URLError, OSError) as ex:
+            self.resultados.registrar(paso, time.perf_counter() - t0, "error")
+            raise _Fallo(f"{paso}: {ex}") from ex
+        segundos = time.perf_counter() - t0
+
+        alertas = _alertas(html)
+        if "danger" in alertas:
+            self.resultados.registrar(paso, segundos, "error")
+            raise _Fallo(f"{paso}: alerta de error en {url}")
+        if (conflicto and conflicto in alertas) or "conflict=1" in url:
+            self.resultados.registrar(paso, segundos, "conflicto")
+            raise _Fallo(f"{paso}: conflicto")
+        self.resultados.registrar(paso, segundos, "ok")
+        return url, html
+
+    def login(self, usuario: str, password: str, destino: str) -> None:
+        url, _ = self.pedir("login", "/login", {"UserName": usuario, "Password": password, "next": destino})
+        if urllib.parse.urlsplit(url).path != destino:
+            raise _Fallo(f"login: {usuario} no llegó a {destino}")
+
+
+def _elegir_horario(cli: Cliente, paso: str, path: str, params: dict, meses: int) -> tuple[str, dict] | None:
+    """Recorre `meses` meses del calendario hasta un día con horarios y abre ese día.
+
+    Devuelve (action, campos) del formulario de confirmación con un HI libre.
+    """
+
+    hoy = date.today()
+    for i in range(meses):
+        mes0 = hoy.month - 1 + i
+        anio, mes = hoy.year + mes0 // 12, mes0 % 12 + 1
+        _, html = cli.pedir(f"{paso}_mes", path + "?" + urllib.parse.urlencode({**params, "mes": mes, "anio": anio}))
+        fechas = _FECHA_RE.findall(html)
+        if not fechas:
+            continue
+        query = {**params, "mes": mes, "anio": anio, "fecha": random.choice(fechas)}
+        _, html = cli.pedir(f"{paso}_dia", path + "?" + urllib.parse.urlencode(query))
+        horarios = _HORARIO_RE.findall(html)
+        form = _CONFIRMAR_RE.search(html)
+        if horarios and form:
+            campos = dict(_HIDDEN_RE.findall(form.group(2)))
+            campos["HI"] = random.choice(horarios)
+            return form.group(1).replace("&amp;", "&"), campos
+    return None
+
+
+def flujo_paciente(cli: Cliente, meses: int) -> None:
+    """Panel del paciente, calendario de un médico al azar y reserva de un horario libre."""
+
+    cli.pedir("pacientes", "/pacientes")
+    _, html = cli.pedir("agendar_cita", "/pacientes/agendar-cita")
+    especialidades = _opciones(html, "idEspecialidad")
+    if not especialidades:
+        raise _Fallo("agendar_cita: no hay especialidades")
+    id_esp = random.choice(especialidades)
+    _, html = cli.pedir("agendar_especialidad", "/pacientes/agendar-cita?idEspecialidad=" + id_esp)
+    medicos = _opciones(html, "idMedico")
+    if not medicos:
+        return
+    params = {"idEspecialidad": id_esp, "idMedico": random.choice(medicos)}
+    elegido = _elegir_horario(cli, "agendar", "/pacientes/agendar-cita", params, meses)
+    if elegido:
+        action, campos = elegido
+        cli.pedir("agendar_confirmar", urllib.parse.urlsplit(action).path, campos, conflicto="warning")
+
+
+def flujo_medico(cli: Cliente, meses: int) -> None:
+    """Panel del médico, atención de una consulta pendiente y agenda de la siguiente cita."""
+
+    _, html = cli.pedir("medicos", "/medicos")
+    pendientes = _ATENDER_RE.findall(html)
+    if not pendientes:
+        return
+    id_consulta = random.choice(pendientes)
+    base = f"/medicos/consultas/{id_consulta}"
+    _, html = cli.pedir("atender", base + "/atender")
+    medicamentos = _opciones(html, "IdMedicamento")
+    if not medicamentos:
+        raise _Fallo("atender: no hay medicamentos")
+    datos = {"Diagnostico": "Control de rutina (carga)", "IdMedicamento": random.choice(medicamentos), "Cantidad": "1"}
+    # Otro médico virtual pudo atenderla antes: el aviso es "warning"
+    cli.pedir("atender_confirmar", base + "/atender", datos, conflicto="warning")
+
+    elegido = _elegir_horario(cli, "siguiente_cita", base + "/siguiente-cita", {"idConsulta": id_consulta}, meses)
+    if elegido:
+        action, campos = elegido
+        cli.pedir("siguiente_cita_confirmar", urllib.parse.urlsplit(action).path, campos, conflicto="warning")
+
+
+def _usuario_virtual(base, resultados, timeout, usuario, password, flujo, destino, meses, pausa, espera, fin, errores) -> None:
+    time.sleep(espera)
+    cli = Cliente(base, resultados, timeout)
+    logueado = False
+    while time.monotonic() < fin:
+        try:
+            if not logueado:
+                cli.login(usuario, password, destino)
+                logueado = True
+            flujo(cli, meses)
+        except _Fallo as ex:
+            errores.append(str(ex))
+        if pausa:
+            time.sleep(random.uniform(0, pausa))
+
+
+@click.command("carga")
+@click.option("--url", default="http://127.0.0.1:5000", show_default=True, help="Instancia local de la app.")
+@click.option("--pacientes", default=20, show_default=True, help="Pacientes virtuales concurrentes.")
+@click.option("--medicos", default=5, show_default=True, help="Médicos virtuales concurrentes.")
+@click.option("--usuario-paciente", default="sint_paciente_{i}", show_default=True, help="Patrón de usuario ({i} = 1..N).")
+@click.option("--usuario-medico", default="sint_medico_{i}", show_default=True)
+@click.option("--password", default="veris123", show_default=True)
+@click.option("--duracion", default=60.0, show_default=True, help="Segundos de prueba.")
+@click.option("--rampa", default=5.0, show_default=True, help="Segundos en que se reparten los arranques.")
+@click.option("--pausa", default=1.0, show_default=True, help="Pausa aleatoria máxima entre flujos (s).")
+@click.option("--meses", default=3, show_default=True, help="Meses del calendario a recorrer buscando horarios.")
+@click.option("--timeout", default=30.0, show_default=True)
+@click.option("--json", "salida_json", type=click.Path(dir_okay=False), help="Guardar el resumen en JSON.")
+def carga(
+    url: str,
+    pacientes: int,
+    medicos: int,
+    usuario_paciente: str,
+    usuario_medico: str,
+    password: str,
+    duracion: float,
+    rampa: float,
+    pausa: float,
+    meses: int,
+    timeout: float,
+    salida_json: str | None,
+) -> None:
+    """Prueba de carga de los flujos de paciente (agendar) y médico (atender, siguiente cita).
+
+    Los usuarios `--usuario-paciente`/`--usuario-medico` ({i} = 1..N) deben
+    existir con la contraseña `--password` (los crea `flask seed`). Reporta por paso: peticiones/s, percentiles de latencia y errores.
+    """
+
+    if urllib.parse.urlsplit(url).hostname not in _LOCALES:
+        raise click.ClickException("La prueba de carga solo se corre contra una instancia local")
+
+    resultados = Resultados()
+    errores: list[str] = []
+    usuarios = [(usuario_paciente.format(i=i), flujo_paciente, "/pacientes") for i in range(1, pacientes + 1)]
+    usuarios += [(usuario_medico.format(i=i), flujo_medico, "/medicos") for i in range(1, medicos + 1)]
+    random.shuffle(usuarios)
+
+    inicio = time.monotonic()
+    fin = inicio + rampa + duracion
+    hilos = []
+    for k, (usuario, flujo, destino) in enumerate(usuarios):
+        espera = rampa * k / len(usuarios)
+        h = threading.Thread(
+            target=_usuario_virtual,
+            args=(url, resultados, timeout, usuario, password, flujo, destino, meses, pausa, espera, fin, errores),
+            daemon=True,
+        )
+        h.start()
+        hilos.append(h)
+    for h in hilos:
+        h.join()
+    total = time.monotonic() - inicio
+
+    filas = resultados.resumen(total)
+    click.echo(f"{len(usuarios)} usuarios virtuales, {total:.0f} s")
+    click.echo(f"{'paso':28s} {'n':>6s} {'rps':>7s} {'p50':>8s} {'p95':>8s} {'p99':>8s} {'max':>8s} {'err%':>6s} {'confl':>6s}")
+    for f in filas:
+        click.echo(
+            f"{f['paso']:28s} {f['n']:6d} {f['rps']:7.1f} {f['p50_ms']:8.1f} {f['p95_ms']:8.1f} "
+            f"{f['p99_ms']:8.1f} {f['max_ms']:8.1f} {f['error_pct']:6.1f} {f['conflictos']:6d}"
+        )
+    for msg in sorted(set(errores))[:10]:
+        click.echo(f"  {msg}")
+
+    if salida_json:
+        with open(salida_json, "w", encoding="utf-8") as f:
+            json.dump({"usuarios": len(usuarios), "segundos": total, "pasos": filas}, f, indent=2)
+
+
+def init_app(app) -> None:
+    """Registra `flask carga`."""
+
+    app.cli.add_command(carga)
@@ -0,0 +1,129 @@
+from __future__ import annotations
+
+import random
+import time
+from datetime import date, timedelta
+
+import click
+from flask import current_app
+from flask.cli import with_appcontext
+
+from database.connection import get_connection
+
+
+# Variantes de la consulta de choque que compara `db-bench-choques`
+_CHOQUE_VARIANTES = [
+    (
+        "NOT (HF<=hi OR HI>=hf), índice IdMedico",
+        "SELECT 1 FROM bench_consultas USE INDEX (IdMedico_FK_idx) "
+        "WHERE IdMedico=%s AND FechaConsulta=%s AND NOT (HF <= %s OR HI >= %s) LIMIT 1",
+        False,
+    ),
+    (
+        "NOT (HF<=hi OR HI>=hf), índice compuesto",
+        "SELECT 1 FROM bench_consultas FORCE INDEX (ix_consultas_medico_fecha_hi) "
+        "WHERE IdMedico=%s AND FechaConsulta=%s AND NOT (HF <= %s OR HI >= %s) LIMIT 1",
+        False,
+    ),
+    (
+        "HI<hf AND HF>hi, índice compuesto",
+        "SELECT 1 FROM bench_consultas FORCE INDEX (ix_consultas_medico_fecha_hi) "
+        "WHERE IdMedico=%s AND FechaConsulta=%s AND HI < %s AND HF > %s LIMIT 1",
+        True,
+    ),
+]
+
+
+def _filas_leidas(cur) -> int:
+    cur.execute("SHOW SESSION STATUS LIKE 'Handler_read%'")
+    return sum(int(v) for _, v in cur.fetchall() or [])
+
+
+@click.command("db-bench-choques")
+@click.option("--consultas", default=200_000, show_default=True, help="Consultas sintéticas a generar.")
+@click.option("--medicos", default=50, show_default=True)
+@click.option("--probes", default=2_000, show_default=True, help="Validaciones de choque a medir por variante.")
+@with_appcontext
+def db_bench_choques(consultas: int, medicos: int, probes: int) -> None:
+    """Mide la validación de choques de horario con mucho volumen.
+
+    Trabaja sobre una tabla TEMPORARY copiada de `consultas` (mismos índices),
+    así que no toca los datos. Cada médico tiene turnos de 30 minutos seguidos
+    de 08:00 a 18:00; se reportan tiempo medio y filas leídas por validación.
+    Requiere que la migración 2 (índices de consultas) esté aplicada.
+    """
+
+    por_dia = 20  # turnos de 30 min entre 08:00 y 18:00
+    dias = max(1, consultas // (medicos * por_dia))
+    inicio = date(2030, 1, 1)
+
+    def hora(slot: int) -> str:
+        m = 8 * 60 + slot * 30
+        return f"{m // 60:02d}:{m % 60:02d}:00"
+
+    with get_connection(current_app) as cn:
+        cur = cn.cursor()
+        cur.execute("CREATE TEMPORARY TABLE bench_consultas LIKE consultas")
+        sql = "INSERT INTO bench_consultas(IdMedico, IdPaciente, FechaConsulta, HI, HF, Diagnostico) VALUES(%s,%s,%s,%s,%s,'')"
+        lote: list[tuple] = []
+        n = 0
+        for d in range(dias):
+            fecha = (inicio + timedelta(days=d)).isoformat()
+            for medico in range(1, medicos + 1):
+                for slot in range(por_dia):
+                    lote.append((medico, n % 5000 + 1, fecha, hora(slot), hora(slot + 1)))
+                    n += 1
+                if len(lote) >= 5000:
+                    cur.executemany(sql, lote)
+                    lote.clear()
+        if lote:
+            cur.executemany(sql, lote)
+        cn.commit()
+        cur.execute("ANALYZE TABLE bench_consultas")
+        cur.fetchall()
+        click.echo(f"{n} consultas sintéticas ({medicos} médicos x {dias} días)")
+
+        # Lo que suma el propio SHOW STATUS entre dos lecturas seguidas
+        antes = _filas_leidas(cur)
+        base = _filas_leidas(cur) - antes
+
+        rnd = random.Random(40)
+        muestras = []
+        for _ in range(probes):
+            slot = rnd.randrange(por_dia)
+            fecha = (inicio + timedelta(days=rnd.randrange(dias))).isoformat()
+            muestras.append((rnd.randint(1, medicos), fecha, hora(slot), hora(slot + 1)))
+
+        for nombre, sql, nueva in _CHOQUE_VARIANTES:
+            medico, fecha, hi, hf = muestras[0]
+            cur.execute("EXPLAIN " + sql, (medico, fecha, hf, hi) if nueva else (medico, fecha, hi, hf))
+            cols = [c[0] for c in cur.description]
+            plan = dict(zip(cols, cur.fetchone() or ()))
+            cur.fetchall()
+            params = [(m, f, hf, hi) if nueva else (m, f, hi, hf) for m, f, hi, hf in muestras]
+
+            t0 = time.perf_counter()
+            for p in params:
+                cur.execute(sql, p)
+                cur.fetchall()
+            total = time.perf_counter() - t0
+
+            # Filas leídas en una pasada aparte para no sumar SHOW STATUS al tiempo
+            leidas = 0
+            for p in params:
+                antes = _filas_leidas(cur)
+                cur.execute(sql, p)
+                cur.fetchall()
+                leidas += _filas_leidas(cur) - antes - base
+            click.echo(
+                f"{nombre}: {total * 1000 / probes:.3f} ms/validación, "
+                f"{leidas / probes:.1f} filas leídas (EXPLAIN: type={plan.get('type')}, key_len={plan.get('key_len')})"
+            )
+        cur.execute("DROP TEMPORARY TABLE bench_consultas")
+        cur.close()
+
+
+def init_app(app) -> None:
+    """Registra `flask db-bench-choques`."""
+
+    app.cli.add_command(db_bench_choques)
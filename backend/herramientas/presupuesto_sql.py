@@ -0,0 +1,116 @@
+from __future__ import annotations
+
+import urllib.parse
+from datetime import date
+
+import click
+from flask.cli import pass_script_info
+
+from herramientas.carga import _ATENDER_RE, _FECHA_RE, _opciones
+from models import presupuesto
+
+
+_MODULOS_ADMIN = ("usuarios", "roles", "pacientes", "medicos", "especialidades", "medicamentos")
+
+
+class _Recorrido:
+    """Cliente de prueba que pide cada URL dos veces y mide la segunda (cachés calientes)."""
+
+    def __init__(self, app):
+        self.app = app
+        self.cli = None
+        self.filas: list[dict] = []
+
+    def entrar(self, usuario: str, password: str) -> bool:
+        self.cli = self.app.test_client()
+        self.cli.post("/login", data={"UserName": usuario, "Password": password})
+        with self.cli.session_transaction() as s:
+            return "user_id" in s
+
+    def pedir(self, url: str) -> str:
+        with self.cli:
+            self.cli.get(url)
+            resp = self.cli.get(url)
+            m = presupuesto.medicion()
+        if m is not None:
+            self.filas.append(dict(m, url=url))
+        return resp.get_data(as_text=True)
+
+    def calendario(self, path: str, params: dict, meses: int) -> None:
+        """Pide meses del calendario hasta uno con días libres y abre el primero."""
+
+        hoy = date.today()
+        for i in range(meses):
+            mes0 = hoy.month - 1 + i
+            query = {**params, "mes": mes0 % 12 + 1, "anio": hoy.year + mes0 // 12}
+            fechas = _FECHA_RE.findall(self.pedir(path + "?" + urllib.parse.urlencode(query)))
+            if fechas:
+                self.pedir(path + "?" + urllib.parse.urlencode({**query, "fecha": fechas[0]}))
+                return
+
+
+@click.command("presupuesto-sql")
+@click.option("--admin", "usuario_admin", help="Usuario administrador; sin él se omiten las rutas /admin.")
+@click.option("--admin-password", default="", help="Contraseña de --admin.")
+@click.option("--usuario-paciente", default="sint_paciente_1", show_default=True)
+@click.option("--usuario-medico", default="sint_medico_1", show_default=True)
+@click.option("--password", default="veris123", show_default=True, help="Contraseña de paciente y médico.")
+@click.option("--meses", default=3, show_default=True, help="Meses del calendario a recorrer buscando días libres.")
+@pass_script_info
+def presupuesto_sql(info, usuario_admin, admin_password, usuario_paciente, usuario_medico, password, meses):
+    """Recorre las pantallas de cada rol (solo GET) y compara el SQL con PRESUPUESTOS.
+
+    Pensado para una base de prueba cargada con `flask seed`. Falla si alguna
+    ruta hace más sentencias o lee más filas que su presupuesto y lista las
+    sentencias que hizo.
+    """
+
+    # Sin with_appcontext: cada petición de prueba necesita su propio contexto (y su `g`)
+    app = info.load_app()
+    app.config["PRESUPUESTO_SQL"] = "medir"  # contar sin avisar ni fallar
+    r = _Recorrido(app)
+
+    if usuario_admin:
+        if not r.entrar(usuario_admin, admin_password):
+            raise click.ClickException(f"No se pudo iniciar sesión como {usuario_admin}")
+        for m in _MODULOS_ADMIN:
+            r.pedir(f"/admin?m={m}")
+
+    if not r.entrar(usuario_paciente, password):
+        raise click.ClickException(f"No se pudo iniciar sesión como {usuario_paciente} (¿se corrió `flask seed`?)")
+    r.pedir("/pacientes")
+    path = "/pacientes/agendar-cita"
+    especialidades = _opciones(r.pedir(path), "idEspecialidad")
+    if especialidades:
+        medicos = _opciones(r.pedir(f"{path}?idEspecialidad={especialidades[0]}"), "idMedico")
+        if medicos:
+            r.calendario(path, {"idEspecialidad": especialidades[0], "idMedico": medicos[0]}, meses)
+
+    if not r.entrar(usuario_medico, password):
+        raise click.ClickException(f"No se pudo iniciar sesión como {usuario_medico}")
+    pendientes = _ATENDER_RE.findall(r.pedir("/medicos"))
+    if pendientes:
+        base = f"/medicos/consultas/{pendientes[0]}"
+        r.pedir(base + "/atender")
+        r.calendario(base + "/siguiente-cita", {"idConsulta": pendientes[0]}, meses)
+
+    excedidas = [f for f in r.filas if presupuesto.excesos(f)]
+    click.echo(f"{'endpoint':<28} {'SQL':>4} {'máx':>4} {'filas':>7} {'máx':>7}  url")
+    for f in r.filas:
+        marca = "  <-- excede" if f in excedidas else ""
+        max_filas = "-" if f["presupuesto_filas"] is None else f["presupuesto_filas"]
+        click.echo(
+            f"{f['endpoint']:<28} {f['sentencias']:>4} {f['presupuesto']:>4} {f['filas']:>7} {max_filas:>7}  {f['url']}{marca}"
+        )
+    for f in excedidas:
+        click.echo(f"\n{f['url']} ({'; '.join(presupuesto.excesos(f))}):")
+        for sql in f["detalle"]:
+            click.echo(f"  {sql}")
+    if excedidas:
+        raise click.ClickException(f"{len(excedidas)} peticiones exceden su presupuesto de SQL o de filas")
+
+
+def init_app(app) -> None:
+    """Registra `flask presupuesto-sql`."""
+
+    app.cli.add_command(presupuesto_sql)
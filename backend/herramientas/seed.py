@@ -0,0 +1,274 @@
+from __future__ import annotations
+
+import random
+import time
+from datetime import date, timedelta
+
+import click
+from flask import current_app
+from flask.cli import with_appcontext
+
+from database.cache import REFERENCE_SQL, bump_version
+from database.connection import get_connection
+from models.paciente import Paciente
+from models.usuario import login_key
+from routes.crud_routes import _dias_str_to_weekdays, _minutes_to_hhmm, _time_to_minutes
+
+
+_NOMBRES = (
+    "Andrea", "Carlos", "Daniela", "Diego", "Fernanda", "Gabriel", "Isabel", "Javier", "Karla", "Luis",
+    "María", "Mateo", "Nicole", "Pablo", "Paula", "Ricardo", "Sofía", "Tomás", "Valeria", "Xavier",
+)
+_APELLIDOS = (
+    "Andrade", "Benítez", "Cedeño", "Chávez", "Espinoza", "Guerrero", "Jaramillo", "León", "Mendoza", "Morales",
+    "Ortiz", "Peñafiel", "Quishpe", "Reyes", "Salazar", "Suárez", "Torres", "Vásquez", "Yánez", "Zambrano",
+)
+_DIAGNOSTICOS = (
+    "Control de rutina", "Hipertensión arterial", "Infección respiratoria alta", "Gastritis", "Lumbalgia",
+    "Rinitis alérgica", "Migraña", "Diabetes tipo 2 en control", "Esguince de tobillo", "Conjuntivitis",
+)
+
+_SLOT = 30  # minutos, igual que el agendamiento
+
+
+def digito_verificador(nueve: str) -> int:
+    """Dígito verificador (módulo 10) de una cédula ecuatoriana."""
+
+    total = 0
+    for i, c in enumerate(nueve):
+        d = int(c) * (2 if i % 2 == 0 else 1)
+        total += d - 9 if d > 9 else d
+    return (10 - total % 10) % 10
+
+
+def cedula_ec(i: int) -> str:
+    """Cédula válida y única para cada i < 90.000.000.
+
+    Provincias 10-24 (la columna es INT: sin cero a la izquierda), tercer
+    dígito 0-5 (persona natural) y seis dígitos de secuencia.
+    """
+
+    nueve = f"{10 + i % 15}{(i // 15) % 6}{(i // 90) % 1_000_000:06d}"
+    return nueve + str(digito_verificador(nueve))
+
+
+def _nombre(rnd: random.Random) -> str:
+    return f"{rnd.choice(_NOMBRES)} {rnd.choice(_APELLIDOS)}"
+
+
+def _max_id(cur, tabla: str, pk: str) -> int:
+    cur.execute(f"SELECT COALESCE(MAX({pk}), 0) FROM {tabla}")
+    return int(cur.fetchone()[0])
+
+
+class _Lotes:
+    """Acumula filas por tabla y las inserta con executemany (mysql.connector
+    lo envía como un único INSERT multi-fila) cada `size` filas."""
+
+    def __init__(self, cn, size: int):
+        self.cn = cn
+        self.size = size
+        self.cur = cn.cursor()
+        self.filas: dict[str, list[tuple]] = {}
+
+    def add(self, sql: str, row: tuple) -> None:
+        rows = self.filas.setdefault(sql, [])
+        rows.append(row)
+        if len(rows) >= self.size:
+            self.flush(sql)
+
+    def flush(self, sql: str | None = None) -> None:
+        for key in [sql] if sql else list(self.filas):
+            rows = self.filas.get(key)
+            if rows:
+                self.cur.executemany(key, rows)
+                self.cn.commit()
+                rows.clear()
+
+
+_SQL_USUARIO = "INSERT INTO usuarios(IdUsuario, Nombre, NombreClave, Password, Rol) VALUES(%s,%s,%s,%s,%s)"
+_SQL_MEDICO = "INSERT INTO medicos(IdMedico, Nombre, Especialidad, IdUsuario, Foto) VALUES(%s,%s,%s,%s,'')"
+_SQL_PACIENTE = (
+    "INSERT INTO pacientes(IdPaciente, IdUsuario, Nombre, Cedula, Edad, Genero, `Estatura (cm)`, `Peso (kg)`, Foto) "
+    "VALUES(%s,%s,%s,%s,%s,%s,%s,%s,'')"
+)
+_SQL_CONSULTA = (
+    "INSERT INTO consultas(IdConsulta, IdMedico, IdPaciente, FechaConsulta, HI, HF, Diagnostico) "
+    "VALUES(%s,%s,%s,%s,%s,%s,%s)"
+)
+_SQL_RECETA = "INSERT INTO recetas(IdReceta, IdConsulta, IdMedicamento, Cantidad) VALUES(%s,%s,%s,%s)"
+
+
+@click.command("seed")
+@click.option("--medicos", default=500, show_default=True)
+@click.option("--pacientes", default=10_000, show_default=True)
+@click.option("--consultas", default=200_000, show_default=True, help="Consultas aproximadas a generar.")
+@click.option("--recetas", default=0.9, show_default=True, help="Fracción de consultas pasadas con receta.")
+@click.option("--desde", type=click.DateTime(["%Y-%m-%d"]), help="Primera fecha (por defecto hace un año).")
+@click.option("--hasta", type=click.DateTime(["%Y-%m-%d"]), help="Última fecha (por defecto en 90 días).")
+@click.option("--prefijo", default="sint", show_default=True, help="Usuarios <prefijo>_medico_<i> y <prefijo>_paciente_<i>.")
+@click.option("--password", default="veris123", show_default=True)
+@click.option("--lote", default=5000, show_default=True, help="Filas por INSERT multi-fila.")
+@click.option("--semilla", default=44, show_default=True)
+@with_appcontext
+def seed(
+    medicos: int,
+    pacientes: int,
+    consultas: int,
+    recetas: float,
+    desde,
+    hasta,
+    prefijo: str,
+    password: str,
+    lote: int,
+    semilla: int,
+) -> None:
+    """Genera datos sintéticos de volumen (médicos, pacientes, consultas y recetas).
+
+    Las consultas caen en los días y franjas de la especialidad de cada médico,
+    en turnos de 30 minutos sin cruces por médico ni por paciente. Las pasadas
+    tienen diagnóstico (y receta según --recetas); las futuras quedan
+    "Pendiente". Solo se usan médicos y pacientes nuevos, así que los datos
+    existentes no se tocan.
+    """
+
+    rnd = random.Random(semilla)
+    hoy = date.today()
+    inicio = desde.date() if desde else hoy - timedelta(days=365)
+    fin = hasta.date() if hasta else hoy + timedelta(days=90)
+    if fin < inicio:
+        raise click.ClickException("--hasta es anterior a --desde")
+    validar_cedula = Paciente(None)._validar_cedula_ec
+
+    with get_connection(current_app) as cn:
+        cur = cn.cursor()
+        cur.execute("SELECT 1 FROM usuarios WHERE NombreClave=%s", (login_key(f"{prefijo}_medico_1"),))
+        if cur.fetchone():
+            raise click.ClickException(f"Ya hay datos con el prefijo '{prefijo}': use otro --prefijo")
+
+        cur.execute(REFERENCE_SQL["especialidades"])
+        especialidades = []
+        for id_esp, _, dias, franja_hi, franja_hf in cur.fetchall() or []:
+            hi, hf = _time_to_minutes(franja_hi), _time_to_minutes(franja_hf)
+            turnos = [_minutes_to_hhmm(m) + ":00" for m in range(hi, hf - _SLOT + 1, _SLOT)]
+            if turnos:
+                especialidades.append((id_esp, _dias_str_to_weekdays(dias), turnos))
+        cur.execute("SELECT IdMedicamento FROM medicamentos")
+        medicamentos = [r[0] for r in cur.fetchall() or []]
+        if not especialidades or not medicamentos:
+            raise click.ClickException("Se necesitan especialidades con franja y medicamentos cargados")
+        cur.execute("SELECT Cedula FROM pacientes")
+        cedulas_usadas = {str(r[0]) for r in cur.fetchall() or []}
+
+        base_usuario = _max_id(cur, "usuarios", "IdUsuario")
+        base_medico = _max_id(cur, "medicos", "IdMedico")
+        base_paciente = _max_id(cur, "pacientes", "IdPaciente")
+        base_consulta = _max_id(cur, "consultas", "IdConsulta")
+        base_receta = _max_id(cur, "recetas", "IdReceta")
+
+        # Carga masiva: sin verificaciones por fila (los Id se generan aquí)
+        cur.execute("SET SESSION unique_checks=0, foreign_key_checks=0")
+        lotes = _Lotes(cn, lote)
+        t0 = time.perf_counter()
+
+        # Médicos: especialidad al azar (cada una con sus días y franja)
+        agenda = []  # (IdMedico, weekdays, turnos)
+        for i in range(1, medicos + 1):
+            id_usuario = base_usuario + i
+            nombre = f"{prefijo}_medico_{i}"
+            lotes.add(_SQL_USUARIO, (id_usuario, nombre, login_key(nombre), password, 2))
+            id_esp, dias, turnos = rnd.choice(especialidades)
+            lotes.add(_SQL_MEDICO, (base_medico + i, _nombre(rnd), id_esp, id_usuario))
+            agenda.append((base_medico + i, dias, turnos))
+
+        # Pacientes con cédula válida y única
+        base_usuario += medicos
+        k = 0
+        for i in range(1, pacientes + 1):
+            cedula = cedula_ec(k)
+            while cedula in cedulas_usadas:
+                k += 1
+                cedula = cedula_ec(k)
+            k += 1
+            if not validar_cedula(cedula):
+                raise click.ClickException(f"Cédula generada inválida: {cedula}")
+            id_usuario = base_usuario + i
+            nombre = f"{prefijo}_paciente_{i}"
+            lotes.add(_SQL_USUARIO, (id_usuario, nombre, login_key(nombre), password, 3))
+            genero = rnd.choice(("Masculino", "Femenino"))
+            estatura = int(rnd.gauss(172 if genero == "Masculino" else 160, 8))
+            lotes.add(
+                _SQL_PACIENTE,
+                (
+                    base_paciente + i,
+                    id_usuario,
+                    _nombre(rnd),
+                    int(cedula),
+                    int(rnd.triangular(1, 90, 35)),
+                    genero,
+                    estatura,
+                    round(max(10.0, rnd.gauss(estatura - 100, 12)), 1),
+                ),
+            )
+        lotes.flush()
+        click.echo(f"{medicos} médicos y {pacientes} pacientes ({time.perf_counter() - t0:.0f} s)")
+
+        # Ocupación necesaria para llegar a --consultas con los turnos disponibles
+        dias = [inicio + timedelta(days=n) for n in range((fin - inicio).days + 1)]
+        capacidad = sum(len(t) for _, wd, t in agenda for d in dias if not wd or d.weekday() in wd)
+        if consultas > capacidad:
+            raise click.ClickException(
+                f"Solo hay {capacidad} turnos en el rango: aumente --medicos o amplíe las fechas"
+            )
+        ocupacion = consultas / capacidad if capacidad else 0.0
+
+        id_consulta = base_consulta
+        id_receta = base_receta
+        for d in dias:
+            fecha = d.isoformat()
+            pasada = d < hoy
+            ocupados: dict[int, list[tuple[int, int]]] = {}  # turnos del día por paciente: sin cruces
+            for id_medico, wd, turnos in agenda:
+                if wd and d.weekday() not in wd:
+                    continue
+                # Redondeo aleatorio: en promedio `ocupacion` de los turnos del día
+                n = int(ocupacion * len(turnos) + rnd.random())
+                for hi in rnd.sample(turnos, min(n, len(turnos))):
+                    hi_min = _time_to_minutes(hi)
+                    hf_min = hi_min + _SLOT
+                    # Pacientes frecuentes: sesgo hacia los primeros Id
+                    for _ in range(5):
+                        id_paciente = base_paciente + 1 + int(pacientes * rnd.random() ** 2)
+                        turnos_paciente = ocupados.setdefault(id_paciente, [])
+                        if not any(a < hf_min and b > hi_min for a, b in turnos_paciente):
+                            break
+                    else:
+                        continue
+                    turnos_paciente.append((hi_min, hf_min))
+                    id_consulta += 1
+                    hf = _minutes_to_hhmm(hf_min) + ":00"
+                    diagnostico = rnd.choice(_DIAGNOSTICOS) if pasada else "Pendiente"
+                    lotes.add(_SQL_CONSULTA, (id_consulta, id_medico, id_paciente, fecha, hi, hf, diagnostico))
+                    if pasada and rnd.random() < recetas:
+                        id_receta += 1
+                        lotes.add(_SQL_RECETA, (id_receta, id_consulta, rnd.choice(medicamentos), rnd.randint(1, 3)))
+            if d.day == 1:
+                click.echo(f"  {fecha}: {id_consulta - base_consulta} consultas")
+        lotes.flush()
+        cur.execute("SET SESSION unique_checks=1, foreign_key_checks=1")
+        for tabla in ("usuarios", "medicos", "pacientes", "consultas", "recetas"):
+            cur.execute(f"ANALYZE TABLE {tabla}")
+            cur.fetchall()
+        cur.close()
+
+    bump_version("usuarios", "medicos", "pacientes", "consultas", "recetas")
+    click.echo(
+        f"{id_consulta - base_consulta} consultas y {id_receta - base_receta} recetas "
+        f"({time.perf_counter() - t0:.0f} s, ocupación {ocupacion:.0%})"
+    )
+
+
+def init_app(app) -> None:
+    """Registra `flask seed`."""
+
+    app.cli.add_command(seed)
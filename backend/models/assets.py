@@ -0,0 +1,233 @@
+from __future__ import annotations
+
+import base64
+import gzip
+import hashlib
+import json
+import mimetypes
+import posixpath
+import re
+import urllib.request
+from pathlib import Path
+
+import click
+from flask import current_app, request, send_from_directory
+from flask.cli import with_appcontext
+
+try:  # opcional: sin el paquete Brotli solo se generan variantes .gz
+    import brotli
+except ImportError:  # pragma: no cover
+    brotli = None
+
+
+# Carpeta (dentro de static) con los archivos con huella y su manifiesto
+DIST_DIR = "dist"
+MANIFEST = "manifest.json"
+
+# Dependencias de terceros servidas desde static/vendor (se descargan en el
+# build y se verifican contra VENDOR_LOCK; en ejecución nunca se usa el CDN)
+VENDOR = {
+    "vendor/bootstrap/bootstrap.min.css": "https://cdn.jsdelivr.net/npm/bootstrap@5.3.2/dist/css/bootstrap.min.css",
+    "vendor/bootstrap/bootstrap.bundle.min.js": "https://cdn.jsdelivr.net/npm/bootstrap@5.3.2/dist/js/bootstrap.bundle.min.js",
+    "vendor/bootstrap-icons/bootstrap-icons.min.css": "https://cdn.jsdelivr.net/npm/bootstrap-icons@1.10.5/font/bootstrap-icons.min.css",
+    "vendor/bootstrap-icons/fonts/bootstrap-icons.woff2": "https://cdn.jsdelivr.net/npm/bootstrap-icons@1.10.5/font/fonts/bootstrap-icons.woff2",
+    "vendor/bootstrap-icons/fonts/bootstrap-icons.woff": "https://cdn.jsdelivr.net/npm/bootstrap-icons@1.10.5/font/fonts/bootstrap-icons.woff",
+}
+
+# Hash SRI ("sha384-...") de cada archivo de VENDOR, junto a static/ (versionado)
+VENDOR_LOCK = "vendor.lock.json"
+
+# Carpetas de static que no son assets (fotos subidas y la propia salida)
+_EXCLUIR = ("img/usuarios/", f"{DIST_DIR}/")
+
+# Extensiones que vale la pena precomprimir (las imágenes y woff2 ya lo están)
+_COMPRIMIR = {".css", ".js", ".svg", ".json", ".map", ".txt", ".woff"}
+
+_URL_RE = re.compile(r"""url\(\s*(['"]?)([^'")]+)\1\s*\)""")
+
+# nombre lógico ("css/styles.css") -> nombre con huella ("dist/css/styles.1a2b3c4d5e.css")
+_manifest: dict[str, str] = {}
+
+
+def _static_dir() -> Path:
+    return Path(current_app.static_folder)  # type: ignore[arg-type]
+
+
+def _fingerprint(endpoint: str, values: dict) -> None:
+    """`url_defaults`: url_for('static', filename=...) apunta al archivo con huella."""
+
+    if endpoint == "static" and _manifest:
+        hashed = _manifest.get(values.get("filename", ""))
+        if hashed:
+            values["filename"] = hashed
+
+
+def _send_static(filename: str):
+    """Vista `static` que sirve la variante .br/.gz precomprimida y caché inmutable en dist/."""
+
+    folder = _static_dir()
+    if not filename.startswith(f"{DIST_DIR}/"):
+        return current_app.send_static_file(filename)
+
+    mimetype = mimetypes.guess_type(filename)[0] or "application/octet-stream"
+    for encoding, suffix in (("br", ".br"), ("gzip", ".gz")):
+        if encoding in request.accept_encodings and (folder / (filename + suffix)).is_file():
+            response = send_from_directory(folder, filename + suffix, mimetype=mimetype, max_age=31536000)
+            response.headers["Content-Encoding"] = encoding
+            break
+    else:
+        response = send_from_directory(folder, filename, max_age=31536000)
+
+    response.vary.add("Accept-Encoding")
+    response.cache_control.public = True
+    response.cache_control.immutable = True
+    return response
+
+
+def load_manifest(app) -> None:
+    path = Path(app.static_folder) / DIST_DIR / MANIFEST  # type: ignore[arg-type]
+    _manifest.clear()
+    if app.config.get("ASSETS_FINGERPRINT", True) and path.is_file():
+        _manifest.update(json.loads(path.read_text(encoding="utf-8")))
+
+
+# ----------------------------------------------------------------------
+# Build
+# ----------------------------------------------------------------------
+def _sri(data: bytes, alg: str = "sha384") -> str:
+    return f"{alg}-{base64.b64encode(hashlib.new(alg, data).digest()).decode('ascii')}"
+
+
+def _descargar_vendor(folder: Path, fijar: bool) -> None:
+    """Descarga lo que falte de VENDOR y verifica cada archivo contra VENDOR_LOCK.
+
+    Con `fijar`, los archivos sin hash en el lock se aceptan y su hash se
+    agrega (hacerlo en una red de confianza y versionar el lock).
+    """
+
+    lock_path = folder.parent / VENDOR_LOCK
+    lock: dict[str, str] = json.loads(lock_path.read_text(encoding="utf-8")) if lock_path.is_file() else {}
+    fijados = 0
+    for name, url in VENDOR.items():
+        esperado = lock.get(name)
+        if not esperado and not fijar:
+            raise click.ClickException(
+                f"{name} no tiene hash en {VENDOR_LOCK}: ejecutar `assets-build --fijar-vendor` "
+                "en una red de confianza y versionar el archivo"
+            )
+        dest = folder / name
+        if dest.is_file():
+            data = dest.read_bytes()
+        else:
+            click.echo(f"  descargando {name}")
+            with urllib.request.urlopen(url, timeout=30) as resp:
+                data = resp.read()
+
+        if not esperado:
+            lock[name] = _sri(data)
+            fijados += 1
+            click.echo(f"  fijado {name}: {lock[name]}")
+        elif _sri(data, esperado.split("-", 1)[0]) != esperado:
+            raise click.ClickException(f"{name} no coincide con {VENDOR_LOCK} ({url}); no se usa")
+
+        if not dest.is_file():
+            dest.parent.mkdir(parents=True, exist_ok=True)
+            tmp = dest.with_name(dest.name + ".tmp")
+            tmp.write_bytes(data)
+            tmp.replace(dest)
+    if fijados:
+        lock_path.write_text(json.dumps(lock, indent=2, sort_keys=True) + "\n", encoding="utf-8")
+
+
+def _hashed_name(name: str, data: bytes) -> str:
+    root, ext = posixpath.splitext(name)
+    return f"{DIST_DIR}/{root}.{hashlib.sha256(data).hexdigest()[:10]}{ext}"
+
+
+def _reescribir_css(name: str, css: str, manifest: dict[str, str]) -> str:
+    """Cambia las url() relativas del CSS por los archivos con huella."""
+
+    base = posixpath.dirname(name)
+
+    def repl(m: re.Match) -> str:
+        ref = m.group(2)
+        if ref.startswith(("data:", "http:", "https:", "//", "/", "#")):
+            return m.group(0)
+        path = re.split(r"[?#]", ref, 1)[0]
+        target = manifest.get(posixpath.normpath(posixpath.join(base, path)))
+        if not target:
+            return m.group(0)
+        rel = posixpath.relpath(target, posixpath.join(DIST_DIR, base))
+        return f'url("{rel}")'
+
+    return _URL_RE.sub(repl, css)
+
+
+def _comprimir(path: Path) -> None:
+    data = path.read_bytes()
+    variantes = {".gz": gzip.compress(data, compresslevel=9, mtime=0)}
+    if brotli is not None:
+        variantes[".br"] = brotli.compress(data, quality=11)
+    for suffix, comp in variantes.items():
+        if len(comp) < len(data):
+            path.with_name(path.name + suffix).write_bytes(comp)
+
+
+@click.command("assets-build")
+@click.option("--no-vendor", is_flag=True, help="No descargar las dependencias de terceros.")
+@click.option("--fijar-vendor", is_flag=True, help=f"Agregar a {VENDOR_LOCK} el hash de las dependencias que no lo tengan.")
+@click.option("--clean", is_flag=True, help="Borrar de dist/ los archivos de builds anteriores.")
+@with_appcontext
+def assets_build(no_vendor: bool, fijar_vendor: bool, clean: bool) -> None:
+    """Genera static/dist: archivos con huella de contenido, variantes .gz/.br y manifiesto."""
+
+    folder = _static_dir()
+    if not no_vendor:
+        _descargar_vendor(folder, fijar_vendor)
+
+    sources = sorted(
+        p.relative_to(folder).as_posix()
+        for p in folder.rglob("*")
+        if p.is_file() and not p.relative_to(folder).as_posix().startswith(_EXCLUIR)
+    )
+    # Primero todo lo que no es CSS: el CSS se reescribe con sus nombres finales
+    sources.sort(key=lambda n: n.endswith(".css"))
+
+    manifest: dict[str, str] = {}
+    for name in sources:
+        data = (folder / name).read_bytes()
+        if name.endswith(".css"):
+            data = _reescribir_css(name, data.decode("utf-8"), manifest).encode("utf-8")
+        hashed = _hashed_name(name, data)
+        manifest[name] = hashed
+
+        out = folder / hashed
+        if not out.is_file():
+            out.parent.mkdir(parents=True, exist_ok=True)
+            out.write_bytes(data)
+            if out.suffix in _COMPRIMIR:
+                _comprimir(out)
+
+    dist = folder / DIST_DIR
+    (dist / MANIFEST).write_text(json.dumps(manifest, indent=2, sort_keys=True), encoding="utf-8")
+
+    if clean:
+        vigentes = set(manifest.values()) | {f"{DIST_DIR}/{MANIFEST}"}
+        for path in dist.rglob("*"):
+            name = path.relative_to(folder).as_posix()
+            if path.is_file() and re.sub(r"\.(gz|br)$", "", name) not in vigentes:
+                path.unlink()
+
+    click.echo(f"{len(manifest)} assets en {DIST_DIR}/ (brotli: {'sí' if brotli else 'no'})")
+
+
+def init_app(app) -> None:
+    """Carga el manifiesto y registra url_for con huella, la vista static y `flask assets-build`."""
+
+    load_manifest(app)
+    faltan = [name for name in VENDOR if not (Path(app.static_folder) / name).is_file()]  # type: ignore[arg-type]
+    if faltan:
+        app.logger.warning("Faltan dependencias en static/vendor (%s): ejecutar `flask assets-build`", ", ".join(faltan))
+    app.url_defaults(_fingerprint)
+    app.view_functions["static"] = _send_static
+    app.cli.add_command(assets_build)
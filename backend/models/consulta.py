@@ -1,9 +1,41 @@
 from __future__ import annotations
 
 import base64
-import html
 from typing import Any, Dict, List, Tuple
 
+from flask import url_for
+
+from database.cache import bump_version
+from models.render import campo, render_macro, tabla
+from models.trazas import trazado
+
+
+# Columnas por las que se valida que dos consultas no se crucen
+_CHOQUE_COLUMNAS = ("IdMedico", "IdPaciente")
+
+
+def hay_choque(cn, columna: str, id_: int, fecha, hi, hf, excluir: int | None = None) -> bool:
+    """True si el médico/paciente (`columna` = IdMedico o IdPaciente) ya tiene
+    una consulta que se cruza con [hi, hf) en `fecha`.
+
+    Se escribe como `HI < hf AND HF > hi` (y no como `NOT (HF <= hi OR HI >= hf)`)
+    para que MySQL recorra un rango de los índices (IdMedico|IdPaciente,
+    FechaConsulta, HI): solo lee las consultas de ese día que empiezan antes de `hf`.
+    """
+
+    if columna not in _CHOQUE_COLUMNAS:
+        raise ValueError(f"Columna de choque inválida: {columna}")
+    sql = f"SELECT 1 FROM consultas WHERE {columna}=%s AND FechaConsulta=%s AND HI < %s AND HF > %s"
+    params: tuple = (id_, fecha, hf, hi)
+    if excluir is not None:
+        sql += " AND IdConsulta<>%s"
+        params += (excluir,)
+    cur = cn.cursor()
+    cur.execute(sql + " LIMIT 1", params)
+    found = cur.fetchone() is not None
+    cur.close()
+    return found
+
 
 class Consulta:
 
@@ -12,8 +44,32 @@ class Consulta:
     title = "Consultas"
     path = "/consultas"
 
-    def __init__(self, cn):
+    # Columnas del listado: (encabezado, clave de la fila, tipo de celda)
+    list_columns = [
+        ("Médico", "NombreMedico", "text"),
+        ("Paciente", "NombrePaciente", "text"),
+        ("FechaConsulta", "FechaConsulta", "text"),
+        ("HI", "HI", "text"),
+        ("HF", "HF", "text"),
+        ("Diagnostico", "Diagnostico", "trunc"),
+    ]
+    # Tablas que alimentan el listado (su versión forma el ETag)
+    list_tables = ("consultas", "medicos", "pacientes")
+    # Campos editables: (name, etiqueta, tipo de input)
+    form_fields = [
+        ("IdMedico", "IdMedico", "number"),
+        ("IdPaciente", "IdPaciente", "number"),
+        ("FechaConsulta", "FechaConsulta", "date"),
+        ("HI", "HI", "time"),
+        ("HF", "HF", "time"),
+        ("Diagnostico", "Diagnostico", "textarea"),
+    ]
+
+    def __init__(self, cn, path: str | None = None):
         self.cn = cn
+        # Ruta base de los enlaces (p. ej. "/admin?m=usuarios" desde el dashboard)
+        if path is not None:
+            self.path = path
 
         self.IdConsulta: int | None = None
         self.IdMedico: int | None = None
@@ -24,15 +80,16 @@ class Consulta:
         self.Diagnostico: str = ""
 
         # JOINs para mostrar los nombres de médico y paciente en lugar de sus IDs
-        self.sql_list = (
+        self.sql_select = (
             "SELECT c.IdConsulta, c.IdMedico, c.IdPaciente, "
             "m.Nombre AS NombreMedico, p.Nombre AS NombrePaciente, "
             "c.FechaConsulta, c.HI, c.HF, c.Diagnostico "
             "FROM consultas c "
             "LEFT JOIN medicos m ON c.IdMedico = m.IdMedico "
             "LEFT JOIN pacientes p ON c.IdPaciente = p.IdPaciente "
-            "ORDER BY c.IdConsulta DESC"
         )
+        self.sql_order = "ORDER BY c.IdConsulta DESC"
+        self.sql_list = self.sql_select + self.sql_order
         self.sql_detail = (
             "SELECT c.IdConsulta, c.IdMedico, c.IdPaciente, "
             "m.Nombre AS NombreMedico, p.Nombre AS NombrePaciente, "
@@ -74,7 +131,7 @@ class Consulta:
             '<nav class="navbar navbar-expand-lg navbar-light bg-white shadow-sm py-2">'
             '<div class="container-fluid px-4">'
             '<a class="navbar-brand d-flex flex-column align-items-start" href="/">'
-            '<img src="/static/img/logo.png" alt="Logo Veris" class="img-fluid mb-1" '
+            f'<img src="{url_for("static", filename="img/logo.png")}" alt="Logo Veris" class="img-fluid mb-1" '
             'style="height: 35px; width: auto;">'
             "<span class='slogan'>Hacemos <strong>fácil cuidarte</strong></span>"
             "</a>"
@@ -89,78 +146,27 @@ class Consulta:
         )
 
     def _msg_success(self, text: str) -> str:
-        return f'<div class="alert alert-success" role="alert">{html.escape(text)}</div>'
+        return render_macro("alert", "success", text)
 
     def _msg_error(self, text: str) -> str:
-        return f'<div class="alert alert-danger" role="alert">{html.escape(text)}</div>'
+        return render_macro("alert", "danger", text)
 
-    def _input(self, name: str, label: str, value: str, disabled: bool, type_: str = "text") -> str:
-        dis = " disabled" if disabled else ""
-        return (
-            '<div class="mb-3">'
-            f'<label class="form-label" for="{html.escape(name)}">{html.escape(label)}</label>'
-            f'<input class="form-control" id="{html.escape(name)}" name="{html.escape(name)}" '
-            f'type="{html.escape(type_)}" value="{html.escape(value)}"{dis} />'
-            "</div>"
-        )
+    def _input(self, name: str, label: str, value: str, disabled: bool, type_: str = "text") -> tuple:
+        return campo("input", name, label, value, disabled, type_)
 
-    def _textarea(self, name: str, label: str, value: str, disabled: bool) -> str:
-        dis = " disabled" if disabled else ""
-        return (
-            '<div class="mb-3">'
-            f'<label class="form-label" for="{html.escape(name)}">{html.escape(label)}</label>'
-            f'<textarea class="form-control" id="{html.escape(name)}" name="{html.escape(name)}" rows="4"{dis}>'
-            f"{html.escape(value)}"
-            "</textarea>"
-            "</div>"
-        )
+    def _textarea(self, name: str, label: str, value: str, disabled: bool) -> tuple:
+        return campo("textarea", name, label, value, disabled)
 
+    @trazado
     def get_list(self) -> str:
         cur = self.cn.cursor(dictionary=True)
         cur.execute(self.sql_list)
         rows: List[Dict[str, Any]] = cur.fetchall() or []
         cur.close()
 
-        d_new = self._d_encode("new", 0)
-        headers = ["Médico", "Paciente", "FechaConsulta", "HI", "HF", "Diagnostico", "Acciones"]
-        thead = "".join(f"<th>{h}</th>" for h in headers)
-
-        tbody = ""
-        for r in rows:
-            pk = int(r["IdConsulta"])
-            d_act = self._d_encode("act", pk)
-            d_det = self._d_encode("det", pk)
-            d_del = self._d_encode("del", pk)
-            diag = str(r.get("Diagnostico") or "")
-            tbody += (
-                "<tr>"
-                f"<td>{html.escape(str(r.get('NombreMedico','')))}</td>"
-                f"<td>{html.escape(str(r.get('NombrePaciente','')))}</td>"
-                f"<td>{html.escape(str(r.get('FechaConsulta','')))}</td>"
-                f"<td>{html.escape(str(r.get('HI','')))}</td>"
-                f"<td>{html.escape(str(r.get('HF','')))}</td>"
-                f"<td>{html.escape(diag[:60] + ('...' if len(diag) > 60 else ''))}</td>"
-                "<td>"
-                f"<a class='btn btn-sm btn-primary me-1' href='{self.path}?d={d_act}'>Editar</a>"
-                f"<a class='btn btn-sm btn-outline-secondary me-1' href='{self.path}?d={d_det}'>Detalle</a>"
-                f"<a class='btn btn-sm btn-danger' href='{self.path}?d={d_del}' data-veris-confirm='¿Eliminar este registro?'>Eliminar</a>"
-                "</td>"
-                "</tr>"
-            )
-
-        return (
-            "<main class='container my-4 veris-tabla-container'>"
-            f"<h2 class='veris-tabla-title'>{html.escape(self.title)}</h2>"
-            f"<p class='veris-tabla-actions'><a class='btn veris-tabla-btn-crear' href='{self.path}?d={d_new}'>Crear nuevo</a></p>"
-            "<div class='veris-tabla-wrapper'>"
-            "<table class='table veris-tabla table-bordered table-striped'>"
-            f"<thead class='veris-tabla-thead'><tr>{thead}</tr></thead>"
-            f"<tbody class='veris-tabla-body-content'>{tbody}</tbody>"
-            "</table>"
-            "</div>"
-            "</main>"
-        )
+        return tabla(self.title, self.path, self.list_columns, rows, self.pk)
 
+    @trazado
     def get_form(self, id: int = 0) -> str:
         is_new = id == 0
         op = "new" if is_new else "act"
@@ -186,25 +192,11 @@ class Consulta:
                 values[k] = "" if row.get(k) is None else str(row.get(k))
 
         d = self._d_encode(op, id)
-        form = ""
-        form += self._input("IdConsulta", "IdConsulta", values["IdConsulta"], disabled_pk, "number")
-        form += self._input("IdMedico", "IdMedico", values["IdMedico"], False, "number")
-        form += self._input("IdPaciente", "IdPaciente", values["IdPaciente"], False, "number")
-        form += self._input("FechaConsulta", "FechaConsulta", values["FechaConsulta"], False, "date")
-        form += self._input("HI", "HI", values["HI"], False, "time")
-        form += self._input("HF", "HF", values["HF"], False, "time")
-        form += self._textarea("Diagnostico", "Diagnostico", values["Diagnostico"], False)
+        form = [self._input("IdConsulta", "IdConsulta", values["IdConsulta"], disabled_pk, "number")]
+        form.append(campo("fields", self.form_fields, values))
 
         title = "Nueva Consulta" if is_new else "Actualizar Consulta"
-        return (
-            f"<h2 class='mb-3'>{html.escape(title)}</h2>"
-            f"<form method='post'>"
-            f"<input type='hidden' name='d' value='{html.escape(d)}' />"
-            f"{form}"
-            "<button class='btn btn-primary' type='submit'>Guardar</button> "
-            f"<a class='btn btn-outline-secondary' href='{self.path}'>Volver</a>"
-            "</form>"
-        )
+        return render_macro("form", title, self.path, d, form)
 
     def get_detail(self, id: int) -> str:
         cur = self.cn.cursor(dictionary=True)
@@ -214,22 +206,11 @@ class Consulta:
         if not row:
             return self._msg_error("Registro no encontrado")
 
-        form = ""
-        form += self._input("IdConsulta", "IdConsulta", str(row.get("IdConsulta", "")), True, "number")
-        form += self._input("IdMedico", "IdMedico", str(row.get("IdMedico", "")), True, "number")
-        form += self._input("IdPaciente", "IdPaciente", str(row.get("IdPaciente", "")), True, "number")
-        form += self._input("FechaConsulta", "FechaConsulta", str(row.get("FechaConsulta", "")), True, "date")
-        form += self._input("HI", "HI", str(row.get("HI", "")), True, "time")
-        form += self._input("HF", "HF", str(row.get("HF", "")), True, "time")
-        form += self._textarea("Diagnostico", "Diagnostico", str(row.get("Diagnostico", "")), True)
+        values = {k: str(row.get(k, "")) for k in row.keys()}
+        form = [self._input("IdConsulta", "IdConsulta", values["IdConsulta"], True, "number")]
+        form.append(campo("fields", self.form_fields, values, True))
 
-        return (
-            f"<h2 class='mb-3'>Detalle Consulta</h2>"
-            f"<form>"
-            f"{form}"
-            f"<a class='btn btn-outline-secondary' href='{self.path}'>Volver</a>"
-            "</form>"
-        )
+        return render_macro("detail", "Detalle Consulta", self.path, form)
 
     def save(self, form_data) -> str:
         d = form_data.get("d", "")
@@ -251,17 +232,31 @@ class Consulta:
             (form_data.get("Diagnostico") or "").strip(),
         )
 
+        # Un médico o paciente no puede tener dos consultas que se crucen
+        id_medico, id_paciente, fecha, hi, hf, _ = payload
+        if fecha and hi and hf:
+            excluir = id_ if op == "act" else None
+            try:
+                if id_medico and hay_choque(self.cn, "IdMedico", id_medico, fecha, hi, hf, excluir):
+                    return self._msg_error("El médico ya tiene una consulta en ese horario")
+                if id_paciente and hay_choque(self.cn, "IdPaciente", id_paciente, fecha, hi, hf, excluir):
+                    return self._msg_error("El paciente ya tiene una consulta en ese horario")
+            except Exception as ex:
+                return self._msg_error(f"Error SQL: {ex}")
+
         try:
             cur = self.cn.cursor()
             if op == "new":
                 cur.execute(self.sql_insert, payload)
                 self.cn.commit()
+                bump_version(self.table_name)
                 cur.close()
                 return self._msg_success("Consulta creada correctamente")
 
             if op == "act":
                 cur.execute(self.sql_update, (*payload, id_))
                 self.cn.commit()
+                bump_version(self.table_name)
                 cur.close()
                 return self._msg_success("Consulta actualizada correctamente")
 
@@ -282,6 +277,7 @@ class Consulta:
             cur = self.cn.cursor()
             cur.execute(self.sql_delete, (id,))
             self.cn.commit()
+            bump_version(self.table_name)
             cur.close()
             return self._msg_success("Consulta eliminada correctamente")
         except Exception as ex:
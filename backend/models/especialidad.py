@@ -1,9 +1,14 @@
 from __future__ import annotations
 
 import base64
-import html
 from typing import Any, Dict, List, Tuple
 
+from flask import url_for
+
+from database.cache import invalidate
+from models.render import campo, render_macro, tabla
+from models.trazas import trazado
+
 
 class Especialidad:
 
@@ -12,8 +17,21 @@ class Especialidad:
     title = "Especialidades"
     path = "/especialidades"
 
-    def __init__(self, cn):
+    # Columnas del listado: (encabezado, clave de la fila, tipo de celda)
+    list_columns = [
+        ("Descripcion", "Descripcion", "text"),
+        ("Dias", "Dias", "text"),
+        ("Franja_HI", "Franja_HI", "text"),
+        ("Franja_HF", "Franja_HF", "text"),
+    ]
+    # Tablas que alimentan el listado (su versión forma el ETag)
+    list_tables = ("especialidades",)
+
+    def __init__(self, cn, path: str | None = None):
         self.cn = cn
+        # Ruta base de los enlaces (p. ej. "/admin?m=usuarios" desde el dashboard)
+        if path is not None:
+            self.path = path
 
         self.IdEsp: int | None = None
         self.Descripcion: str = ""
@@ -49,7 +67,7 @@ class Especialidad:
             '<nav class="navbar navbar-expand-lg navbar-light bg-white shadow-sm py-2">'
             '<div class="container-fluid px-4">'
             '<a class="navbar-brand d-flex flex-column align-items-start" href="/">'
-            '<img src="/static/img/logo.png" alt="Logo Veris" class="img-fluid mb-1" '
+            f'<img src="{url_for("static", filename="img/logo.png")}" alt="Logo Veris" class="img-fluid mb-1" '
             'style="height: 35px; width: auto;">'
             "<span class='slogan'>Hacemos <strong>fácil cuidarte</strong></span>"
             "</a>"
@@ -64,93 +82,22 @@ class Especialidad:
         )
 
     def _msg_success(self, text: str) -> str:
-        return f'<div class="alert alert-success" role="alert">{html.escape(text)}</div>'
+        return render_macro("alert", "success", text)
 
     def _msg_error(self, text: str) -> str:
-        return f'<div class="alert alert-danger" role="alert">{html.escape(text)}</div>'
+        return render_macro("alert", "danger", text)
 
-    def _input(self, name: str, label: str, value: str, disabled: bool, type_: str = "text") -> str:
-        dis = " disabled" if disabled else ""
-        return (
-            '<div class="mb-3">'
-            f'<label class="form-label" for="{html.escape(name)}">{html.escape(label)}</label>'
-            f'<input class="form-control" id="{html.escape(name)}" name="{html.escape(name)}" '
-            f'type="{html.escape(type_)}" value="{html.escape(value)}"{dis} />'
-            "</div>"
-        )
+    def _input(self, name: str, label: str, value: str, disabled: bool, type_: str = "text") -> tuple:
+        return campo("input", name, label, value, disabled, type_)
 
-    def _dias_selector(self, selected: str, disabled: bool) -> str:
+    def _dias_selector(self, selected: str, disabled: bool) -> tuple:
         """UI de selección de días mediante checkboxes.
 
         Guarda en POST múltiples valores con name="Dias" y valores: L,M,X,J,V,S,D
         """
 
-        selected_set = {c for c in (selected or "") if c in "LMXJV"}
-        dis_attr = " disabled" if disabled else ""
-
-        # Orden y etiquetas
-        days = [
-            ("L", "Lunes"),
-            ("M", "Martes"),
-            ("X", "Miércoles"),
-            ("J", "Jueves"),
-            ("V", "Viernes"),
-        ]
-
-        items = ""
-        for code, label in days:
-            checked = " checked" if code in selected_set else ""
-            cid = f"dias_{code}"
-            items += (
-                '<div class="col-6 col-md-4">'
-                '<div class="form-check">'
-                f'<input class="form-check-input" type="checkbox" id="{html.escape(cid)}" name="Dias" value="{html.escape(code)}"{checked}{dis_attr}>'
-                f'<label class="form-check-label" for="{html.escape(cid)}">{html.escape(label)}</label>'
-                "</div>"
-                "</div>"
-            )
-
-        buttons = ""
-        script = ""
-        if not disabled:
-            buttons = (
-                '<div class="mt-3 d-flex gap-2">'
-                '<button type="button" class="btn btn-outline-primary btn-sm" id="btnDiasLV">Lunes a Viernes</button>'
-                '<button type="button" class="btn btn-outline-danger btn-sm" id="btnDiasClear">Limpiar</button>'
-                "</div>"
-            )
-            script = (
-                "<script>\n"
-                "document.addEventListener('DOMContentLoaded', function () {\n"
-                "  var btnLV = document.getElementById('btnDiasLV');\n"
-                "  var btnClr = document.getElementById('btnDiasClear');\n"
-                "  function setDias(codes) {\n"
-                "    var set = {};\n"
-                "    (codes || []).forEach(function (c) { set[c] = true; });\n"
-                "    document.querySelectorAll('input[name=\"Dias\"]').forEach(function (el) {\n"
-                "      el.checked = !!set[el.value];\n"
-                "    });\n"
-                "  }\n"
-                "  if (btnLV) btnLV.addEventListener('click', function () { setDias(['L','M','X','J','V']); });\n"
-                "  if (btnClr) btnClr.addEventListener('click', function () { setDias([]); });\n"
-                "});\n"
-                "</script>"
-            )
-
-        return (
-            '<div class="mb-3">'
-            '<label class="form-label">Días de Atención</label>'
-            '<div class="card shadow-sm">'
-            '<div class="card-body">'
-            '<div class="row g-2">'
-            f"{items}"
-            "</div>"
-            f"{buttons}"
-            "</div>"
-            "</div>"
-            f"{script}"
-            "</div>"
-        )
+        codes = "".join(c for c in (selected or "") if c in "LMXJV")
+        return campo("dias_selector", codes, disabled)
 
     def _fmt_time_value(self, value: Any) -> str:
         """Convierte valores TIME de MySQL a formato válido para <input type="time"> (HH:MM).
@@ -205,49 +152,16 @@ class Especialidad:
             return None
         return h * 60 + m
 
+    @trazado
     def get_list(self) -> str:
         cur = self.cn.cursor(dictionary=True)
         cur.execute(self.sql_list)
         rows: List[Dict[str, Any]] = cur.fetchall() or []
         cur.close()
 
-        d_new = self._d_encode("new", 0)
-        headers = ["Descripcion", "Dias", "Franja_HI", "Franja_HF", "Acciones"]
-        thead = "".join(f"<th>{h}</th>" for h in headers)
-
-        tbody = ""
-        for r in rows:
-            pk = int(r["IdEsp"])
-            d_act = self._d_encode("act", pk)
-            d_det = self._d_encode("det", pk)
-            d_del = self._d_encode("del", pk)
-            tbody += (
-                "<tr>"
-                f"<td>{html.escape(str(r.get('Descripcion','')))}</td>"
-                f"<td>{html.escape(str(r.get('Dias','')))}</td>"
-                f"<td>{html.escape(str(r.get('Franja_HI','')))}</td>"
-                f"<td>{html.escape(str(r.get('Franja_HF','')))}</td>"
-                "<td>"
-                f"<a class='btn btn-sm btn-primary me-1' href='{self.path}?d={d_act}'>Editar</a>"
-                f"<a class='btn btn-sm btn-outline-secondary me-1' href='{self.path}?d={d_det}'>Detalle</a>"
-                f"<a class='btn btn-sm btn-danger' href='{self.path}?d={d_del}' data-veris-confirm='¿Eliminar este registro?'>Eliminar</a>"
-                "</td>"
-                "</tr>"
-            )
-
-        return (
-            "<main class='container my-4 veris-tabla-container'>"
-            f"<h2 class='veris-tabla-title'>{html.escape(self.title)}</h2>"
-            f"<p class='veris-tabla-actions'><a class='btn veris-tabla-btn-crear' href='{self.path}?d={d_new}'>Crear nuevo</a></p>"
-            "<div class='veris-tabla-wrapper'>"
-            "<table class='table veris-tabla table-bordered table-striped'>"
-            f"<thead class='veris-tabla-thead'><tr>{thead}</tr></thead>"
-            f"<tbody class='veris-tabla-body-content'>{tbody}</tbody>"
-            "</table>"
-            "</div>"
-            "</main>"
-        )
+        return tabla(self.title, self.path, self.list_columns, rows, self.pk)
 
+    @trazado
     def get_form(self, id: int = 0) -> str:
         is_new = id == 0
         op = "new" if is_new else "act"
@@ -266,23 +180,15 @@ class Especialidad:
         values["Franja_HF"] = self._fmt_time_value(values["Franja_HF"])
 
         d = self._d_encode(op, id)
-        form = ""
+        form = []
         # No mostrar IdEsp en el formulario (se maneja internamente con d)
-        form += self._input("Descripcion", "Descripcion", values["Descripcion"], False)
-        form += self._dias_selector(values["Dias"], False)
-        form += self._input("Franja_HI", "Franja_HI", values["Franja_HI"], False, "time")
-        form += self._input("Franja_HF", "Franja_HF", values["Franja_HF"], False, "time")
+        form.append(self._input("Descripcion", "Descripcion", values["Descripcion"], False))
+        form.append(self._dias_selector(values["Dias"], False))
+        form.append(self._input("Franja_HI", "Franja_HI", values["Franja_HI"], False, "time"))
+        form.append(self._input("Franja_HF", "Franja_HF", values["Franja_HF"], False, "time"))
 
         title = "Nueva Especialidad" if is_new else "Actualizar Especialidad"
-        return (
-            f"<h2 class='mb-3'>{html.escape(title)}</h2>"
-            f"<form method='post'>"
-            f"<input type='hidden' name='d' value='{html.escape(d)}' />"
-            f"{form}"
-            "<button class='btn btn-primary' type='submit'>Guardar</button> "
-            f"<a class='btn btn-outline-secondary' href='{self.path}'>Volver</a>"
-            "</form>"
-        )
+        return render_macro("form", title, self.path, d, form)
 
     def get_detail(self, id: int) -> str:
         cur = self.cn.cursor(dictionary=True)
@@ -295,20 +201,14 @@ class Especialidad:
         franja_hi = self._fmt_time_value(row.get("Franja_HI"))
         franja_hf = self._fmt_time_value(row.get("Franja_HF"))
 
-        form = ""
+        form = []
         # No mostrar IdEsp en detalle
-        form += self._input("Descripcion", "Descripcion", str(row.get("Descripcion", "")), True)
-        form += self._dias_selector(str(row.get("Dias", "")), True)
-        form += self._input("Franja_HI", "Franja_HI", franja_hi, True, "time")
-        form += self._input("Franja_HF", "Franja_HF", franja_hf, True, "time")
+        form.append(self._input("Descripcion", "Descripcion", str(row.get("Descripcion", "")), True))
+        form.append(self._dias_selector(str(row.get("Dias", "")), True))
+        form.append(self._input("Franja_HI", "Franja_HI", franja_hi, True, "time"))
+        form.append(self._input("Franja_HF", "Franja_HF", franja_hf, True, "time"))
 
-        return (
-            f"<h2 class='mb-3'>Detalle Especialidad</h2>"
-            f"<form>"
-            f"{form}"
-            f"<a class='btn btn-outline-secondary' href='{self.path}'>Volver</a>"
-            "</form>"
-        )
+        return render_macro("detail", "Detalle Especialidad", self.path, form)
 
     def save(self, form_data) -> str:
         d = form_data.get("d", "")
@@ -358,12 +258,14 @@ class Especialidad:
             if op == "new":
                 cur.execute(self.sql_insert, (descripcion, dias, franja_hi, franja_hf))
                 self.cn.commit()
+                invalidate(self.table_name)
                 cur.close()
                 return self._msg_success("Especialidad creada correctamente")
 
             if op == "act":
                 cur.execute(self.sql_update, (descripcion, dias, franja_hi, franja_hf, id_))
                 self.cn.commit()
+                invalidate(self.table_name)
                 cur.close()
                 return self._msg_success("Especialidad actualizada correctamente")
 
@@ -384,6 +286,7 @@ class Especialidad:
             cur = self.cn.cursor()
             cur.execute(self.sql_delete, (id,))
             self.cn.commit()
+            invalidate(self.table_name)
             cur.close()
             return self._msg_success("Especialidad eliminada correctamente")
         except Exception as ex:
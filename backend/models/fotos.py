@@ -0,0 +1,506 @@
+from __future__ import annotations
+
+import base64
+import hashlib
+import math
+import os
+import re
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+
+import click
+from flask import current_app, request, url_for
+from flask.cli import with_appcontext
+from PIL import Image, ImageOps, UnidentifiedImageError
+
+from database.cache import bump_version
+from database.connection import get_connection
+from models.trazas import trazado
+
+
+# Carpeta de miniaturas dentro de static/img/usuarios
+THUMBS_DIR = "thumbs"
+
+# Formatos de Pillow según la extensión del archivo original
+_FORMATS = {".jpg": "JPEG", ".jpeg": "JPEG", ".png": "PNG", ".webp": "WEBP"}
+
+# Fotos direccionadas por contenido: "<2 car.>/<13 car.>.jpg" (base32 del
+# SHA-256 de lo subido). Son 20 caracteres, el tamaño de la columna Foto.
+_HASH_RE = re.compile(r"^[a-z2-7]{2}/[a-z2-7]{13}\.jpg$")
+
+# URLs de fotos/miniaturas direccionadas por contenido: nunca cambian
+_INMUTABLE_RE = re.compile(r"/img/usuarios/(thumbs/)?[a-z2-7]{2}/[a-z2-7]{13}(-\d+)?\.(jpg|webp)$")
+
+# Imagen que se muestra mientras una foto recién subida se procesa
+PLACEHOLDER = "img/foto-pendiente.svg"
+
+# URL de foto_url por (foto, tamaño, formato) -> (vence_en, url). Las
+# miniaturas encontradas no vencen; si faltaba se vuelve a mirar el disco
+# pasado FOTO_SIN_MINIATURA_TTL o cuando su tarea termina en este worker
+_thumb_urls: dict[tuple[str, int, str], tuple[float, str]] = {}
+
+
+# Pool de procesamiento en segundo plano, uno por proceso (ver `_pool`)
+_executor: ThreadPoolExecutor | None = None
+_executor_pid = 0
+_executor_lock = threading.Lock()
+_stats_lock = threading.Lock()
+_stats = {"pendientes": 0, "procesadas": 0, "errores": 0, "revertidas": 0, "latencia_total": 0.0, "latencia_max": 0.0}
+
+# Clave primaria de las tablas con columna Foto (para revertir una foto fallida)
+_PKS = {"pacientes": "IdPaciente", "medicos": "IdMedico"}
+_ultimo_barrido = 0.0
+
+
+def fotos_dir() -> Path:
+    return Path(current_app.static_folder) / "img" / "usuarios"  # type: ignore[arg-type]
+
+
+def staging_dir() -> Path:
+    return Path(current_app.config["FOTO_STAGING_DIR"])
+
+
+def _staged_path(filename: str) -> Path:
+    return staging_dir() / filename.replace("/", "-")
+
+
+def _thumb_name(filename: str, size: int, fmt: str) -> str:
+    # "ab/cdef.jpg" -> "thumbs/ab/cdef-64.webp" (las miniaturas siguen el mismo shard)
+    return f"{THUMBS_DIR}/{os.path.splitext(filename)[0]}-{size}.{fmt}"
+
+
+def _hash_name(sha256: bytes) -> str:
+    digest = base64.b32encode(sha256).decode("ascii").lower()
+    return f"{digest[:2]}/{digest[2:15]}.jpg"
+
+
+def _limpiar(img: Image.Image, max_px: int) -> Image.Image:
+    """Aplica la orientación EXIF, limita el tamaño y devuelve una imagen sin metadatos."""
+
+    img = ImageOps.exif_transpose(img)
+    if img.mode not in ("RGB", "RGBA"):
+        img = img.convert("RGBA" if "A" in img.getbands() or "transparency" in img.info else "RGB")
+    img.thumbnail((max_px, max_px), Image.LANCZOS)
+
+    # Copiar solo los píxeles: EXIF, XMP, ICC y textos PNG quedan fuera
+    clean = Image.new(img.mode, img.size)
+    clean.paste(img)
+    return clean
+
+
+def _rgb(img: Image.Image) -> Image.Image:
+    """Aplana la transparencia sobre blanco (JPEG no soporta alfa)."""
+
+    if img.mode == "RGB":
+        return img
+    bg = Image.new("RGB", img.size, (255, 255, 255))
+    bg.paste(img, mask=img.getchannel("A"))
+    return bg
+
+
+def _save(img: Image.Image, path: Path, fmt: str) -> None:
+    """Guarda en un temporal y lo renombra: nunca se sirve un archivo a medias."""
+
+    path.parent.mkdir(parents=True, exist_ok=True)
+    tmp = path.with_name(f".{path.name}.{os.getpid()}.tmp")
+    if fmt == "JPEG":
+        _rgb(img).save(tmp, "JPEG", quality=85, optimize=True, progressive=True)
+    elif fmt == "WEBP":
+        img.save(tmp, "WEBP", quality=80, method=6)
+    else:
+        img.save(tmp, fmt, optimize=True)
+    os.replace(tmp, path)
+
+
+def make_thumbnails(img: Image.Image, filename: str, folder: Path | None = None) -> None:
+    """Genera las miniaturas WebP y JPEG de FOTO_THUMB_SIZES para `filename`."""
+
+    folder = folder or fotos_dir()
+    for size in current_app.config["FOTO_THUMB_SIZES"]:
+        # Se conserva la proporción: las vistas recortan con CSS (object-fit)
+        thumb = img.copy()
+        thumb.thumbnail((size, size), Image.LANCZOS)
+        _save(thumb, folder / _thumb_name(filename, size, "webp"), "WEBP")
+        _save(thumb, folder / _thumb_name(filename, size, "jpg"), "JPEG")
+
+
+def _procesar(staged: Path, filename: str, folder: Path) -> None:
+    """Genera el original limpio y sus miniaturas desde la copia en staging."""
+
+    with Image.open(staged) as src:
+        img = _limpiar(src, current_app.config["FOTO_MAX_PX"])
+    make_thumbnails(img, filename, folder)
+    _save(img, folder / filename, "JPEG")
+
+
+def _pool() -> ThreadPoolExecutor:
+    """Pool de este proceso: tras un fork de gunicorn los hilos del padre no existen."""
+
+    global _executor, _executor_pid
+    if _executor is None or _executor_pid != os.getpid():
+        with _executor_lock:
+            if _executor is None or _executor_pid != os.getpid():
+                _executor = ThreadPoolExecutor(
+                    max_workers=current_app.config["FOTO_WORKERS"], thread_name_prefix="fotos"
+                )
+                _executor_pid = os.getpid()
+    return _executor
+
+
+def _revertir(app, filename: str, registro: tuple[str, int], anterior: str) -> None:
+    """Vuelve la columna Foto del registro a `anterior` si sigue apuntando a `filename`."""
+
+    tabla, id_ = registro
+    with app.app_context(), get_connection(app) as cn:
+        cur = cn.cursor()
+        cur.execute(f"UPDATE {tabla} SET Foto=%s WHERE {_PKS[tabla]}=%s AND Foto=%s", (anterior, id_, filename))
+        cambiadas = cur.rowcount
+        cn.commit()
+        cur.close()
+        if cambiadas:
+            bump_version(tabla)
+    app.logger.warning("Foto %s descartada: %s %s vuelve a %r", filename, tabla, id_, anterior)
+
+
+def _tarea(
+    app, staged: Path, filename: str, folder: Path, encolada: float,
+    registro: tuple[str, int] | None = None, anterior: str = "",
+) -> None:
+    intentos = app.config["FOTO_REINTENTOS"]
+    ok = revertida = False
+    try:
+        for intento in range(1, intentos + 1):
+            try:
+                with app.app_context():
+                    _procesar(staged, filename, folder)
+                ok = True
+                break
+            except Exception:
+                app.logger.exception("No se pudo procesar la foto %s (intento %d de %d)", filename, intento, intentos)
+                if intento < intentos:
+                    time.sleep(intento)
+        # Sin original el registro mostraría PLACEHOLDER para siempre
+        if not ok and registro is not None:
+            try:
+                _revertir(app, filename, registro, anterior)
+                revertida = True
+            except Exception:
+                app.logger.exception("No se pudo revertir la foto %s de %s %s", filename, *registro)
+    finally:
+        staged.unlink(missing_ok=True)
+
+    if ok:
+        _olvidar_urls(filename, app.config["FOTO_THUMB_SIZES"])
+
+    latencia = time.monotonic() - encolada
+    with _stats_lock:
+        _stats["pendientes"] -= 1
+        _stats["procesadas" if ok else "errores"] += 1
+        _stats["revertidas"] += revertida
+        _stats["latencia_total"] += latencia
+        _stats["latencia_max"] = max(_stats["latencia_max"], latencia)
+
+
+@trazado
+def stage_foto(file) -> str:
+    """Copia una foto subida a staging y devuelve el nombre a guardar en la columna Foto.
+
+    El nombre sale del hash del archivo subido, en un subdirectorio (shard)
+    por sus dos primeros caracteres: dos subidas idénticas comparten archivo y
+    ninguna sobrescribe a otra. Solo se lee la cabecera de la imagen; nada
+    llega a static/ hasta `promote_foto`, que se llama después del commit.
+    Lanza ValueError si no es una imagen.
+    """
+
+    folder = staging_dir()
+    folder.mkdir(parents=True, exist_ok=True)
+    _barrer_si_toca()
+
+    # Copia por bloques calculando el hash (el tamaño ya lo limita MAX_CONTENT_LENGTH)
+    tmp = folder / f".subida.{os.getpid()}.{threading.get_ident()}.tmp"
+    digest = hashlib.sha256()
+    with open(tmp, "wb") as out:
+        for chunk in iter(lambda: file.stream.read(64 * 1024), b""):
+            digest.update(chunk)
+            out.write(chunk)
+    filename = _hash_name(digest.digest())
+
+    # La decodificación queda para el pool; DecompressionBombError salta por dimensiones
+    try:
+        with Image.open(tmp):
+            pass
+    except (UnidentifiedImageError, Image.DecompressionBombError, OSError) as ex:
+        tmp.unlink(missing_ok=True)
+        raise ValueError("El archivo no es una imagen válida") from ex
+
+    try:
+        # Deduplicación: ya está publicada. Se renueva su mtime para que
+        # fotos-gc no la borre antes de que se guarde el registro que la usa.
+        os.utime(fotos_dir() / filename)
+        tmp.unlink()
+    except FileNotFoundError:
+        os.replace(tmp, _staged_path(filename))
+    return filename
+
+
+@trazado
+def promote_foto(filename: str, registro: tuple[str, int] | None = None, anterior: str = "") -> None:
+    """Publica una foto de staging tras el commit: el JPEG sin metadatos (lado
+    mayor FOTO_MAX_PX) y sus miniaturas se generan en el pool de fondo y
+    mientras tanto las vistas muestran PLACEHOLDER. Si la cola está llena se
+    procesa en la misma petición.
+
+    `registro` es (tabla, id) de la fila que guardó la foto: si el
+    procesamiento falla FOTO_REINTENTOS veces, su Foto vuelve a `anterior`.
+    """
+
+    folder = fotos_dir()
+    staged = _staged_path(filename)
+    if not filename or (folder / filename).is_file() or not staged.is_file():
+        return
+
+    with _stats_lock:
+        lleno = _stats["pendientes"] >= current_app.config["FOTO_QUEUE_MAX"]
+        _stats["pendientes"] += 1
+    app = current_app._get_current_object()  # type: ignore[attr-defined]
+    if lleno:
+        _tarea(app, staged, filename, folder, time.monotonic(), registro, anterior)
+    else:
+        _pool().submit(_tarea, app, staged, filename, folder, time.monotonic(), registro, anterior)
+
+
+def sweep_staging(max_age: int) -> int:
+    """Borra las subidas de staging más antiguas que `max_age` segundos (nunca promovidas)."""
+
+    limite = time.time() - max_age
+    borradas = 0
+    for path in staging_dir().glob("*"):
+        try:
+            if path.stat().st_mtime < limite:
+                path.unlink()
+                borradas += 1
+        except FileNotFoundError:
+            pass  # la promovió o la borró otro worker
+    return borradas
+
+
+def _barrer_si_toca() -> None:
+    """Barrido periódico de staging en el pool, como mucho cada FOTO_STAGING_MAX_AGE / 4."""
+
+    global _ultimo_barrido
+    max_age = current_app.config["FOTO_STAGING_MAX_AGE"]
+    now = time.monotonic()
+    if now - _ultimo_barrido < max_age / 4:
+        return
+    _ultimo_barrido = now
+    app = current_app._get_current_object()  # type: ignore[attr-defined]
+
+    def barrer():
+        with app.app_context():
+            sweep_staging(max_age)
+
+    _pool().submit(barrer)
+
+
+def cola_stats() -> dict:
+    """Profundidad de la cola y latencia (encolado -> listo) del pool de fotos."""
+
+    with _stats_lock:
+        s = dict(_stats)
+    hechas = s["procesadas"] + s["errores"]
+    return {
+        "pendientes": s["pendientes"],
+        "procesadas": s["procesadas"],
+        "errores": s["errores"],
+        "revertidas": s["revertidas"],
+        "latencia_media_ms": round(s["latencia_total"] * 1000 / hechas, 1) if hechas else 0.0,
+        "latencia_max_ms": round(s["latencia_max"] * 1000, 1),
+    }
+
+
+def foto_url(filename: str, size: int | None = None, fmt: str = "jpg") -> str:
+    """Filtro Jinja `foto_url`: URL de la miniatura `size` de una foto.
+
+    Si la miniatura no existe: para "jpg" se devuelve la foto original (o
+    PLACEHOLDER si aún se procesa) y para "webp" una cadena vacía (la
+    plantilla omite el <source>).
+    """
+
+    if not filename:
+        return ""
+    if size is None:
+        return f"{current_app.static_url_path}/img/usuarios/{filename}"
+
+    # Se llama dos veces por fila del listado: se resuelve una vez por worker
+    now = time.monotonic()
+    hit = _thumb_urls.get((filename, size, fmt))
+    if hit is not None and hit[0] > now:
+        return hit[1]
+
+    base = f"{current_app.static_url_path}/img/usuarios/"
+    name = _thumb_name(filename, size, fmt)
+    folder = os.path.join(current_app.static_folder, "img", "usuarios")  # type: ignore[arg-type]
+    if os.path.isfile(os.path.join(folder, name)):
+        vence, url = math.inf, base + name
+    else:
+        vence = now + current_app.config["FOTO_SIN_MINIATURA_TTL"]
+        if fmt != "jpg":
+            url = ""
+        elif _HASH_RE.match(filename) and not os.path.isfile(os.path.join(folder, filename)):
+            # Sin miniatura ni original: la foto todavía se está procesando
+            url = url_for("static", filename=PLACEHOLDER)
+        else:
+            url = base + filename
+    _thumb_urls[(filename, size, fmt)] = (vence, url)
+    return url
+
+
+def _olvidar_urls(filename: str, sizes) -> None:
+    for size in sizes:
+        for fmt in ("webp", "jpg"):
+            _thumb_urls.pop((filename, size, fmt), None)
+
+
+@click.command("fotos-backfill")
+@click.option("--force", is_flag=True, help="Regenerar miniaturas aunque ya existan.")
+@with_appcontext
+def fotos_backfill(force: bool) -> None:
+    """Limpia metadatos, limita el tamaño y genera miniaturas de las fotos existentes."""
+
+    folder = fotos_dir()
+    max_px = current_app.config["FOTO_MAX_PX"]
+    sizes = current_app.config["FOTO_THUMB_SIZES"]
+    antes = despues = procesadas = 0
+
+    for path in sorted(folder.iterdir()):
+        fmt = _FORMATS.get(path.suffix.lower())
+        if not path.is_file() or not fmt:
+            continue
+
+        tiene_thumbs = all((folder / _thumb_name(path.name, s, f)).is_file() for s in sizes for f in ("webp", "jpg"))
+        size_before = path.stat().st_size
+        try:
+            with Image.open(path) as src:
+                sucia = bool(src.info.get("exif") or src.info.get("icc_profile") or src.getexif())
+                grande = max(src.size) > max_px
+                # JPEG de más de ~1 byte por píxel: calidad excesiva para una foto de perfil
+                pesada = fmt == "JPEG" and size_before > src.size[0] * src.size[1]
+                if not (sucia or grande or pesada or force or not tiene_thumbs):
+                    continue
+                img = _limpiar(src, max_px)
+        except (UnidentifiedImageError, OSError) as ex:
+            click.echo(f"  omitida {path.name}: {ex}")
+            continue
+
+        # El nombre está referenciado en la BD: se reescribe en su mismo formato.
+        # Si solo era pesada, se conserva el original cuando el nuevo no es menor.
+        if sucia or grande or pesada:
+            tmp = path.with_name(f".{path.name}.backfill")
+            _save(img, tmp, fmt)
+            if sucia or grande or tmp.stat().st_size < size_before:
+                tmp.replace(path)
+            else:
+                tmp.unlink()
+        make_thumbnails(img, path.name, folder)
+
+        antes += size_before
+        despues += path.stat().st_size
+        procesadas += 1
+        click.echo(f"  {path.name}: {size_before // 1024} KB -> {path.stat().st_size // 1024} KB")
+
+    click.echo(f"{procesadas} fotos procesadas ({antes // 1024} KB -> {despues // 1024} KB)")
+
+
+@click.command("fotos-sweep")
+@click.option("--max-age", default=None, type=int, help="Segundos (por defecto FOTO_STAGING_MAX_AGE).")
+@with_appcontext
+def fotos_sweep(max_age: int | None) -> None:
+    """Borra de staging las fotos subidas que nunca se guardaron (p. ej. registros rechazados)."""
+
+    n = sweep_staging(current_app.config["FOTO_STAGING_MAX_AGE"] if max_age is None else max_age)
+    click.echo(f"{n} archivos borrados de {staging_dir()}")
+
+
+@click.command("fotos-gc")
+@click.option("--dry-run", is_flag=True, help="Solo listar lo que se borraría.")
+@click.option("--min-age", default=3600, show_default=True, help="Segundos de gracia para fotos recién subidas.")
+@with_appcontext
+def fotos_gc(dry_run: bool, min_age: int) -> None:
+    """Borra fotos direccionadas por contenido que ya no usa ningún paciente ni médico.
+
+    Solo recorre los shards (las fotos antiguas con nombre plano no se tocan).
+    El período de gracia evita borrar una foto subida cuyo registro aún no se
+    ha guardado (una subida duplicada renueva el mtime) y cada original se
+    vuelve a buscar en la base justo antes de borrarlo.
+    """
+
+    with get_connection(current_app) as cn:
+        cur = cn.cursor()
+        cur.execute("SELECT Foto FROM pacientes UNION SELECT Foto FROM medicos")
+        referenced = {str(r[0]) for r in cur.fetchall() or [] if r[0]}
+        cur.close()
+
+    folder = fotos_dir()
+    limite = time.time() - min_age
+    borradas = liberado = 0
+
+    huerfanas: set[str] = set()
+
+    def borrar(path: Path) -> None:
+        nonlocal borradas, liberado
+        name = path.relative_to(folder).as_posix()
+        liberado += path.stat().st_size
+        borradas += 1
+        click.echo(f"  {'(dry-run) ' if dry_run else ''}{name}")
+        if not dry_run:
+            path.unlink()
+            _olvidar_urls(name, current_app.config["FOTO_THUMB_SIZES"])
+
+    def en_uso(name: str) -> bool:
+        # La lista de referencias se leyó al empezar: pudo guardarse un registro después
+        with get_connection(current_app) as cn:
+            cur = cn.cursor()
+            cur.execute(
+                "SELECT 1 FROM pacientes WHERE Foto=%s UNION ALL SELECT 1 FROM medicos WHERE Foto=%s LIMIT 1",
+                (name, name),
+            )
+            row = cur.fetchone()
+            cur.close()
+        return row is not None
+
+    # Originales sin referencia
+    for path in sorted(folder.glob("??/*.jpg")):
+        name = path.relative_to(folder).as_posix()
+        if _HASH_RE.match(name) and name not in referenced and path.stat().st_mtime < limite:
+            if en_uso(name) or path.stat().st_mtime >= limite:
+                continue
+            huerfanas.add(name)
+            borrar(path)
+
+    # Miniaturas cuyo original se borró arriba o ya no existe
+    for path in sorted((folder / THUMBS_DIR).glob("??/*")):
+        name = f"{path.parent.name}/{path.stem.rsplit('-', 1)[0]}.jpg"
+        if name in huerfanas or (not (folder / name).exists() and path.stat().st_mtime < limite):
+            borrar(path)
+
+    click.echo(f"{borradas} archivos {'a borrar' if dry_run else 'borrados'} ({liberado // 1024} KB)")
+
+
+def _cache_headers(response):
+    """Caché de un año e `immutable` para fotos y miniaturas direccionadas por contenido."""
+
+    if response.status_code in (200, 304) and _INMUTABLE_RE.search(request.path):
+        response.headers["Cache-Control"] = "public, max-age=31536000, immutable"
+    return response
+
+
+def init_app(app) -> None:
+    """Registra el filtro `foto_url`, los comandos y las cabeceras de caché (el pool se crea al primer uso)."""
+
+    app.jinja_env.filters["foto_url"] = foto_url
+    app.cli.add_command(fotos_backfill)
+    app.cli.add_command(fotos_gc)
+    app.cli.add_command(fotos_sweep)
+    app.after_request(_cache_headers)
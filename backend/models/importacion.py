@@ -0,0 +1,325 @@
+from __future__ import annotations
+
+import csv
+from typing import Any, Dict, Iterable, List, Tuple
+
+from database.cache import bump_version, get_reference, invalidate
+from models.medico import Medico
+from models.paciente import Paciente
+from models.usuario import LOGIN_KEY_MAX, login_key
+
+
+class Importacion:
+    """Carga masiva desde CSV de pacientes, médicos y medicamentos.
+
+    Las filas se validan en memoria con las mismas reglas que los formularios,
+    la unicidad se consulta por lotes (`IN (...)`) y cada lote se inserta con
+    `executemany` en una sola transacción.
+    """
+
+    # Columnas esperadas en el CSV de cada tipo (la primera fila es el encabezado)
+    columnas = {
+        "pacientes": ("Usuario", "Password", "Nombre", "Cedula", "Edad", "Genero", "Estatura_cm", "Peso_kg"),
+        "medicos": ("Usuario", "Password", "Nombre", "Especialidad"),
+        "medicamentos": ("Nombre", "Tipo"),
+    }
+
+    def __init__(self, cn, chunk_size: int = 500):
+        self.cn = cn
+        self.chunk_size = chunk_size
+
+        # Se reutilizan los validadores de los modelos (no consultan la BD)
+        self._paciente = Paciente(cn)
+        self._medico = Medico(cn)
+
+        self.insertados = 0
+        self.errores: List[Tuple[int, str]] = []
+
+    # ------------------------------------------------------------------
+    # Utilidades
+    # ------------------------------------------------------------------
+    def _placeholders(self, n: int) -> str:
+        return ",".join(["%s"] * n)
+
+    def _existentes(self, sql: str, values: List[Any]) -> set:
+        """Ejecuta `sql` con un IN (...) de `values` y devuelve la primera columna en minúsculas."""
+
+        if not values:
+            return set()
+        cur = self.cn.cursor()
+        cur.execute(sql.format(self._placeholders(len(values))), tuple(values))
+        found = {str(r[0]).lower() for r in cur.fetchall() or []}
+        cur.close()
+        return found
+
+    def _error(self, fila: int, mensaje: str) -> None:
+        self.errores.append((fila, mensaje))
+
+    def _chunks(self, rows: Iterable[Tuple[int, Dict[str, Any]]]):
+        chunk: List[Tuple[int, Dict[str, Any]]] = []
+        for item in rows:
+            chunk.append(item)
+            if len(chunk) >= self.chunk_size:
+                yield chunk
+                chunk = []
+        if chunk:
+            yield chunk
+
+    def _insert_usuarios(self, chunk: List[Tuple[int, Dict[str, Any]]], rol: int) -> Dict[str, int]:
+        """Inserta los usuarios del lote y devuelve {clave de login: IdUsuario}."""
+
+        cur = self.cn.cursor()
+        cur.executemany(
+            "INSERT INTO usuarios(Nombre, NombreClave, Password, Rol) VALUES(%s,%s,%s,%s)",
+            [(r["Usuario"], login_key(r["Usuario"]), r["Password"], rol) for _, r in chunk],
+        )
+        # Los Id autoincrementales de un INSERT múltiple no se garantizan
+        # consecutivos: se recuperan por clave.
+        claves = [login_key(r["Usuario"]) for _, r in chunk]
+        cur.execute(
+            f"SELECT IdUsuario, NombreClave FROM usuarios WHERE NombreClave IN ({self._placeholders(len(claves))})",
+            tuple(claves),
+        )
+        ids = {str(clave): int(id_) for id_, clave in cur.fetchall() or []}
+        cur.close()
+        return ids
+
+    def _commit_chunk(self, chunk: List[Tuple[int, Dict[str, Any]]], insert) -> None:
+        """Ejecuta `insert(chunk)` en una transacción; si falla, todo el lote queda con error."""
+
+        if not chunk:
+            return
+        try:
+            insert(chunk)
+            self.cn.commit()
+            self.insertados += len(chunk)
+        except Exception as ex:
+            self.cn.rollback()
+            for fila, _ in chunk:
+                self._error(fila, f"Error SQL en el lote: {ex}")
+
+    # ------------------------------------------------------------------
+    # Validación en memoria (sin consultas)
+    # ------------------------------------------------------------------
+    def _validar_usuario(self, row: Dict[str, Any], vistos: set) -> str | None:
+        if not row["Usuario"] or not row["Password"]:
+            return "Usuario y contraseña son obligatorios"
+        key = login_key(row["Usuario"])
+        if len(key) > LOGIN_KEY_MAX:
+            return "Nombre de usuario demasiado largo"
+        if key in vistos:
+            return "Usuario repetido en el archivo"
+        vistos.add(key)
+        return None
+
+    def _validar_paciente(self, row: Dict[str, Any], usuarios: set, cedulas: set) -> str | None:
+        err = self._validar_usuario(row, usuarios)
+        if err:
+            return err
+
+        row["Nombre"] = " ".join(row["Nombre"].split())
+        if not self._paciente._validar_nombre_paciente(row["Nombre"]):
+            return "Nombre inválido. Use el formato: Nombre Apellido (solo letras, iniciales en mayúscula)"
+        if not self._paciente._validar_cedula_ec(row["Cedula"]):
+            return "Cédula inválida o fuera de rango"
+        if row["Cedula"] in cedulas:
+            return "Cédula repetida en el archivo"
+        cedulas.add(row["Cedula"])
+        if row["Genero"] not in ("Masculino", "Femenino"):
+            return "Género inválido. Use Masculino o Femenino"
+
+        try:
+            row["Edad"] = int(row["Edad"])
+            # Estatura y peso son NOT NULL en la tabla pacientes
+            row["Estatura_cm"] = float(row["Estatura_cm"])
+            row["Peso_kg"] = float(row["Peso_kg"])
+        except ValueError:
+            return "Edad, estatura y peso deben ser numéricos"
+
+        if row["Edad"] < 0 or row["Edad"] > 120:
+            return "Edad inválida. Debe estar entre 0 y 120"
+        if row["Estatura_cm"] < 30 or row["Estatura_cm"] > 250:
+            return "Estatura inválida. Debe estar entre 30 y 250 cm"
+        if row["Peso_kg"] < 0 or row["Peso_kg"] > 300:
+            return "Peso inválido. Debe estar entre 0 y 300 kg"
+        return None
+
+    def _validar_medico(self, row: Dict[str, Any], usuarios: set, especialidades: Dict[str, int]) -> str | None:
+        err = self._validar_usuario(row, usuarios)
+        if err:
+            return err
+
+        if not self._medico._validar_nombre_medico(row["Nombre"]):
+            return "Nombre inválido. Debe tener el formato: Dr/a. Nombre Apellido"
+        # La especialidad puede venir como IdEsp o como descripción
+        id_esp = especialidades.get(row["Especialidad"].lower())
+        if id_esp is None:
+            return "Especialidad no encontrada"
+        row["Especialidad"] = id_esp
+        return None
+
+    def _validar_medicamento(self, row: Dict[str, Any], nombres: set) -> str | None:
+        if not row["Nombre"] or not row["Tipo"]:
+            return "Nombre y tipo son obligatorios"
+        key = row["Nombre"].lower()
+        if key in nombres:
+            return "Medicamento repetido en el archivo"
+        nombres.add(key)
+        return None
+
+    # ------------------------------------------------------------------
+    # Carga por tipo
+    # ------------------------------------------------------------------
+    def _filtrar_existentes(self, chunk, campo: str, existentes: set, mensaje: str):
+        ok = []
+        for fila, row in chunk:
+            if str(row[campo]).lower() in existentes:
+                self._error(fila, mensaje)
+            else:
+                ok.append((fila, row))
+        return ok
+
+    def _filtrar_usuarios(self, chunk, usados: set):
+        ok = []
+        for fila, row in chunk:
+            if login_key(row["Usuario"]) in usados:
+                self._error(fila, "Ese usuario ya existe")
+            else:
+                ok.append((fila, row))
+        return ok
+
+    def _cargar_pacientes(self, rows) -> None:
+        def insert(chunk):
+            ids = self._insert_usuarios(chunk, 3)
+            cur = self.cn.cursor()
+            cur.executemany(
+                "INSERT INTO pacientes(IdUsuario, Nombre, Cedula, Edad, Genero, `Estatura (cm)`, `Peso (kg)`, Foto) "
+                "VALUES(%s,%s,%s,%s,%s,%s,%s,%s)",
+                [
+                    (
+                        ids[login_key(r["Usuario"])],
+                        r["Nombre"],
+                        r["Cedula"],
+                        r["Edad"],
+                        r["Genero"],
+                        r["Estatura_cm"],
+                        r["Peso_kg"],
+                        "",
+                    )
+                    for _, r in chunk
+                ],
+            )
+            cur.close()
+
+        for chunk in self._chunks(rows):
+            usados = self._existentes(
+                "SELECT NombreClave FROM usuarios WHERE NombreClave IN ({})", [login_key(r["Usuario"]) for _, r in chunk]
+            )
+            chunk = self._filtrar_usuarios(chunk, usados)
+            cedulas = self._existentes(
+                "SELECT Cedula FROM pacientes WHERE Cedula IN ({})", [int(r["Cedula"]) for _, r in chunk]
+            )
+            # Cedula es INT en la BD: comparar sin ceros a la izquierda
+            ok = []
+            for fila, row in chunk:
+                if str(int(row["Cedula"])) in cedulas:
+                    self._error(fila, "Ya existe un paciente con esa cédula")
+                else:
+                    ok.append((fila, row))
+            self._commit_chunk(ok, insert)
+
+    def _cargar_medicos(self, rows) -> None:
+        def insert(chunk):
+            ids = self._insert_usuarios(chunk, 2)
+            cur = self.cn.cursor()
+            cur.executemany(
+                "INSERT INTO medicos(Nombre, Especialidad, IdUsuario, Foto) VALUES(%s,%s,%s,%s)",
+                [(r["Nombre"], r["Especialidad"], ids[login_key(r["Usuario"])], "") for _, r in chunk],
+            )
+            cur.close()
+
+        for chunk in self._chunks(rows):
+            usados = self._existentes(
+                "SELECT NombreClave FROM usuarios WHERE NombreClave IN ({})", [login_key(r["Usuario"]) for _, r in chunk]
+            )
+            chunk = self._filtrar_usuarios(chunk, usados)
+            self._commit_chunk(chunk, insert)
+
+    def _cargar_medicamentos(self, rows) -> None:
+        def insert(chunk):
+            cur = self.cn.cursor()
+            cur.executemany(
+                "INSERT INTO medicamentos(Nombre, Tipo) VALUES(%s,%s)",
+                [(r["Nombre"], r["Tipo"]) for _, r in chunk],
+            )
+            cur.close()
+
+        for chunk in self._chunks(rows):
+            usados = self._existentes(
+                "SELECT Nombre FROM medicamentos WHERE Nombre IN ({})", [r["Nombre"] for _, r in chunk]
+            )
+            chunk = self._filtrar_existentes(chunk, "Nombre", usados, "El medicamento ya existe")
+            self._commit_chunk(chunk, insert)
+
+    def _especialidades(self) -> Dict[str, int]:
+        result: Dict[str, int] = {}
+        for r in get_reference("especialidades", self.cn):
+            result[str(r["IdEsp"])] = int(r["IdEsp"])
+            result[str(r["Descripcion"]).lower()] = int(r["IdEsp"])
+        return result
+
+    def importar(self, tipo: str, lines: Iterable[str]) -> Dict[str, Any]:
+        """Importa el CSV (`lines`, texto ya decodificado) y devuelve el reporte.
+
+        Reporte: {"total", "insertados", "errores": [(fila, mensaje), ...]} donde
+        `fila` es el número de línea del archivo (el encabezado es la 1); si un
+        campo entre comillas ocupa varias líneas, se usa la última del registro.
+        """
+
+        if tipo not in self.columnas:
+            raise ValueError(f"Tipo de importación no soportado: {tipo}")
+
+        reader = csv.DictReader(lines)
+        faltantes = [c for c in self.columnas[tipo] if c not in (reader.fieldnames or [])]
+        if faltantes:
+            raise ValueError("Faltan columnas en el CSV: " + ", ".join(faltantes))
+
+        usuarios: set = set()
+        cedulas: set = set()
+        nombres: set = set()
+        especialidades = self._especialidades() if tipo == "medicos" else {}
+
+        total = 0
+        validas: List[Tuple[int, Dict[str, Any]]] = []
+        for raw in reader:
+            # line_num cuenta líneas físicas, no registros
+            fila = reader.line_num
+            total += 1
+            row = {c: (raw.get(c) or "").strip() for c in self.columnas[tipo]}
+            if tipo == "pacientes":
+                err = self._validar_paciente(row, usuarios, cedulas)
+            elif tipo == "medicos":
+                err = self._validar_medico(row, usuarios, especialidades)
+            else:
+                err = self._validar_medicamento(row, nombres)
+
+            if err:
+                self._error(fila, err)
+            else:
+                validas.append((fila, row))
+
+        if tipo == "pacientes":
+            self._cargar_pacientes(validas)
+        elif tipo == "medicos":
+            self._cargar_medicos(validas)
+        else:
+            self._cargar_medicamentos(validas)
+
+        if self.insertados:
+            if tipo == "medicamentos":
+                invalidate("medicamentos")
+            else:
+                bump_version("usuarios", tipo)
+
+        self.errores.sort()
+        return {"total": total, "insertados": self.insertados, "errores": self.errores}
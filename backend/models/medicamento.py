@@ -1,9 +1,14 @@
 from __future__ import annotations
 
 import base64
-import html
 from typing import Any, Dict, List, Tuple
 
+from flask import url_for
+
+from database.cache import invalidate
+from models.render import campo, render_macro, tabla
+from models.trazas import trazado
+
 
 class Medicamento:
 
@@ -12,8 +17,18 @@ class Medicamento:
     title = "Medicamentos"
     path = "/medicamentos"
 
-    def __init__(self, cn):
+    # Columnas del listado: (encabezado, clave de la fila, tipo de celda)
+    list_columns = [("Nombre", "Nombre", "text"), ("Tipo", "Tipo", "text")]
+    # Tablas que alimentan el listado (su versión forma el ETag)
+    list_tables = ("medicamentos",)
+    # Campos de formulario/detalle: (name, etiqueta, tipo de input)
+    form_fields = [("Nombre", "Nombre", "text"), ("Tipo", "Tipo", "text")]
+
+    def __init__(self, cn, path: str | None = None):
         self.cn = cn
+        # Ruta base de los enlaces (p. ej. "/admin?m=usuarios" desde el dashboard)
+        if path is not None:
+            self.path = path
 
         self.IdMedicamento: int | None = None
         self.Nombre: str = ""
@@ -47,7 +62,7 @@ class Medicamento:
             '<nav class="navbar navbar-expand-lg navbar-light bg-white shadow-sm py-2">'
             '<div class="container-fluid px-4">'
             '<a class="navbar-brand d-flex flex-column align-items-start" href="/">'
-            '<img src="/static/img/logo.png" alt="Logo Veris" class="img-fluid mb-1" '
+            f'<img src="{url_for("static", filename="img/logo.png")}" alt="Logo Veris" class="img-fluid mb-1" '
             'style="height: 35px; width: auto;">'
             "<span class='slogan'>Hacemos <strong>fácil cuidarte</strong></span>"
             "</a>"
@@ -62,62 +77,24 @@ class Medicamento:
         )
 
     def _msg_success(self, text: str) -> str:
-        return f'<div class="alert alert-success" role="alert">{html.escape(text)}</div>'
+        return render_macro("alert", "success", text)
 
     def _msg_error(self, text: str) -> str:
-        return f'<div class="alert alert-danger" role="alert">{html.escape(text)}</div>'
+        return render_macro("alert", "danger", text)
 
-    def _input(self, name: str, label: str, value: str, disabled: bool, type_: str = "text") -> str:
-        dis = " disabled" if disabled else ""
-        return (
-            '<div class="mb-3">'
-            f'<label class="form-label" for="{html.escape(name)}">{html.escape(label)}</label>'
-            f'<input class="form-control" id="{html.escape(name)}" name="{html.escape(name)}" '
-            f'type="{html.escape(type_)}" value="{html.escape(value)}"{dis} />'
-            "</div>"
-        )
+    def _input(self, name: str, label: str, value: str, disabled: bool, type_: str = "text") -> tuple:
+        return campo("input", name, label, value, disabled, type_)
 
+    @trazado
     def get_list(self) -> str:
         cur = self.cn.cursor(dictionary=True)
         cur.execute(self.sql_list)
         rows: List[Dict[str, Any]] = cur.fetchall() or []
         cur.close()
 
-        d_new = self._d_encode("new", 0)
-        headers = ["Nombre", "Tipo", "Acciones"]
-        thead = "".join(f"<th>{h}</th>" for h in headers)
-
-        tbody = ""
-        for r in rows:
-            pk = int(r["IdMedicamento"])
-            d_act = self._d_encode("act", pk)
-            d_det = self._d_encode("det", pk)
-            d_del = self._d_encode("del", pk)
-            tbody += (
-                "<tr>"
-                f"<td>{html.escape(str(r.get('Nombre','')))}</td>"
-                f"<td>{html.escape(str(r.get('Tipo','')))}</td>"
-                "<td>"
-                f"<a class='btn btn-sm btn-primary me-1' href='{self.path}?d={d_act}'>Editar</a>"
-                f"<a class='btn btn-sm btn-outline-secondary me-1' href='{self.path}?d={d_det}'>Detalle</a>"
-                f"<a class='btn btn-sm btn-danger' href='{self.path}?d={d_del}' data-veris-confirm='¿Eliminar este registro?'>Eliminar</a>"
-                "</td>"
-                "</tr>"
-            )
-
-        return (
-            "<main class='container my-4 veris-tabla-container'>"
-            f"<h2 class='veris-tabla-title'>{html.escape(self.title)}</h2>"
-            f"<p class='veris-tabla-actions'><a class='btn veris-tabla-btn-crear' href='{self.path}?d={d_new}'>Crear nuevo</a></p>"
-            "<div class='veris-tabla-wrapper'>"
-            "<table class='table veris-tabla table-bordered table-striped'>"
-            f"<thead class='veris-tabla-thead'><tr>{thead}</tr></thead>"
-            f"<tbody class='veris-tabla-body-content'>{tbody}</tbody>"
-            "</table>"
-            "</div>"
-            "</main>"
-        )
+        return tabla(self.title, self.path, self.list_columns, rows, self.pk)
 
+    @trazado
     def get_form(self, id: int = 0) -> str:
         is_new = id == 0
         op = "new" if is_new else "act"
@@ -133,21 +110,11 @@ class Medicamento:
                 values[k] = "" if row.get(k) is None else str(row.get(k))
 
         d = self._d_encode(op, id)
-        form = ""
         # No mostrar IdMedicamento en el formulario (se maneja internamente con d)
-        form += self._input("Nombre", "Nombre", values["Nombre"], False)
-        form += self._input("Tipo", "Tipo", values["Tipo"], False)
+        form = [campo("fields", self.form_fields, values)]
 
         title = "Nuevo Medicamento" if is_new else "Actualizar Medicamento"
-        return (
-            f"<h2 class='mb-3'>{html.escape(title)}</h2>"
-            f"<form method='post'>"
-            f"<input type='hidden' name='d' value='{html.escape(d)}' />"
-            f"{form}"
-            "<button class='btn btn-primary' type='submit'>Guardar</button> "
-            f"<a class='btn btn-outline-secondary' href='{self.path}'>Volver</a>"
-            "</form>"
-        )
+        return render_macro("form", title, self.path, d, form)
 
     def get_detail(self, id: int) -> str:
         cur = self.cn.cursor(dictionary=True)
@@ -157,18 +124,11 @@ class Medicamento:
         if not row:
             return self._msg_error("Registro no encontrado")
 
-        form = ""
         # No mostrar IdMedicamento en detalle
-        form += self._input("Nombre", "Nombre", str(row.get("Nombre", "")), True)
-        form += self._input("Tipo", "Tipo", str(row.get("Tipo", "")), True)
+        values = {k: str(row.get(k, "")) for k, _, _ in self.form_fields}
+        form = [campo("fields", self.form_fields, values, True)]
 
-        return (
-            f"<h2 class='mb-3'>Detalle Medicamento</h2>"
-            f"<form>"
-            f"{form}"
-            f"<a class='btn btn-outline-secondary' href='{self.path}'>Volver</a>"
-            "</form>"
-        )
+        return render_macro("detail", "Detalle Medicamento", self.path, form)
 
     def save(self, form_data) -> str:
         d = form_data.get("d", "")
@@ -185,12 +145,14 @@ class Medicamento:
             if op == "new":
                 cur.execute(self.sql_insert, (nombre, tipo))
                 self.cn.commit()
+                invalidate(self.table_name)
                 cur.close()
                 return self._msg_success("Medicamento creado correctamente")
 
             if op == "act":
                 cur.execute(self.sql_update, (nombre, tipo, id_))
                 self.cn.commit()
+                invalidate(self.table_name)
                 cur.close()
                 return self._msg_success("Medicamento actualizado correctamente")
 
@@ -211,6 +173,7 @@ class Medicamento:
             cur = self.cn.cursor()
             cur.execute(self.sql_delete, (id,))
             self.cn.commit()
+            invalidate(self.table_name)
             cur.close()
             return self._msg_success("Medicamento eliminado correctamente")
         except Exception as ex:
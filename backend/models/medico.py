@@ -1,12 +1,14 @@
 from __future__ import annotations
 
 import base64
-import html
-from pathlib import Path
 from typing import Any, Dict, List, Tuple
 
-from flask import current_app, request
-from werkzeug.utils import secure_filename
+from flask import request, url_for
+
+from database.cache import bump_version, get_reference
+from models.fotos import promote_foto, stage_foto
+from models.render import campo, render_macro, tabla
+from models.trazas import trazado
 
 
 class Medico:
@@ -16,8 +18,20 @@ class Medico:
     title = "Médicos"
     path = "/medicos"
 
-    def __init__(self, cn):
+    # Columnas del listado: (encabezado, clave de la fila, tipo de celda)
+    list_columns = [
+        ("Nombre", "Nombre", "text"),
+        ("Especialidad", "Especialidad", "text"),
+        ("Foto", "Foto", "foto"),
+    ]
+    # Tablas que alimentan el listado (su versión forma el ETag)
+    list_tables = ("medicos", "especialidades")
+
+    def __init__(self, cn, path: str | None = None):
         self.cn = cn
+        # Ruta base de los enlaces (p. ej. "/admin?m=usuarios" desde el dashboard)
+        if path is not None:
+            self.path = path
 
         self.IdMedico: int | None = None
         self.Nombre: str = ""
@@ -26,12 +40,13 @@ class Medico:
         self.Foto: str = ""
 
         # JOIN para mostrar el nombre de la especialidad en lugar del id
-        self.sql_list = (
+        self.sql_select = (
             "SELECT m.IdMedico, m.Nombre, e.Descripcion AS Especialidad, m.IdUsuario, m.Foto "
             "FROM medicos m "
             "LEFT JOIN especialidades e ON m.Especialidad = e.IdEsp "
-            "ORDER BY m.IdMedico DESC"
         )
+        self.sql_order = "ORDER BY m.IdMedico DESC"
+        self.sql_list = self.sql_select + self.sql_order
         self.sql_detail = (
             "SELECT m.IdMedico, m.Nombre, m.Especialidad AS IdEsp, "
             "e.Descripcion AS Especialidad, m.IdUsuario, m.Foto "
@@ -65,7 +80,7 @@ class Medico:
             '<nav class="navbar navbar-expand-lg navbar-light bg-white shadow-sm py-2">'
             '<div class="container-fluid px-4">'
             '<a class="navbar-brand d-flex flex-column align-items-start" href="/">'
-            '<img src="/static/img/logo.png" alt="Logo Veris" class="img-fluid mb-1" '
+            f'<img src="{url_for("static", filename="img/logo.png")}" alt="Logo Veris" class="img-fluid mb-1" '
             'style="height: 35px; width: auto;">'
             "<span class='slogan'>Hacemos <strong>fácil cuidarte</strong></span>"
             "</a>"
@@ -80,34 +95,16 @@ class Medico:
         )
 
     def _msg_success(self, text: str) -> str:
-        return f'<div class="alert alert-success" role="alert">{html.escape(text)}</div>'
+        return render_macro("alert", "success", text)
 
     def _msg_error(self, text: str) -> str:
-        return f'<div class="alert alert-danger" role="alert">{html.escape(text)}</div>'
+        return render_macro("alert", "danger", text)
 
-    def _input(self, name: str, label: str, value: str, disabled: bool, type_: str = "text") -> str:
-        dis = " disabled" if disabled else ""
-        return (
-            '<div class="mb-3">'
-            f'<label class="form-label" for="{html.escape(name)}">{html.escape(label)}</label>'
-            f'<input class="form-control" id="{html.escape(name)}" name="{html.escape(name)}" '
-            f'type="{html.escape(type_)}" value="{html.escape(value)}"{dis} />'
-            "</div>"
-        )
+    def _input(self, name: str, label: str, value: str, disabled: bool, type_: str = "text") -> tuple:
+        return campo("input", name, label, value, disabled, type_)
 
-    def _select(self, name: str, label: str, options: list[dict[str, Any]], selected: str, disabled: bool) -> str:
-        dis = " disabled" if disabled else ""
-        html_out = '<div class="mb-3">'
-        html_out += f'<label class="form-label" for="{html.escape(name)}">{html.escape(label)}</label>'
-        html_out += f'<select class="form-select" id="{html.escape(name)}" name="{html.escape(name)}"{dis}>'
-        html_out += "<option value=''>Seleccione...</option>"
-        for opt in options:
-            oid = str(opt.get("IdUsuario", ""))
-            oname = str(opt.get("Nombre", ""))
-            sel = " selected" if oid and oid == (selected or "") else ""
-            html_out += f"<option value='{html.escape(oid)}'{sel}>{html.escape(oname)}</option>"
-        html_out += "</select></div>"
-        return html_out
+    def _select(self, name: str, label: str, options: list[dict[str, Any]], selected: str, disabled: bool) -> tuple:
+        return campo("select", name, label, options, selected, disabled, value_key="IdUsuario")
 
     def _validar_nombre_medico(self, nombre: str) -> bool:
         n = (nombre or "").strip()
@@ -149,57 +146,16 @@ class Medico:
         cur.close()
         return rows
 
+    @trazado
     def get_list(self) -> str:
         cur = self.cn.cursor(dictionary=True)
         cur.execute(self.sql_list)
         rows: List[Dict[str, Any]] = cur.fetchall() or []
         cur.close()
 
-        d_new = self._d_encode("new", 0)
-        headers = ["Nombre", "Especialidad", "Foto", "Acciones"]
-        thead = "".join(f"<th>{h}</th>" for h in headers)
-
-        tbody = ""
-        for r in rows:
-            pk = int(r["IdMedico"])
-            d_act = self._d_encode("act", pk)
-            d_det = self._d_encode("det", pk)
-            d_del = self._d_encode("del", pk)
-
-            foto = str(r.get("Foto") or "")
-            foto_html = ""
-            if foto:
-                foto_html = (
-                    f"<div><img src='/static/img/usuarios/{html.escape(foto)}' width='50' onerror=\"this.style.display='none'\" /></div>"
-                    f"<small class='text-muted'>{html.escape(foto)}</small>"
-                )
-
-            tbody += (
-                "<tr>"
-                f"<td>{html.escape(str(r.get('Nombre','')))}</td>"
-                f"<td>{html.escape(str(r.get('Especialidad','')))}</td>"
-                f"<td>{foto_html}</td>"
-                "<td>"
-                f"<a class='btn btn-sm btn-primary me-1' href='{self.path}?d={d_act}'>Editar</a>"
-                f"<a class='btn btn-sm btn-outline-secondary me-1' href='{self.path}?d={d_det}'>Detalle</a>"
-                f"<a class='btn btn-sm btn-danger' href='{self.path}?d={d_del}' data-veris-confirm='¿Eliminar este registro?'>Eliminar</a>"
-                "</td>"
-                "</tr>"
-            )
-
-        return (
-            "<main class='container my-4 veris-tabla-container'>"
-            f"<h2 class='veris-tabla-title'>{html.escape(self.title)}</h2>"
-            f"<p class='veris-tabla-actions'><a class='btn veris-tabla-btn-crear' href='{self.path}?d={d_new}'>Crear nuevo</a></p>"
-            "<div class='veris-tabla-wrapper'>"
-            "<table class='table veris-tabla table-bordered table-striped'>"
-            f"<thead class='veris-tabla-thead'><tr>{thead}</tr></thead>"
-            f"<tbody class='veris-tabla-body-content'>{tbody}</tbody>"
-            "</table>"
-            "</div>"
-            "</main>"
-        )
+        return tabla(self.title, self.path, self.list_columns, rows, self.pk)
 
+    @trazado
     def get_form(self, id: int = 0) -> str:
         is_new = id == 0
         op = "new" if is_new else "act"
@@ -219,89 +175,49 @@ class Medico:
             values["Foto"] = "" if row.get("Foto") is None else str(row.get("Foto"))
 
         # Cargar especialidades para el select (mostrar nombre, guardar id)
-        cur = self.cn.cursor(dictionary=True)
-        cur.execute("SELECT IdEsp, Descripcion FROM especialidades ORDER BY Descripcion")
-        especialidades: List[Dict[str, Any]] = cur.fetchall() or []
-        cur.close()
+        especialidades: List[Dict[str, Any]] = get_reference("especialidades", self.cn)
 
         d = self._d_encode(op, id)
-        form = ""
+        form = []
 
         # Usuario asociado
         if is_new:
             usuarios = self._get_usuarios_disponibles_medico()
             if not usuarios:
-                form += (
-                    "<div class='alert alert-warning' role='alert'>"
-                    "No hay usuarios con rol Médico disponibles (sin asignación previa)."
-                    "</div>"
-                )
-            form += self._select("IdUsuario", "Usuario", usuarios, values["IdUsuario"], False)
+                form.append(campo(
+                    "alert", "warning", "No hay usuarios con rol Médico disponibles (sin asignación previa)."
+                ))
+            form.append(self._select("IdUsuario", "Usuario", usuarios, values["IdUsuario"], False))
         else:
             try:
                 include_id = int(values["IdUsuario"]) if values["IdUsuario"] else None
             except Exception:
                 include_id = None
             usuarios = self._get_usuarios_disponibles_medico(include_id=include_id)
-            form += self._select("IdUsuario", "Usuario", usuarios, values["IdUsuario"], True)
+            form.append(self._select("IdUsuario", "Usuario", usuarios, values["IdUsuario"], True))
             if values["IdUsuario"]:
-                form += f"<input type='hidden' name='IdUsuario' value='{html.escape(values['IdUsuario'])}' />"
+                form.append(campo("hidden", "IdUsuario", values["IdUsuario"]))
 
         # Restricción edición: solo Especialidad/FOTO editables
-        nombre_ro = " readonly" if not is_new else ""
-        form += (
-            "<div class='mb-3'>"
-            "<label class='form-label' for='Nombre'>Nombre</label>"
-            f"<input class='form-control' id='Nombre' name='Nombre' type='text' value='{html.escape(values['Nombre'])}'{nombre_ro} />"
-            "</div>"
-        )
+        form.append(campo("input", "Nombre", "Nombre", values["Nombre"], readonly=not is_new))
         # Selector de especialidad por nombre (value = id)
-        form += "<div class='mb-3'>"
-        form += "<label class='form-label' for='Especialidad'>Especialidad</label>"
-        form += "<select class='form-select' id='Especialidad' name='Especialidad'>"
-        for e in especialidades:
-            eid = str(e.get("IdEsp", ""))
-            selected = " selected" if eid == values["Especialidad"] else ""
-            form += (
-                f"<option value='{html.escape(eid)}'{selected}>"
-                f"{html.escape(str(e.get('Descripcion', '')))}"
-                "</option>"
-            )
-        form += "</select></div>"
+        form.append(campo(
+            "select", "Especialidad", "Especialidad", especialidades, values["Especialidad"],
+            value_key="IdEsp", label_key="Descripcion", placeholder=False,
+        ))
 
         # Campo para subir nueva foto (input file en lugar del nombre)
         if values["Foto"]:
-            form += (
-                "<div class='mb-3'>"
-                "<label class='form-label'>Foto actual</label>"
-                f"<div><img src='/static/img/usuarios/{html.escape(values['Foto'])}' "
-                "class='img-thumbnail' style='max-width: 100px;' "
-                "onerror=\"this.style.display='none'\" /></div>"
-                "</div>"
-            )
+            form.append(campo("foto", "Foto actual", values["Foto"], 100))
 
-        form += (
-            "<div class='mb-3'>"
-            "<label class='form-label' for='Foto'>Nueva foto</label>"
-            "<input class='form-control' id='Foto' name='Foto' type='file' accept='image/*' />"
-            "</div>"
-        )
+        form.append(campo("input", "Foto", "Nueva foto", "", type="file", attrs={"accept": "image/*"}))
 
         # Mantener el nombre de la foto actual si no se sube una nueva
-        form += (
-            f"<input type='hidden' name='FotoActual' value='{html.escape(values['Foto'])}' />"
-        )
+        form.append(campo("hidden", "FotoActual", values["Foto"]))
 
         title = "Nuevo Médico" if is_new else "Actualizar Médico"
-        return (
-            f"<h2 class='mb-3'>{html.escape(title)}</h2>"
-            f"<form method='post' enctype='multipart/form-data'>"
-            f"<input type='hidden' name='d' value='{html.escape(d)}' />"
-            f"{form}"
-            "<button class='btn btn-primary' type='submit'>Guardar</button> "
-            f"<a class='btn btn-outline-secondary' href='{self.path}'>Volver</a>"
-            "</form>"
-            "<script src='/static/js/medico-validaciones.js'></script>"
+        return render_macro(
+            "form", title, self.path, d, form, multipart=True, script=url_for("static", filename="js/medico-validaciones.js")
         )
 
     def get_detail(self, id: int) -> str:
@@ -312,34 +228,21 @@ class Medico:
         if not row:
             return self._msg_error("Registro no encontrado")
 
-        form = ""
+        form = []
         # No mostrar IdMedico ni IdUsuario en detalle
-        form += self._input("Nombre", "Nombre", str(row.get("Nombre", "")), True)
+        form.append(self._input("Nombre", "Nombre", str(row.get("Nombre", "")), True))
         # Mostrar el nombre de la especialidad (campo alias Especialidad del JOIN)
-        form += self._input("Especialidad", "Especialidad", str(row.get("Especialidad", "")), True)
+        form.append(self._input("Especialidad", "Especialidad", str(row.get("Especialidad", "")), True))
         # No mostrar IdUsuario en el detalle
 
         # Mostrar la foto en lugar del nombre del archivo
         foto = str(row.get("Foto", "") or "")
         if foto:
-            form += (
-                "<div class='mb-3'>"
-                "<label class='form-label'>Foto</label>"
-                f"<div><img src='/static/img/usuarios/{html.escape(foto)}' "
-                "class='img-thumbnail' style='max-width: 150px;' "
-                "onerror=\"this.style.display='none'\" /></div>"
-                "</div>"
-            )
+            form.append(campo("foto", "Foto", foto, 150))
         else:
-            form += self._input("Foto", "Foto", "Sin foto", True)
+            form.append(self._input("Foto", "Foto", "Sin foto", True))
 
-        return (
-            f"<h2 class='mb-3'>Detalle Médico</h2>"
-            f"<form>"
-            f"{form}"
-            f"<a class='btn btn-outline-secondary' href='{self.path}'>Volver</a>"
-            "</form>"
-        )
+        return render_macro("detail", "Detalle Médico", self.path, form)
 
     def save(self, form_data) -> str:
         d = form_data.get("d", "")
@@ -399,7 +302,8 @@ class Medico:
             except Exception:
                 pass
 
-        # Manejo de la foto: si se sube una nueva, se guarda en static/img/usuarios.
+        # Manejo de la foto: si se sube una nueva, se copia a staging y solo se
+        # publica en static/img/usuarios después del commit (promote_foto).
         # Si no, se mantiene la foto actual.
         existing_foto = (form_data.get("FotoActual") or form_data.get("Foto") or "").strip()
         foto_filename = existing_foto
@@ -411,25 +315,26 @@ class Medico:
 
         filename_raw = (getattr(file, "filename", "") or "") if file else ""
         if file and filename_raw:
-            filename = secure_filename(filename_raw)
-            if filename:
-                upload_dir = Path(current_app.static_folder) / "img" / "usuarios"  # type: ignore[attr-defined]
-                upload_dir.mkdir(parents=True, exist_ok=True)
-                file_path = upload_dir / filename
-                file.save(str(file_path))
-                foto_filename = filename
+            try:
+                foto_filename = stage_foto(file)
+            except ValueError as ex:
+                return self._msg_error(str(ex))
 
         try:
             cur = self.cn.cursor()
             if op == "new":
                 cur.execute(self.sql_insert, (nombre, especialidad, id_usuario, foto_filename))
                 self.cn.commit()
+                bump_version(self.table_name)
+                promote_foto(foto_filename, ("medicos", cur.lastrowid))
                 cur.close()
                 return self._msg_success("Médico creado correctamente")
 
             if op == "act":
                 cur.execute(self.sql_update, (nombre, especialidad, id_usuario, foto_filename, id_))
                 self.cn.commit()
+                bump_version(self.table_name)
+                promote_foto(foto_filename, ("medicos", id_), existing_foto)
                 cur.close()
                 return self._msg_success("Médico actualizado correctamente")
 
@@ -450,6 +355,7 @@ class Medico:
             cur = self.cn.cursor()
             cur.execute(self.sql_delete, (id,))
             self.cn.commit()
+            bump_version(self.table_name)
             cur.close()
             return self._msg_success("Médico eliminado correctamente")
         except Exception as ex:
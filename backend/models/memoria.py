@@ -0,0 +1,196 @@
+from __future__ import annotations
+
+import json
+import os
+import random
+import threading
+import time
+import tracemalloc
+from collections import deque
+from pathlib import Path
+
+from flask import Response, current_app, flash, g, redirect, request, session, url_for
+
+
+# Frames guardados por asignación: alcanza para llegar del código de la app a la
+# línea que asigna dentro de Jinja o mysql.connector
+_FRAMES = 10
+_APP_DIR = str(Path(__file__).resolve().parent.parent)
+
+# tracemalloc es global al proceso: se muestrea solo una petición que empieza
+# sin otra en curso, y si llega otra mientras se mide la muestra se descarta
+_estado_lock = threading.Lock()
+_en_curso = 0
+_muestra_activa = False
+_contaminada = False
+
+_stats_lock = threading.Lock()
+_rutas: dict[str, dict] = {}  # endpoint -> muestras, pico máx./suma, retenida suma
+_sitios: dict[tuple[str, str], list[int]] = {}  # (endpoint, archivo:línea) -> [bytes, bloques, muestras]
+_historial: deque = deque(maxlen=500)  # (epoch, endpoint, pico, retenida, rss)
+_descartadas = [0]  # muestras descartadas por peticiones concurrentes
+
+
+def _rss() -> int | None:
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, ValueError, IndexError):
+        return None
+
+
+def _sitio(tb: tracemalloc.Traceback) -> str:
+    """Línea de la app más cercana a la asignación (o la asignación misma si no hay)."""
+
+    for frame in tb:  # del más reciente al más antiguo
+        if frame.filename.startswith(_APP_DIR):
+            return f"{os.path.relpath(frame.filename, _APP_DIR)}:{frame.lineno}"
+    filename = tb[0].filename
+    if "site-packages/" in filename:
+        filename = filename.split("site-packages/", 1)[1]
+    return f"{filename}:{tb[0].lineno}"
+
+
+def _iniciar() -> None:
+    global _en_curso, _muestra_activa, _contaminada
+    with _estado_lock:
+        _en_curso += 1
+        g.memoria_en_curso = True
+        if _muestra_activa:
+            _contaminada = True
+        muestrear = (
+            _en_curso == 1
+            and not _muestra_activa
+            and random.random() < current_app.config["MEMORIA_MUESTREO"]
+        )
+        if muestrear:
+            _muestra_activa = True
+            _contaminada = False
+    if not muestrear:
+        return
+    g.memoria_externa = tracemalloc.is_tracing()
+    if g.memoria_externa:
+        # Ya lo activó PYTHONTRACEMALLOC: se compara contra una foto inicial
+        g.memoria_inicio = tracemalloc.take_snapshot()
+        tracemalloc.reset_peak()
+    else:
+        tracemalloc.start(_FRAMES)
+    g.memoria_base = tracemalloc.get_traced_memory()[0]
+
+
+def _medir(exc) -> None:
+    global _en_curso, _muestra_activa
+    if not g.pop("memoria_en_curso", False):
+        return
+    if "memoria_base" not in g:
+        with _estado_lock:
+            _en_curso -= 1
+        return
+    try:
+        actual, pico = tracemalloc.get_traced_memory()
+        with _estado_lock:
+            contaminada = _contaminada
+        if contaminada:
+            if not g.memoria_externa:
+                tracemalloc.stop()
+        else:
+            snapshot = tracemalloc.take_snapshot().filter_traces(
+                (tracemalloc.Filter(False, tracemalloc.__file__),)
+            )
+            if g.memoria_externa:
+                stats = [s for s in snapshot.compare_to(g.memoria_inicio, "traceback") if s.size_diff > 0]
+                retenidas = [(s.traceback, s.size_diff, s.count_diff) for s in stats]
+            else:
+                tracemalloc.stop()
+                retenidas = [(s.traceback, s.size, s.count) for s in snapshot.statistics("traceback")]
+    finally:
+        with _estado_lock:
+            _en_curso -= 1
+            _muestra_activa = False
+    if contaminada:
+        # Otra petición asignó memoria durante la medición: no es atribuible
+        with _stats_lock:
+            _descartadas[0] += 1
+        return
+
+    endpoint = request.endpoint or "(sin ruta)"
+    pico -= g.memoria_base
+    retenida = actual - g.memoria_base
+    por_sitio: dict[str, list[int]] = {}
+    for tb, size, count in retenidas:
+        s = por_sitio.setdefault(_sitio(tb), [0, 0])
+        s[0] += size
+        s[1] += count
+    with _stats_lock:
+        r = _rutas.setdefault(endpoint, {"muestras": 0, "pico_max": 0, "pico_total": 0, "retenida_total": 0})
+        r["muestras"] += 1
+        r["pico_max"] = max(r["pico_max"], pico)
+        r["pico_total"] += pico
+        r["retenida_total"] += retenida
+        for sitio, (size, count) in por_sitio.items():
+            s = _sitios.setdefault((endpoint, sitio), [0, 0, 0])
+            s[0] += size
+            s[1] += count
+            s[2] += 1
+        _historial.append((time.time(), endpoint, pico, retenida, _rss()))
+
+
+def reporte(top: int = 20) -> dict:
+    """Rutas por pico medio, mayores sitios de asignación retenida e historial reciente."""
+
+    with _stats_lock:
+        rutas = [
+            {
+                "endpoint": ep,
+                "muestras": r["muestras"],
+                "pico_max_kb": round(r["pico_max"] / 1024, 1),
+                "pico_medio_kb": round(r["pico_total"] / r["muestras"] / 1024, 1),
+                "retenida_media_kb": round(r["retenida_total"] / r["muestras"] / 1024, 1),
+            }
+            for ep, r in _rutas.items()
+        ]
+        sitios = sorted(_sitios.items(), key=lambda kv: -kv[1][0])[:top]
+        historial = list(_historial)[-top:]
+        descartadas = _descartadas[0]
+
+    rutas.sort(key=lambda r: -r["pico_medio_kb"])
+    return {
+        "pid": os.getpid(),
+        "rss_kb": (_rss() or 0) // 1024,
+        "descartadas": descartadas,
+        "rutas": rutas[:top],
+        "sitios": [
+            {"endpoint": ep, "sitio": sitio, "retenida_kb": round(size / 1024, 1), "bloques": count, "muestras": n}
+            for (ep, sitio), (size, count, n) in sitios
+        ],
+        "historial": [
+            {"epoch": int(t), "endpoint": ep, "pico_kb": round(p / 1024, 1), "retenida_kb": round(r / 1024, 1), "rss_kb": (rss or 0) // 1024}
+            for t, ep, p, r, rss in historial
+        ],
+    }
+
+
+def admin_memoria():
+    """JSON con la memoria por ruta de este worker (`?top=N`)."""
+
+    if "user_id" not in session:
+        return redirect(url_for("crud.login", next=request.path))
+
+    if session.get("user_role") != 1:
+        flash("No tiene permiso para acceder al módulo Administrador", "danger")
+        return redirect(url_for("crud.index"))
+
+    data = reporte(request.args.get("top", 20, type=int))
+    data["muestreo"] = current_app.config["MEMORIA_MUESTREO"]
+    resp = Response(json.dumps(data), mimetype="application/json")
+    resp.headers["Cache-Control"] = "no-store"
+    return resp
+
+
+def init_app(app) -> None:
+    """Registra `/admin/memoria` y, con MEMORIA_MUESTREO > 0, el muestreo de peticiones."""
+
+    app.add_url_rule("/admin/memoria", "admin_memoria", admin_memoria)
+    if app.config.get("MEMORIA_MUESTREO", 0) > 0:
+        app.before_request(_iniciar)
+        app.teardown_request(_medir)
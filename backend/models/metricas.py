@@ -0,0 +1,172 @@
+from __future__ import annotations
+
+import hmac
+import os
+import threading
+import time
+
+from flask import Response, current_app, g, request, session
+from prometheus_client import (
+    CONTENT_TYPE_LATEST,
+    REGISTRY,
+    CollectorRegistry,
+    Counter,
+    Gauge,
+    Histogram,
+    generate_latest,
+    multiprocess,
+)
+
+from database.cache import cache_stats
+from database.connection import conexion_stats
+from models.fotos import cola_stats
+from models.principal import principal_stats
+
+
+# Con varios workers (gunicorn, uwsgi) cada proceso escribe sus métricas en
+# esta carpeta y /metrics las suma. prometheus_client la lee al importarse,
+# por eso va como variable de entorno y no en Config.
+MULTIPROCESO = bool(os.environ.get("PROMETHEUS_MULTIPROC_DIR"))
+
+_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+LATENCIA = Histogram(
+    "veris_http_request_duration_seconds",
+    "Duración de las peticiones del blueprint crud.",
+    ["endpoint", "method"],
+    buckets=_BUCKETS,
+)
+PETICIONES = Counter(
+    "veris_http_requests",
+    "Peticiones del blueprint crud por código de estado.",
+    ["endpoint", "method", "status"],
+)
+EN_CURSO = Gauge(
+    "veris_http_requests_in_progress",
+    "Peticiones del blueprint crud en curso.",
+    ["endpoint"],
+    multiprocess_mode="livesum",
+)
+
+DB_ABIERTAS = Gauge("veris_db_connections_open", "Conexiones MySQL abiertas.", multiprocess_mode="livesum")
+DB_CONEXIONES = Counter("veris_db_connections_opened", "Conexiones MySQL abiertas desde el arranque.")
+DB_ERRORES = Counter("veris_db_connection_errors", "Intentos de conexión MySQL fallidos.")
+DB_SEGUNDOS = Counter("veris_db_connect_seconds", "Tiempo total dedicado a abrir conexiones MySQL.")
+
+CACHE_ACIERTOS = Counter("veris_reference_cache_hits", "Lecturas de tablas de referencia servidas de la caché.", ["table"])
+CACHE_RECARGAS = Counter("veris_reference_cache_misses", "Lecturas de tablas de referencia que fueron a la BD.", ["table"])
+PRINCIPAL_ACIERTOS = Counter("veris_principal_cache_hits", "Perfiles del usuario tomados de la sesión.")
+PRINCIPAL_RECARGAS = Counter("veris_principal_cache_misses", "Perfiles del usuario recargados de la BD.")
+
+FOTOS_PENDIENTES = Gauge("veris_fotos_queue_depth", "Fotos en la cola de procesamiento.", multiprocess_mode="livesum")
+FOTOS_PROCESADAS = Counter("veris_fotos_processed", "Fotos procesadas por el pool.")
+FOTOS_ERRORES = Counter("veris_fotos_errors", "Fotos cuyo procesamiento falló.")
+FOTOS_LATENCIA_MAX = Gauge(
+    "veris_fotos_latency_max_seconds",
+    "Mayor latencia encolado -> listo de una foto.",
+    multiprocess_mode="livemax",
+)
+
+# Último valor acumulado ya sumado a cada contador (ver _sincronizar)
+_previos: dict[tuple, float] = {}
+_lock = threading.Lock()
+
+
+def _contar(counter: Counter, valor: float, *labels: str) -> None:
+    key = (id(counter), labels)
+    delta = valor - _previos.get(key, 0)
+    if delta > 0:
+        (counter.labels(*labels) if labels else counter).inc(delta)
+    _previos[key] = valor
+
+
+def _sincronizar() -> None:
+    """Pasa a Prometheus las estadísticas que llevan la conexión, las cachés y el pool de fotos.
+
+    Esos módulos no dependen de prometheus_client: cuentan en memoria y aquí se
+    suma a cada contador lo que creció desde la última vez.
+    """
+
+    db = conexion_stats()
+    fotos = cola_stats()
+    principal = principal_stats()
+    with _lock:
+        DB_ABIERTAS.set(db["abiertas"])
+        _contar(DB_CONEXIONES, db["total"])
+        _contar(DB_ERRORES, db["errores"])
+        _contar(DB_SEGUNDOS, db["segundos_conexion"])
+        for table, (aciertos, recargas) in cache_stats().items():
+            _contar(CACHE_ACIERTOS, aciertos, table)
+            _contar(CACHE_RECARGAS, recargas, table)
+        _contar(PRINCIPAL_ACIERTOS, principal["aciertos"])
+        _contar(PRINCIPAL_RECARGAS, principal["recargas"])
+        FOTOS_PENDIENTES.set(fotos["pendientes"])
+        _contar(FOTOS_PROCESADAS, fotos["procesadas"])
+        _contar(FOTOS_ERRORES, fotos["errores"])
+        FOTOS_LATENCIA_MAX.set(fotos["latencia_max_ms"] / 1000)
+
+
+def _inicio() -> None:
+    if request.blueprint != "crud":
+        return
+    g.metrica_t0 = time.perf_counter()
+    EN_CURSO.labels(request.endpoint).inc()
+
+
+def _status(response):
+    if "metrica_t0" in g:
+        g.metrica_status = response.status_code
+    return response
+
+
+def _fin(exc) -> None:
+    t0 = g.pop("metrica_t0", None)
+    if t0 is None:
+        return
+    endpoint = request.endpoint
+    EN_CURSO.labels(endpoint).dec()
+    LATENCIA.labels(endpoint, request.method).observe(time.perf_counter() - t0)
+    # Sin respuesta (excepción no manejada) Flask devuelve 500
+    PETICIONES.labels(endpoint, request.method, str(g.pop("metrica_status", 500))).inc()
+    _sincronizar()
+
+
+def _autorizado() -> bool:
+    token = current_app.config.get("METRICS_TOKEN")
+    if token:
+        auth = request.headers.get("Authorization", "").encode("utf-8")
+        if hmac.compare_digest(auth, f"Bearer {token}".encode("utf-8")):
+            return True
+    return session.get("user_role") == 1
+
+
+def metrics():
+    """Métricas en formato de texto de Prometheus (token METRICS_TOKEN o sesión de administrador)."""
+
+    if not _autorizado():
+        return Response("No autorizado\n", status=401, mimetype="text/plain", headers={"WWW-Authenticate": "Bearer"})
+
+    _sincronizar()
+    registry = REGISTRY
+    if MULTIPROCESO:
+        registry = CollectorRegistry()
+        multiprocess.MultiProcessCollector(registry)
+    resp = Response(generate_latest(registry), content_type=CONTENT_TYPE_LATEST)
+    resp.headers["Cache-Control"] = "no-store"
+    return resp
+
+
+def child_exit(server, worker) -> None:
+    """Hook `child_exit` de gunicorn: descarta los gauges del worker que terminó."""
+
+    if MULTIPROCESO:
+        multiprocess.mark_process_dead(worker.pid)
+
+
+def init_app(app) -> None:
+    """Mide cada petición del blueprint crud y expone `/metrics`."""
+
+    app.before_request(_inicio)
+    app.after_request(_status)
+    app.teardown_request(_fin)
+    app.add_url_rule("/metrics", "metrics", metrics)
@@ -1,12 +1,14 @@
 from __future__ import annotations
 
 import base64
-import html
-from pathlib import Path
 from typing import Any, Dict, List, Tuple
 
-from flask import current_app, request
-from werkzeug.utils import secure_filename
+from flask import request, url_for
+
+from database.cache import bump_version
+from models.fotos import promote_foto, stage_foto
+from models.render import campo, render_macro, tabla
+from models.trazas import trazado
 
 
 class Paciente:
@@ -16,8 +18,33 @@ class Paciente:
     title = "Pacientes"
     path = "/pacientes"
 
-    def __init__(self, cn):
+    # Columnas del listado: (encabezado, clave de la fila, tipo de celda)
+    list_columns = [
+        ("Nombre", "Nombre", "text"),
+        ("Cedula", "Cedula", "num"),
+        ("Edad", "Edad", "num"),
+        ("Genero", "Genero", "text"),
+        ("Estatura_cm", "Estatura_cm", "num"),
+        ("Peso_kg", "Peso_kg", "num"),
+        ("Foto", "Foto", "foto"),
+    ]
+    # Tablas que alimentan el listado (su versión forma el ETag)
+    list_tables = ("pacientes",)
+    # Campos de solo lectura del detalle: (name, etiqueta, tipo de input)
+    detail_fields = [
+        ("Nombre", "Nombre", "text"),
+        ("Cedula", "Cedula", "text"),
+        ("Edad", "Edad", "number"),
+        ("Genero", "Genero", "text"),
+        ("Estatura_cm", "Estatura (cm)", "number"),
+        ("Peso_kg", "Peso (kg)", "number"),
+    ]
+
+    def __init__(self, cn, path: str | None = None):
         self.cn = cn
+        # Ruta base de los enlaces (p. ej. "/admin?m=usuarios" desde el dashboard)
+        if path is not None:
+            self.path = path
 
         self.IdPaciente: int | None = None
         self.IdUsuario: int | None = None
@@ -29,11 +56,14 @@ class Paciente:
         self.Peso_kg: float | None = None
         self.Foto: str = ""
 
-        self.sql_list = (
+        # SELECT del listado (lo reutilizan las exportaciones)
+        self.sql_select = (
             "SELECT IdPaciente, IdUsuario, Nombre, Cedula, Edad, Genero, "
             "`Estatura (cm)` AS Estatura_cm, `Peso (kg)` AS Peso_kg, Foto "
-            "FROM pacientes ORDER BY IdPaciente DESC"
+            "FROM pacientes "
         )
+        self.sql_order = "ORDER BY IdPaciente DESC"
+        self.sql_list = self.sql_select + self.sql_order
         self.sql_detail = (
             "SELECT IdPaciente, IdUsuario, Nombre, Cedula, Edad, Genero, "
             "`Estatura (cm)` AS Estatura_cm, `Peso (kg)` AS Peso_kg, Foto "
@@ -71,7 +101,7 @@ class Paciente:
             '<nav class="navbar navbar-expand-lg navbar-light bg-white shadow-sm py-2">'
             '<div class="container-fluid px-4">'
             '<a class="navbar-brand d-flex flex-column align-items-start" href="/">'
-            '<img src="/static/img/logo.png" alt="Logo Veris" class="img-fluid mb-1" '
+            f'<img src="{url_for("static", filename="img/logo.png")}" alt="Logo Veris" class="img-fluid mb-1" '
             'style="height: 35px; width: auto;">'
             "<span class='slogan'>Hacemos <strong>fácil cuidarte</strong></span>"
             "</a>"
@@ -86,46 +116,19 @@ class Paciente:
         )
 
     def _msg_success(self, text: str) -> str:
-        return f'<div class="alert alert-success" role="alert">{html.escape(text)}</div>'
+        return render_macro("alert", "success", text)
 
     def _msg_error(self, text: str) -> str:
-        return f'<div class="alert alert-danger" role="alert">{html.escape(text)}</div>'
+        return render_macro("alert", "danger", text)
 
-    def _input(self, name: str, label: str, value: str, disabled: bool, type_: str = "text") -> str:
-        dis = " disabled" if disabled else ""
-        return (
-            '<div class="mb-3">'
-            f'<label class="form-label" for="{html.escape(name)}">{html.escape(label)}</label>'
-            f'<input class="form-control" id="{html.escape(name)}" name="{html.escape(name)}" '
-            f'type="{html.escape(type_)}" value="{html.escape(value)}"{dis} />'
-            "</div>"
-        )
+    def _input(self, name: str, label: str, value: str, disabled: bool, type_: str = "text") -> tuple:
+        return campo("input", name, label, value, disabled, type_)
 
-    def _select(self, name: str, label: str, options: list[dict[str, Any]], selected: str, disabled: bool) -> str:
-        dis = " disabled" if disabled else ""
-        html_out = '<div class="mb-3">'
-        html_out += f'<label class="form-label" for="{html.escape(name)}">{html.escape(label)}</label>'
-        html_out += f'<select class="form-select" id="{html.escape(name)}" name="{html.escape(name)}"{dis}>'
-        html_out += "<option value=''>Seleccione...</option>"
-        for opt in options:
-            oid = str(opt.get("IdUsuario", ""))
-            oname = str(opt.get("Nombre", ""))
-            sel = " selected" if oid and oid == (selected or "") else ""
-            html_out += f"<option value='{html.escape(oid)}'{sel}>{html.escape(oname)}</option>"
-        html_out += "</select></div>"
-        return html_out
-
-    def _select_simple(self, name: str, label: str, options: list[str], selected: str, disabled: bool) -> str:
-        dis = " disabled" if disabled else ""
-        html_out = '<div class="mb-3">'
-        html_out += f'<label class="form-label" for="{html.escape(name)}">{html.escape(label)}</label>'
-        html_out += f'<select class="form-select" id="{html.escape(name)}" name="{html.escape(name)}"{dis}>'
-        html_out += "<option value=''>Seleccione...</option>"
-        for opt in options:
-            sel = " selected" if (opt or "") == (selected or "") else ""
-            html_out += f"<option value='{html.escape(opt)}'{sel}>{html.escape(opt)}</option>"
-        html_out += "</select></div>"
-        return html_out
+    def _select(self, name: str, label: str, options: list[dict[str, Any]], selected: str, disabled: bool) -> tuple:
+        return campo("select", name, label, options, selected, disabled, value_key="IdUsuario")
+
+    def _select_simple(self, name: str, label: str, options: list[str], selected: str, disabled: bool) -> tuple:
+        return campo("select", name, label, options, selected, disabled)
 
     def _validar_cedula_ec(self, cedula: str) -> bool:
         c = (cedula or "").strip()
@@ -191,71 +194,16 @@ class Paciente:
         cur.close()
         return rows
 
+    @trazado
     def get_list(self) -> str:
         cur = self.cn.cursor(dictionary=True)
         cur.execute(self.sql_list)
         rows: List[Dict[str, Any]] = cur.fetchall() or []
         cur.close()
 
-        d_new = self._d_encode("new", 0)
-        headers = [
-            "Nombre",
-            "Cedula",
-            "Edad",
-            "Genero",
-            "Estatura_cm",
-            "Peso_kg",
-            "Foto",
-            "Acciones",
-        ]
-        thead = "".join(f"<th>{h}</th>" for h in headers)
-
-        tbody = ""
-        for r in rows:
-            pk = int(r["IdPaciente"])
-            d_act = self._d_encode("act", pk)
-            d_det = self._d_encode("det", pk)
-            d_del = self._d_encode("del", pk)
-
-            foto = str(r.get("Foto") or "")
-            foto_html = ""
-            if foto:
-                foto_html = (
-                    f"<div><img src='/static/img/usuarios/{html.escape(foto)}' width='50' "
-                    "onerror=\"this.style.display='none'\" /></div>"
-                    f"<small class='text-muted'>{html.escape(foto)}</small>"
-                )
-
-            tbody += (
-                "<tr>"
-                f"<td>{html.escape(str(r.get('Nombre','')))}</td>"
-                f"<td>{html.escape(str(r.get('Cedula','')))}</td>"
-                f"<td>{html.escape(str(r.get('Edad','')))}</td>"
-                f"<td>{html.escape(str(r.get('Genero','')))}</td>"
-                f"<td>{html.escape(str(r.get('Estatura_cm','')))}</td>"
-                f"<td>{html.escape(str(r.get('Peso_kg','')))}</td>"
-                f"<td>{foto_html}</td>"
-                "<td>"
-                f"<a class='btn btn-sm btn-primary me-1' href='{self.path}?d={d_act}'>Editar</a>"
-                f"<a class='btn btn-sm btn-outline-secondary me-1' href='{self.path}?d={d_det}'>Detalle</a>"
-                f"<a class='btn btn-sm btn-danger' href='{self.path}?d={d_del}' data-veris-confirm='¿Eliminar este registro?'>Eliminar</a>"
-                "</td>"
-                "</tr>"
-            )
-
-        return (
-            "<main class='container my-4 veris-tabla-container'>"
-            f"<h2 class='veris-tabla-title'>{html.escape(self.title)}</h2>"
-            f"<p class='veris-tabla-actions'><a class='btn veris-tabla-btn-crear' href='{self.path}?d={d_new}'>Crear nuevo</a></p>"
-            "<div class='veris-tabla-wrapper'>"
-            "<table class='table veris-tabla table-bordered table-striped'>"
-            f"<thead class='veris-tabla-thead'><tr>{thead}</tr></thead>"
-            f"<tbody class='veris-tabla-body-content'>{tbody}</tbody>"
-            "</table>"
-            "</div>"
-            "</main>"
-        )
+        return tabla(self.title, self.path, self.list_columns, rows, self.pk)
 
+    @trazado
     def get_form(self, id: int = 0) -> str:
         is_new = id == 0
         op = "new" if is_new else "act"
@@ -283,107 +231,68 @@ class Paciente:
                 values[k] = "" if row.get(k) is None else str(row.get(k))
 
         d = self._d_encode(op, id)
-        form = ""
+        form = []
 
         # Usuario asociado
         if is_new:
             usuarios = self._get_usuarios_disponibles_paciente()
             if not usuarios:
-                form += (
-                    "<div class='alert alert-warning' role='alert'>"
-                    "No hay usuarios con rol Paciente disponibles (sin asignación previa)."
-                    "</div>"
-                )
-            form += self._select("IdUsuario", "Usuario", usuarios, values["IdUsuario"], False)
+                form.append(campo(
+                    "alert", "warning", "No hay usuarios con rol Paciente disponibles (sin asignación previa)."
+                ))
+            form.append(self._select("IdUsuario", "Usuario", usuarios, values["IdUsuario"], False))
         else:
             try:
                 include_id = int(values["IdUsuario"]) if values["IdUsuario"] else None
             except Exception:
                 include_id = None
             usuarios = self._get_usuarios_disponibles_paciente(include_id=include_id)
-            form += self._select("IdUsuario", "Usuario", usuarios, values["IdUsuario"], True)
+            form.append(self._select("IdUsuario", "Usuario", usuarios, values["IdUsuario"], True))
             if values["IdUsuario"]:
-                form += f"<input type='hidden' name='IdUsuario' value='{html.escape(values['IdUsuario'])}' />"
+                form.append(campo("hidden", "IdUsuario", values["IdUsuario"]))
 
         # Restricción edición: solo Edad/Estatura/Peso/Foto editables
-        nombre_ro = " readonly" if not is_new else ""
-        cedula_ro = " readonly" if not is_new else ""
-
-        form += (
-            "<div class='mb-3'>"
-            "<label class='form-label' for='Nombre'>Nombre</label>"
-            f"<input class='form-control' id='Nombre' name='Nombre' type='text' value='{html.escape(values['Nombre'])}'{nombre_ro} />"
-            "</div>"
-        )
-        form += (
-            "<div class='mb-3'>"
-            "<label class='form-label' for='Cedula'>Cedula</label>"
-            f"<input class='form-control' id='Cedula' name='Cedula' type='text' maxlength='10' inputmode='numeric' value='{html.escape(values['Cedula'])}'{cedula_ro} />"
-            "</div>"
-        )
+        form.append(campo("input", "Nombre", "Nombre", values["Nombre"], readonly=not is_new))
+        form.append(campo(
+            "input", "Cedula", "Cedula", values["Cedula"], readonly=not is_new,
+            attrs={"maxlength": "10", "inputmode": "numeric"},
+        ))
 
         # Edad
-        form += (
-            "<div class='mb-3'>"
-            "<label class='form-label' for='Edad'>Edad</label>"
-            f"<input class='form-control' id='Edad' name='Edad' type='number' min='0' max='120' step='1' value='{html.escape(values['Edad'])}' />"
-            "</div>"
-        )
+        form.append(campo(
+            "input", "Edad", "Edad", values["Edad"], type="number",
+            attrs={"min": "0", "max": "120", "step": "1"},
+        ))
 
         # Género (select)
         if is_new:
-            form += self._select_simple("Genero", "Género", ["Masculino", "Femenino"], values["Genero"], False)
+            form.append(self._select_simple("Genero", "Género", ["Masculino", "Femenino"], values["Genero"], False))
         else:
-            form += self._select_simple("Genero", "Género", ["Masculino", "Femenino"], values["Genero"], True)
-            form += f"<input type='hidden' name='Genero' value='{html.escape(values['Genero'])}' />"
+            form.append(self._select_simple("Genero", "Género", ["Masculino", "Femenino"], values["Genero"], True))
+            form.append(campo("hidden", "Genero", values["Genero"]))
 
         # Estatura / Peso
-        form += (
-            "<div class='mb-3'>"
-            "<label class='form-label' for='Estatura_cm'>Estatura (cm)</label>"
-            f"<input class='form-control' id='Estatura_cm' name='Estatura_cm' type='number' min='30' max='250' step='0.01' value='{html.escape(values['Estatura_cm'])}' />"
-            "</div>"
-        )
-        form += (
-            "<div class='mb-3'>"
-            "<label class='form-label' for='Peso_kg'>Peso (kg)</label>"
-            f"<input class='form-control' id='Peso_kg' name='Peso_kg' type='number' min='0' max='300' step='0.01' value='{html.escape(values['Peso_kg'])}' />"
-            "</div>"
-        )
+        form.append(campo(
+            "input", "Estatura_cm", "Estatura (cm)", values["Estatura_cm"], type="number",
+            attrs={"min": "30", "max": "250", "step": "0.01"},
+        ))
+        form.append(campo(
+            "input", "Peso_kg", "Peso (kg)", values["Peso_kg"], type="number",
+            attrs={"min": "0", "max": "300", "step": "0.01"},
+        ))
 
         # Campo para subir nueva foto (muestra input file en lugar del nombre)
         if values["Foto"]:
-            form += (
-                "<div class='mb-3'>"
-                "<label class='form-label'>Foto actual</label>"
-                f"<div><img src='/static/img/usuarios/{html.escape(values['Foto'])}' "
-                "class='img-thumbnail' style='max-width: 100px;' "
-                "onerror=\"this.style.display='none'\" /></div>"
-                "</div>"
-            )
+            form.append(campo("foto", "Foto actual", values["Foto"], 100))
 
-        form += (
-            "<div class='mb-3'>"
-            "<label class='form-label' for='Foto'>Nueva foto</label>"
-            "<input class='form-control' id='Foto' name='Foto' type='file' accept='image/*' />"
-            "</div>"
-        )
+        form.append(campo("input", "Foto", "Nueva foto", "", type="file", attrs={"accept": "image/*"}))
 
         # Mantener el nombre de la foto actual si no se sube una nueva
-        form += (
-            f"<input type='hidden' name='FotoActual' value='{html.escape(values['Foto'])}' />"
-        )
+        form.append(campo("hidden", "FotoActual", values["Foto"]))
 
         title = "Nuevo Paciente" if is_new else f"Actualizar Paciente"
-        return (
-            f"<h2 class='mb-3'>{html.escape(title)}</h2>"
-            f"<form method='post' enctype='multipart/form-data'>"
-            f"<input type='hidden' name='d' value='{html.escape(d)}' />"
-            f"{form}"
-            "<button class='btn btn-primary' type='submit'>Guardar</button> "
-            f"<a class='btn btn-outline-secondary' href='{self.path}'>Volver</a>"
-            "</form>"
-            "<script src='/static/js/paciente-validaciones.js'></script>"
+        return render_macro(
+            "form", title, self.path, d, form, multipart=True, script=url_for("static", filename="js/paciente-validaciones.js")
         )
 
     def get_detail(self, id: int) -> str:
@@ -396,36 +305,17 @@ class Paciente:
 
         values = {k: ("" if row.get(k) is None else str(row.get(k))) for k in row.keys()}
 
-        form = ""
         # No mostrar IdPaciente ni IdUsuario en detalle
-        form += self._input("Nombre", "Nombre", str(values.get("Nombre", "")), True)
-        form += self._input("Cedula", "Cedula", str(values.get("Cedula", "")), True)
-        form += self._input("Edad", "Edad", str(values.get("Edad", "")), True, "number")
-        form += self._input("Genero", "Genero", str(values.get("Genero", "")), True)
-        form += self._input("Estatura_cm", "Estatura (cm)", str(values.get("Estatura_cm", "")), True, "number")
-        form += self._input("Peso_kg", "Peso (kg)", str(values.get("Peso_kg", "")), True, "number")
+        form = [campo("fields", self.detail_fields, values, True)]
 
         # Mostrar la foto en lugar del nombre del archivo
         foto = str(values.get("Foto", "") or "")
         if foto:
-            form += (
-                "<div class='mb-3'>"
-                "<label class='form-label'>Foto</label>"
-                f"<div><img src='/static/img/usuarios/{html.escape(foto)}' "
-                "class='img-thumbnail' style='max-width: 150px;' "
-                "onerror=\"this.style.display='none'\" /></div>"
-                "</div>"
-            )
+            form.append(campo("foto", "Foto", foto, 150))
         else:
-            form += self._input("Foto", "Foto", "Sin foto", True)
+            form.append(self._input("Foto", "Foto", "Sin foto", True))
 
-        return (
-            f"<h2 class='mb-3'>Detalle Paciente</h2>"
-            f"<form>"
-            f"{form}"
-            f"<a class='btn btn-outline-secondary' href='{self.path}'>Volver</a>"
-            "</form>"
-        )
+        return render_macro("detail", "Detalle Paciente", self.path, form)
 
     def save(self, form_data) -> str:
         d = form_data.get("d", "")
@@ -468,7 +358,8 @@ class Paciente:
 
         curv.close()
 
-        # Manejo de la foto: si se sube una nueva, se guarda en static/img/usuarios.
+        # Manejo de la foto: si se sube una nueva, se copia a staging y solo se
+        # publica en static/img/usuarios después del commit (promote_foto).
         # Si no, se mantiene la foto actual.
         existing_foto = (form_data.get("FotoActual") or form_data.get("Foto") or "").strip()
         foto_filename = existing_foto
@@ -480,13 +371,10 @@ class Paciente:
 
         filename_raw = (getattr(file, "filename", "") or "") if file else ""
         if file and filename_raw:
-            filename = secure_filename(filename_raw)
-            if filename:
-                upload_dir = Path(current_app.static_folder) / "img" / "usuarios"  # type: ignore[attr-defined]
-                upload_dir.mkdir(parents=True, exist_ok=True)
-                file_path = upload_dir / filename
-                file.save(str(file_path))
-                foto_filename = filename
+            try:
+                foto_filename = stage_foto(file)
+            except ValueError as ex:
+                return self._msg_error(str(ex))
 
         nombre = (form_data.get("Nombre") or "").strip()
         cedula = (form_data.get("Cedula") or "").strip()
@@ -539,12 +427,16 @@ class Paciente:
             if op == "new":
                 cur.execute(self.sql_insert, payload)
                 self.cn.commit()
+                bump_version(self.table_name)
+                promote_foto(foto_filename, ("pacientes", cur.lastrowid))
                 cur.close()
                 return self._msg_success("Paciente creado correctamente")
 
             if op == "act":
                 cur.execute(self.sql_update, (*payload, id_))
                 self.cn.commit()
+                bump_version(self.table_name)
+                promote_foto(foto_filename, ("pacientes", id_), existing_foto)
                 cur.close()
                 return self._msg_success("Paciente actualizado correctamente")
 
@@ -565,6 +457,7 @@ class Paciente:
             cur = self.cn.cursor()
             cur.execute(self.sql_delete, (id,))
             self.cn.commit()
+            bump_version(self.table_name)
             cur.close()
             return self._msg_success("Paciente eliminado correctamente")
         except Exception as ex:
@@ -0,0 +1,244 @@
+from __future__ import annotations
+
+import cProfile
+import json
+import os
+import pstats
+import re
+import threading
+import time
+from collections import defaultdict
+from datetime import datetime
+from pathlib import Path
+
+from flask import current_app, flash, g, redirect, render_template, request, send_file, session, url_for
+
+
+# Activación: ?_perfil=1 o cabecera X-Veris-Perfil (solo administradores)
+PARAM = "_perfil"
+HEADER = "X-Veris-Perfil"
+
+_ID_RE = re.compile(r"^\d+-\d+(-[0-9a-f]{6})?$")
+
+# cProfile es global al proceso desde Python 3.12 (sys.monitoring): un segundo
+# Profile activo lanza ValueError. Se perfila una petición a la vez y las que
+# empiezan mientras tanto marcan el perfil como concurrente (sus llamadas
+# pueden aparecer en el árbol). Las que ya corrían al empezar no se detectan.
+_lock = threading.Lock()
+_activo = False
+_concurrente = False
+
+# Nodos del árbol de llamadas por debajo de esta fracción del total se omiten
+_MIN_FRACCION = 0.005
+_MAX_PROFUNDIDAD = 40
+
+
+def _dir() -> Path:
+    return Path(current_app.config["PERFIL_DIR"])
+
+
+def _nombre_funcion(func: tuple) -> str:
+    filename, line, name = func
+    if filename == "~":  # built-in
+        return name
+    for marca in ("site-packages/", "backend/"):
+        if marca in filename:
+            filename = filename.split(marca, 1)[1]
+            break
+    return f"{name} ({filename}:{line})"
+
+
+def arbol_llamadas(stats: pstats.Stats, total: float) -> list[dict]:
+    """Árbol de llamadas (tiempo acumulado por arista) a partir de pstats."""
+
+    st = stats.stats  # type: ignore[attr-defined]
+    hijos: dict[tuple, list[tuple]] = defaultdict(list)
+    raices = []
+    for func, (_, nc, tt, ct, callers) in st.items():
+        if not callers:
+            raices.append((func, nc, tt, ct))
+        for caller, (e_nc, _, e_tt, e_ct) in callers.items():
+            hijos[caller].append((func, e_nc, e_tt, e_ct))
+
+    minimo = total * _MIN_FRACCION
+
+    def nodo(func, nc, tt, ct, camino: frozenset) -> dict:
+        n = {"f": _nombre_funcion(func), "n": nc, "tt_ms": tt * 1000, "ct_ms": ct * 1000, "hijos": []}
+        if len(camino) < _MAX_PROFUNDIDAD and func not in camino:
+            for h in sorted(hijos.get(func, []), key=lambda x: -x[3]):
+                if h[3] >= minimo:
+                    n["hijos"].append(nodo(*h, camino | {func}))
+        return n
+
+    raices.sort(key=lambda x: -x[3])
+    return [nodo(*r, frozenset()) for r in raices if r[3] >= minimo and "disable" not in r[0][2]]
+
+
+def _observar_sql(evento: str, sql: str, params, segundos: float, filas: int | None) -> None:
+    g.perfil_sql.append(
+        {
+            "t_ms": (time.perf_counter() - g.perfil_t0 - segundos) * 1000,
+            "evento": evento,
+            "sql": " ".join(sql.split())[:500],
+            "ms": segundos * 1000,
+            "filas": filas,
+        }
+    )
+
+
+def _iniciar() -> None:
+    global _activo, _concurrente
+    if _activo:
+        _concurrente = True
+    # Sin el interruptor solo cuestan estas comprobaciones
+    if PARAM not in request.args and HEADER not in request.headers:
+        return
+    if session.get("user_role") != 1:
+        return
+    with _lock:
+        if _activo:
+            g.perfil_ocupado = True
+            return
+        _activo = True
+        _concurrente = False
+    g.perfil_id = f"{int(time.time() * 1000)}-{os.getpid()}-{os.urandom(3).hex()}"
+    g.perfil_sql = []
+    g.sql_observadores = g.get("sql_observadores", []) + [_observar_sql]
+    g.perfil_t0 = time.perf_counter()
+    g.perfil = cProfile.Profile()
+    try:
+        g.perfil.enable()
+    except ValueError:
+        # Otro perfilador (p. ej. un depurador o `python -m cProfile`) ya está activo
+        del g.perfil
+        g.perfil_ocupado = True
+        _liberar()
+
+
+def _liberar() -> None:
+    global _activo
+    with _lock:
+        _activo = False
+
+
+def _marcar(response):
+    if "perfil" in g:
+        g.perfil_status = response.status_code
+        response.headers[HEADER] = url_for("perfiles_ver", perfil_id=g.perfil_id)
+    elif g.get("perfil_ocupado"):
+        response.headers[HEADER] = "ocupado"
+    return response
+
+
+def _guardar(exc) -> None:
+    prof = g.pop("perfil", None)
+    if prof is None:
+        return
+    try:
+        prof.disable()
+    finally:
+        concurrente = _concurrente
+        _liberar()
+    total = time.perf_counter() - g.perfil_t0
+    folder = _dir()
+    folder.mkdir(parents=True, exist_ok=True)
+
+    stats = pstats.Stats(prof)
+    base = folder / g.perfil_id
+    stats.dump_stats(str(base) + ".prof")
+    sql = g.perfil_sql
+    data = {
+        "id": g.perfil_id,
+        "fecha": datetime.now().isoformat(timespec="seconds"),
+        "metodo": request.method,
+        "ruta": request.full_path.rstrip("?"),
+        "endpoint": request.endpoint,
+        "status": g.get("perfil_status", 500),
+        "total_ms": total * 1000,
+        "concurrente": concurrente,
+        "sql_n": sum(1 for s in sql if s["evento"] != "fetch"),
+        "sql_ms": sum(s["ms"] for s in sql),
+        "arbol": arbol_llamadas(stats, total),
+        "sql": sql,
+    }
+    tmp = base.with_suffix(".tmp")
+    tmp.write_text(json.dumps(data), encoding="utf-8")
+    tmp.replace(base.with_suffix(".json"))
+
+    # Buffer circular: solo se conservan los PERFIL_MAX más recientes
+    guardados = sorted(folder.glob("*.json"), key=lambda p: p.stat().st_mtime)
+    for viejo in guardados[: max(0, len(guardados) - current_app.config["PERFIL_MAX"])]:
+        viejo.unlink(missing_ok=True)
+        viejo.with_suffix(".prof").unlink(missing_ok=True)
+
+
+def _solo_admin():
+    if "user_id" not in session:
+        return redirect(url_for("crud.login", next=request.path))
+    if session.get("user_role") != 1:
+        flash("No tiene permiso para acceder al módulo Administrador", "danger")
+        return redirect(url_for("crud.index"))
+    return None
+
+
+def _leer(perfil_id: str) -> dict | None:
+    if not _ID_RE.match(perfil_id):
+        return None
+    try:
+        return json.loads((_dir() / f"{perfil_id}.json").read_text(encoding="utf-8"))
+    except (OSError, ValueError):
+        return None
+
+
+def perfiles():
+    """Perfiles guardados, del más reciente al más antiguo."""
+
+    denegado = _solo_admin()
+    if denegado:
+        return denegado
+
+    lista = []
+    for path in sorted(_dir().glob("*.json"), key=lambda p: p.stat().st_mtime, reverse=True):
+        data = _leer(path.stem)
+        if data:
+            data.pop("arbol", None)
+            data.pop("sql", None)
+            lista.append(data)
+    return render_template("admin_perfiles.html", perfiles=lista, perfil=None, param=PARAM)
+
+
+def perfiles_ver(perfil_id: str):
+    denegado = _solo_admin()
+    if denegado:
+        return denegado
+
+    data = _leer(perfil_id)
+    if not data:
+        flash("El perfil no existe (pudo salir del buffer)", "warning")
+        return redirect(url_for("perfiles"))
+    return render_template("admin_perfiles.html", perfiles=None, perfil=data, param=PARAM)
+
+
+def perfiles_descargar(perfil_id: str):
+    """Descarga el .prof (pstats) para abrirlo con snakeviz o `python -m pstats`."""
+
+    denegado = _solo_admin()
+    if denegado:
+        return denegado
+
+    path = _dir() / f"{perfil_id}.prof"
+    if not _ID_RE.match(perfil_id) or not path.is_file():
+        flash("El perfil no existe (pudo salir del buffer)", "warning")
+        return redirect(url_for("perfiles"))
+    return send_file(path, mimetype="application/octet-stream", as_attachment=True, download_name=f"perfil-{perfil_id}.prof")
+
+
+def init_app(app) -> None:
+    """Perfilado bajo demanda (`?_perfil=1` o cabecera X-Veris-Perfil) y páginas `/admin/perfiles`."""
+
+    app.before_request(_iniciar)
+    app.after_request(_marcar)
+    app.teardown_request(_guardar)
+    app.add_url_rule("/admin/perfiles", "perfiles", perfiles)
+    app.add_url_rule("/admin/perfiles/<perfil_id>", "perfiles_ver", perfiles_ver)
+    app.add_url_rule("/admin/perfiles/<perfil_id>.prof", "perfiles_descargar", perfiles_descargar)
@@ -0,0 +1,95 @@
+from __future__ import annotations
+
+from flask import current_app, g, request
+
+
+# Sentencias SQL (execute/executemany) permitidas en un GET de cada pantalla,
+# con los cachés calientes (referencias y perfil de sesión). Una ruta que pasa
+# de su presupuesto suele ser una consulta por fila o por día que volvió.
+PRESUPUESTOS: dict[str, int] = {
+    "crud.admin": 8,  # las seis tablas del panel más los listados de pacientes y médicos
+    "crud.pacientes": 3,
+    "crud.agendar_cita": 5,
+    "crud.medicos": 3,
+    "crud.atender_consulta": 3,
+    "crud.siguiente_cita": 4,
+}
+
+# Filas leídas (fetch) permitidas, opcional por ruta: detecta un fetchall de
+# una tabla entera que no agrega sentencias. Holgados para los datos de
+# `flask seed` (unas 20 consultas por paciente y 400 por médico). El panel
+# de administración lista tablas completas a propósito y no tiene límite.
+PRESUPUESTOS_FILAS: dict[str, int] = {
+    "crud.pacientes": 500,  # historial de un paciente
+    "crud.agendar_cita": 1500,  # médicos de la especialidad y un mes de citas de uno
+    "crud.medicos": 3000,  # historial de un médico
+    "crud.atender_consulta": 10,
+    "crud.siguiente_cita": 1000,  # un mes de citas del médico
+}
+
+
+class PresupuestoExcedido(RuntimeError):
+    pass
+
+
+def _contar(evento: str, sql: str, params, segundos: float, filas: int | None) -> None:
+    g.presupuesto_sql.append((evento, " ".join(sql.split())[:300], filas))
+
+
+def _iniciar() -> None:
+    if not current_app.config["PRESUPUESTO_SQL"] or request.method != "GET" or request.endpoint not in PRESUPUESTOS:
+        return
+    g.presupuesto_sql = []
+    g.sql_observadores = g.get("sql_observadores", []) + [_contar]
+
+
+def medicion() -> dict | None:
+    """Sentencias, filas leídas y detalle de la petición actual (None si no se midió)."""
+
+    eventos = g.get("presupuesto_sql")
+    if eventos is None:
+        return None
+    sentencias = [sql for evento, sql, _ in eventos if evento != "fetch"]
+    return {
+        "endpoint": request.endpoint,
+        "sentencias": len(sentencias),
+        "filas": sum(filas or 0 for evento, _, filas in eventos if evento == "fetch"),
+        "presupuesto": PRESUPUESTOS.get(request.endpoint or ""),
+        "presupuesto_filas": PRESUPUESTOS_FILAS.get(request.endpoint or ""),
+        "detalle": sentencias,
+    }
+
+
+def excesos(m: dict) -> list[str]:
+    """Límites que la medición `m` supera, descritos (vacío si cumple)."""
+
+    out = []
+    if m["sentencias"] > m["presupuesto"]:
+        out.append(f"{m['sentencias']} sentencias SQL (presupuesto {m['presupuesto']})")
+    if m["presupuesto_filas"] is not None and m["filas"] > m["presupuesto_filas"]:
+        out.append(f"{m['filas']} filas leídas (presupuesto {m['presupuesto_filas']})")
+    return out
+
+
+def _revisar(response):
+    m = medicion()
+    if m is None or not excesos(m):
+        return response
+    msg = "%s hizo %s:\n  %s" % (
+        request.full_path.rstrip("?"),
+        " y ".join(excesos(m)),
+        "\n  ".join(m["detalle"]),
+    )
+    modo = current_app.config["PRESUPUESTO_SQL"]
+    if modo == "error":
+        raise PresupuestoExcedido(msg)
+    if modo == "log":
+        current_app.logger.warning(msg)
+    return response
+
+
+def init_app(app) -> None:
+    """Cuenta SQL y filas por petición de las rutas de PRESUPUESTOS (PRESUPUESTO_SQL = "log" o "error")."""
+
+    app.before_request(_iniciar)
+    app.after_request(_revisar)
@@ -0,0 +1,96 @@
+from __future__ import annotations
+
+import threading
+
+from flask import current_app, g, session
+
+from database.cache import tables_stamp
+from database.connection import get_connection
+
+
+# Perfil de cada rol: tablas de las que depende (su versión invalida el perfil
+# guardado) y consulta por IdUsuario. Las claves son las mismas columnas que
+# usan las vistas (IdMedico, Nombre, Foto, ...).
+PERFILES = {
+    2: (
+        ("medicos", "especialidades"),
+        "SELECT m.IdMedico, m.Nombre, m.Foto, m.Especialidad, e.Descripcion AS NombreEspecialidad "
+        "FROM medicos m LEFT JOIN especialidades e ON m.Especialidad = e.IdEsp "
+        "WHERE m.IdUsuario=%s",
+    ),
+    3: (
+        ("pacientes",),
+        "SELECT IdPaciente, Nombre, Foto FROM pacientes WHERE IdUsuario=%s",
+    ),
+}
+
+# Perfiles tomados de la sesión vs. recargados de la BD en este proceso
+_stats_lock = threading.Lock()
+_stats = {"aciertos": 0, "recargas": 0}
+
+
+def principal_stats() -> dict:
+    with _stats_lock:
+        return dict(_stats)
+
+
+def cargar_principal(cn, user_id: int, rol: int) -> dict | None:
+    """Consulta el perfil (médico o paciente) del usuario y lo deja en la sesión.
+
+    Devuelve el perfil, o None si el rol no tiene perfil o el usuario no tiene
+    registro en la tabla del rol.
+    """
+
+    session.pop("principal", None)
+    if rol not in PERFILES:
+        return None
+
+    tables, sql = PERFILES[rol]
+    # La versión se toma antes de consultar: un cambio concurrente vuelve a recargar
+    version = tables_stamp(tables)[0]
+    cur = cn.cursor(dictionary=True)
+    cur.execute(sql, (user_id,))
+    row = cur.fetchone()
+    cur.close()
+
+    perfil = dict(row or {})
+    # uid/rol atan el perfil al usuario: si la sesión cambia de usuario se recarga
+    session["principal"] = {"v": version, "uid": user_id, "rol": rol, "perfil": perfil}
+    return perfil or None
+
+
+def current_principal(cn=None) -> dict | None:
+    """Perfil del usuario logueado (IdMedico/IdPaciente, Nombre, Foto, ...).
+
+    Se resuelve una vez en el login y se guarda en la sesión; solo se vuelve a
+    consultar si cambió la versión de sus tablas (bump_version al guardar un
+    médico o paciente, o cada CACHE_VERSION_TTL segundos) o si no pertenece
+    al usuario y rol de la sesión. Devuelve una copia; None sin sesión o sin perfil.
+    """
+
+    if "principal" in g:
+        return dict(g.principal) if g.principal else None
+
+    user_id = session.get("user_id")
+    rol = session.get("user_role")
+    perfil: dict | None = None
+    if user_id and rol in PERFILES:
+        saved = session.get("principal")
+        hit = bool(
+            saved
+            and saved.get("uid") == user_id
+            and saved.get("rol") == rol
+            and saved.get("v") == tables_stamp(PERFILES[rol][0])[0]
+        )
+        with _stats_lock:
+            _stats["aciertos" if hit else "recargas"] += 1
+        if hit:
+            perfil = saved.get("perfil") or None  # type: ignore[union-attr]
+        elif cn is not None:
+            perfil = cargar_principal(cn, int(user_id), rol)
+        else:
+            with get_connection(current_app) as new_cn:
+                perfil = cargar_principal(new_cn, int(user_id), rol)
+
+    g.principal = perfil
+    return dict(perfil) if perfil else None
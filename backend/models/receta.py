@@ -1,9 +1,14 @@
 from __future__ import annotations
 
 import base64
-import html
 from typing import Any, Dict, List, Tuple
 
+from flask import url_for
+
+from database.cache import bump_version
+from models.render import campo, render_macro, tabla
+from models.trazas import trazado
+
 
 class Receta:
 
@@ -12,8 +17,26 @@ class Receta:
     title = "Recetas"
     path = "/recetas"
 
-    def __init__(self, cn):
+    # Columnas del listado: (encabezado, clave de la fila, tipo de celda)
+    list_columns = [
+        ("Consulta", "Consulta", "text"),
+        ("Medicamento", "Medicamento", "text"),
+        ("Cantidad", "Cantidad", "num"),
+    ]
+    # Tablas que alimentan el listado (su versión forma el ETag)
+    list_tables = ("recetas", "consultas", "medicamentos")
+    # Campos editables: (name, etiqueta, tipo de input)
+    form_fields = [
+        ("IdConsulta", "IdConsulta", "number"),
+        ("IdMedicamento", "IdMedicamento", "number"),
+        ("Cantidad", "Cantidad", "number"),
+    ]
+
+    def __init__(self, cn, path: str | None = None):
         self.cn = cn
+        # Ruta base de los enlaces (p. ej. "/admin?m=usuarios" desde el dashboard)
+        if path is not None:
+            self.path = path
 
         self.IdReceta: int | None = None
         self.IdConsulta: int | None = None
@@ -21,14 +44,15 @@ class Receta:
         self.Cantidad: int | None = None
 
         # JOINs para mostrar el diagnóstico de la consulta y el nombre del medicamento
-        self.sql_list = (
+        self.sql_select = (
             "SELECT r.IdReceta, r.IdConsulta, r.IdMedicamento, r.Cantidad, "
             "c.Diagnostico AS Consulta, m.Nombre AS Medicamento "
             "FROM recetas r "
             "LEFT JOIN consultas c ON r.IdConsulta = c.IdConsulta "
             "LEFT JOIN medicamentos m ON r.IdMedicamento = m.IdMedicamento "
-            "ORDER BY r.IdReceta DESC"
         )
+        self.sql_order = "ORDER BY r.IdReceta DESC"
+        self.sql_list = self.sql_select + self.sql_order
         self.sql_detail = (
             "SELECT r.IdReceta, r.IdConsulta, r.IdMedicamento, r.Cantidad, "
             "c.Diagnostico AS Consulta, m.Nombre AS Medicamento "
@@ -63,7 +87,7 @@ class Receta:
             '<nav class="navbar navbar-expand-lg navbar-light bg-white shadow-sm py-2">'
             '<div class="container-fluid px-4">'
             '<a class="navbar-brand d-flex flex-column align-items-start" href="/">'
-            '<img src="/static/img/logo.png" alt="Logo Veris" class="img-fluid mb-1" '
+            f'<img src="{url_for("static", filename="img/logo.png")}" alt="Logo Veris" class="img-fluid mb-1" '
             'style="height: 35px; width: auto;">'
             "<span class='slogan'>Hacemos <strong>fácil cuidarte</strong></span>"
             "</a>"
@@ -78,63 +102,24 @@ class Receta:
         )
 
     def _msg_success(self, text: str) -> str:
-        return f'<div class="alert alert-success" role="alert">{html.escape(text)}</div>'
+        return render_macro("alert", "success", text)
 
     def _msg_error(self, text: str) -> str:
-        return f'<div class="alert alert-danger" role="alert">{html.escape(text)}</div>'
+        return render_macro("alert", "danger", text)
 
-    def _input(self, name: str, label: str, value: str, disabled: bool, type_: str = "text") -> str:
-        dis = " disabled" if disabled else ""
-        return (
-            '<div class="mb-3">'
-            f'<label class="form-label" for="{html.escape(name)}">{html.escape(label)}</label>'
-            f'<input class="form-control" id="{html.escape(name)}" name="{html.escape(name)}" '
-            f'type="{html.escape(type_)}" value="{html.escape(value)}"{dis} />'
-            "</div>"
-        )
+    def _input(self, name: str, label: str, value: str, disabled: bool, type_: str = "text") -> tuple:
+        return campo("input", name, label, value, disabled, type_)
 
+    @trazado
     def get_list(self) -> str:
         cur = self.cn.cursor(dictionary=True)
         cur.execute(self.sql_list)
         rows: List[Dict[str, Any]] = cur.fetchall() or []
         cur.close()
 
-        d_new = self._d_encode("new", 0)
-        headers = ["Consulta", "Medicamento", "Cantidad", "Acciones"]
-        thead = "".join(f"<th>{h}</th>" for h in headers)
-
-        tbody = ""
-        for r in rows:
-            pk = int(r["IdReceta"])
-            d_act = self._d_encode("act", pk)
-            d_det = self._d_encode("det", pk)
-            d_del = self._d_encode("del", pk)
-            tbody += (
-                "<tr>"
-                f"<td>{html.escape(str(r.get('Consulta','')))}</td>"
-                f"<td>{html.escape(str(r.get('Medicamento','')))}</td>"
-                f"<td>{html.escape(str(r.get('Cantidad','')))}</td>"
-                "<td>"
-                f"<a class='btn btn-sm btn-primary me-1' href='{self.path}?d={d_act}'>Editar</a>"
-                f"<a class='btn btn-sm btn-outline-secondary me-1' href='{self.path}?d={d_det}'>Detalle</a>"
-                f"<a class='btn btn-sm btn-danger' href='{self.path}?d={d_del}' data-veris-confirm='¿Eliminar este registro?'>Eliminar</a>"
-                "</td>"
-                "</tr>"
-            )
-
-        return (
-            "<main class='container my-4 veris-tabla-container'>"
-            f"<h2 class='veris-tabla-title'>{html.escape(self.title)}</h2>"
-            f"<p class='veris-tabla-actions'><a class='btn veris-tabla-btn-crear' href='{self.path}?d={d_new}'>Crear nuevo</a></p>"
-            "<div class='veris-tabla-wrapper'>"
-            "<table class='table veris-tabla table-bordered table-striped'>"
-            f"<thead class='veris-tabla-thead'><tr>{thead}</tr></thead>"
-            f"<tbody class='veris-tabla-body-content'>{tbody}</tbody>"
-            "</table>"
-            "</div>"
-            "</main>"
-        )
+        return tabla(self.title, self.path, self.list_columns, rows, self.pk)
 
+    @trazado
     def get_form(self, id: int = 0) -> str:
         is_new = id == 0
         op = "new" if is_new else "act"
@@ -152,22 +137,11 @@ class Receta:
                 values[k] = "" if row.get(k) is None else str(row.get(k))
 
         d = self._d_encode(op, id)
-        form = ""
-        form += self._input("IdReceta", "IdReceta", values["IdReceta"], disabled_pk, "number")
-        form += self._input("IdConsulta", "IdConsulta", values["IdConsulta"], False, "number")
-        form += self._input("IdMedicamento", "IdMedicamento", values["IdMedicamento"], False, "number")
-        form += self._input("Cantidad", "Cantidad", values["Cantidad"], False, "number")
+        form = [self._input("IdReceta", "IdReceta", values["IdReceta"], disabled_pk, "number")]
+        form.append(campo("fields", self.form_fields, values))
 
         title = "Nueva Receta" if is_new else f"Actualizar Receta"
-        return (
-            f"<h2 class='mb-3'>{html.escape(title)}</h2>"
-            f"<form method='post'>"
-            f"<input type='hidden' name='d' value='{html.escape(d)}' />"
-            f"{form}"
-            "<button class='btn btn-primary' type='submit'>Guardar</button> "
-            f"<a class='btn btn-outline-secondary' href='{self.path}'>Volver</a>"
-            "</form>"
-        )
+        return render_macro("form", title, self.path, d, form)
 
     def get_detail(self, id: int) -> str:
         cur = self.cn.cursor(dictionary=True)
@@ -177,19 +151,11 @@ class Receta:
         if not row:
             return self._msg_error("Registro no encontrado")
 
-        form = ""
-        form += self._input("IdReceta", "IdReceta", str(row.get("IdReceta", "")), True, "number")
-        form += self._input("IdConsulta", "IdConsulta", str(row.get("IdConsulta", "")), True, "number")
-        form += self._input("IdMedicamento", "IdMedicamento", str(row.get("IdMedicamento", "")), True, "number")
-        form += self._input("Cantidad", "Cantidad", str(row.get("Cantidad", "")), True, "number")
+        values = {k: str(row.get(k, "")) for k in row.keys()}
+        form = [self._input("IdReceta", "IdReceta", values["IdReceta"], True, "number")]
+        form.append(campo("fields", self.form_fields, values, True))
 
-        return (
-            f"<h2 class='mb-3'>Detalle Receta</h2>"
-            f"<form>"
-            f"{form}"
-            f"<a class='btn btn-outline-secondary' href='{self.path}'>Volver</a>"
-            "</form>"
-        )
+        return render_macro("detail", "Detalle Receta", self.path, form)
 
     def save(self, form_data) -> str:
         d = form_data.get("d", "")
@@ -209,12 +175,14 @@ class Receta:
             if op == "new":
                 cur.execute(self.sql_insert, payload)
                 self.cn.commit()
+                bump_version(self.table_name)
                 cur.close()
                 return self._msg_success("Receta creada correctamente")
 
             if op == "act":
                 cur.execute(self.sql_update, (*payload, id_))
                 self.cn.commit()
+                bump_version(self.table_name)
                 cur.close()
                 return self._msg_success("Receta actualizada correctamente")
 
@@ -228,6 +196,7 @@ class Receta:
             cur = self.cn.cursor()
             cur.execute(self.sql_delete, (id,))
             self.cn.commit()
+            bump_version(self.table_name)
             cur.close()
             return self._msg_success("Receta eliminada correctamente")
         except Exception as ex:
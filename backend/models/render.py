@@ -0,0 +1,166 @@
+from __future__ import annotations
+
+import base64
+import os
+import stat
+from decimal import Decimal
+
+from flask import current_app
+from jinja2 import FileSystemBytecodeCache
+from markupsafe import Markup
+
+from models.fotos import foto_url
+
+
+# Plantilla con las macros compartidas por todos los modelos
+MACROS_TEMPLATE = "_crud_macros.html"
+
+
+def bytecode_cache(directory: str = "") -> FileSystemBytecodeCache:
+    """Caché del bytecode de plantillas en `directory` (o la carpeta por usuario de Jinja).
+
+    El bytecode se carga con marshal: una carpeta que otro usuario pueda
+    escribir es ejecución de código en la app, por eso se rechaza.
+    """
+
+    if not directory:
+        return FileSystemBytecodeCache()
+    os.makedirs(directory, mode=0o700, exist_ok=True)
+    st = os.lstat(directory)
+    if (
+        not stat.S_ISDIR(st.st_mode)
+        or (hasattr(os, "getuid") and st.st_uid != os.getuid())
+        or st.st_mode & (stat.S_IWGRP | stat.S_IWOTH)
+    ):
+        raise RuntimeError(f"JINJA_CACHE_DIR inseguro: {directory} debe ser una carpeta del usuario del proceso sin escritura para otros")
+    return FileSystemBytecodeCache(directory)
+
+
+def crud_macros():
+    """Módulo de macros ya compilado.
+
+    Jinja cachea la plantilla (y su módulo) en el entorno de la app, por lo que
+    la compilación ocurre una sola vez por proceso.
+    """
+
+    return current_app.jinja_env.get_template(MACROS_TEMPLATE).module
+
+
+def render_macro(name: str, *args, **kwargs) -> str:
+    """Ejecuta una macro de `_crud_macros.html` y devuelve el HTML como str."""
+
+    return str(getattr(crud_macros(), name)(*args, **kwargs))
+
+
+def campo(name: str, *args, **kwargs) -> tuple:
+    """Pieza de formulario/detalle: la macro `name` con sus argumentos.
+
+    Las macros `form` y `detail` reciben la lista de piezas y las expanden en
+    la misma llamada (sin una llamada a render_macro por campo).
+    """
+
+    return (name, args, kwargs)
+
+
+def d_token(id_: int, op: str) -> Markup:
+    """Filtro Jinja `d_token`: mismo formato que `_d_encode` de los modelos (base64("op/id")).
+
+    El alfabeto base64 urlsafe no requiere escape HTML, por eso se devuelve Markup.
+    """
+
+    return Markup(base64.urlsafe_b64encode(f"{op}/{id_}".encode("utf-8")).decode("utf-8"))
+
+
+def recortar(value, n: int = 60) -> str:
+    """Filtro Jinja `recortar`: texto a `n` caracteres seguido de "..." si era más largo."""
+
+    s = str(value or "")
+    return s[:n] + "..." if len(s) > n else s
+
+
+def _b64(raw: bytes) -> str:
+    return base64.urlsafe_b64encode(raw).decode("ascii")
+
+
+def _e(value) -> str:
+    """Escape HTML con las mismas entidades que `|e` de Jinja, sin crear Markup."""
+
+    return (
+        str(value).replace("&", "&amp;").replace("<", "&lt;").replace(">", "&gt;")
+        .replace("'", "&#39;").replace('"', "&#34;")
+    )
+
+
+def _num(value) -> str:
+    return str(value) if isinstance(value, (int, float, Decimal)) else _e(value)
+
+
+def _foto(value) -> str:
+    if not value:
+        return ""
+    webp = foto_url(value, 64, "webp")
+    source = f"<source srcset='{_e(webp)}' type='image/webp'>" if webp else ""
+    return (
+        f"<div><picture>{source}<img src='{_e(foto_url(value, 64))}' width='50' "
+        f"onerror=\"this.style.display='none'\" /></picture></div><small class='text-muted'>{_e(value)}</small>"
+    )
+
+
+# Contenido de la celda por tipo de columna de `tabla`
+_CELDAS = {"text": _e, "num": _num, "foto": _foto, "trunc": lambda value: _e(recortar(value, 60))}
+
+# Botones de acción de `tabla`: (op, (html antes del href, html después del token))
+_ACCIONES = [
+    ("act", ("<a class='btn btn-sm btn-primary me-1' href='", "'>Editar</a>")),
+    ("det", ("<a class='btn btn-sm btn-outline-secondary me-1' href='", "'>Detalle</a>")),
+    ("del", ("<a class='btn btn-sm btn-danger' href='", "' data-veris-confirm='¿Eliminar este registro?'>Eliminar</a>")),
+]
+
+
+def tabla(
+    title: str,
+    base: str,
+    columns: list[tuple[str, str, str]],
+    rows: list[dict],
+    pk: str,
+    actions: tuple[str, ...] = ("act", "det", "del"),
+    allow_new: bool = True,
+) -> str:
+    """Listado genérico de los modelos.
+
+    `columns` son tuplas (encabezado, clave, tipo) con tipo "text", "num"
+    (números: salen tal cual), "foto" o "trunc" (texto recortado a 60
+    caracteres). `base` puede traer ya una query string ("/admin?m=usuarios").
+
+    Se arma como string y no con una macro: es el bucle por fila de todos los
+    listados y una llamada de Jinja por celda costaba varias veces más. El
+    texto de usuario pasa por `_e`; ids, tokens y números van tal cual.
+    """
+
+    href = _e(base + ("&d=" if "?" in base else "?d="))
+    out = ["\n<main class='container my-4 veris-tabla-container'>\n<h2 class='veris-tabla-title'>", _e(title), "</h2>"]
+    if allow_new:
+        out += ["\n<p class='veris-tabla-actions'><a class='btn veris-tabla-btn-crear' href='", href, d_token(0, "new"), "'>Crear nuevo</a></p>"]
+    out.append("\n<div class='veris-tabla-wrapper'>\n<table class='table veris-tabla table-bordered table-striped'>\n<thead class='veris-tabla-thead'><tr>")
+    out += [f"<th>{_e(label)}</th>" for label, _, _ in columns]
+    out.append("<th>Acciones</th></tr></thead>\n<tbody class='veris-tabla-body-content'>")
+
+    celdas = [(key, _CELDAS[kind]) for _, key, kind in columns if kind in _CELDAS]
+    botones = [(op.encode() + b"/", html) for op, html in _ACCIONES if op in actions]
+    append = out.append
+    for r in rows:
+        d = str(int(r[pk])).encode()
+        append("\n<tr><td>" + "</td><td>".join([celda(r[key]) for key, celda in celdas]) + "</td>\n<td>")
+        for op, (antes, despues) in botones:
+            append(f"{antes}{href}{_b64(op + d)}{despues}")
+        append("</td>\n</tr>")
+    out.append("\n</tbody>\n</table>\n</div>\n</main>")
+    return "".join(out)
+
+
+def init_app(app) -> None:
+    """Registra los filtros de las macros y precompila la plantilla al arrancar."""
+
+    app.jinja_env.filters["d_token"] = d_token
+    app.jinja_env.filters["recortar"] = recortar
+    app.jinja_env.get_template(MACROS_TEMPLATE)
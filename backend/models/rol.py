@@ -1,9 +1,13 @@
 from __future__ import annotations
 
 import base64
-import html
 from typing import Any, Dict, List, Tuple
 
+from flask import url_for
+
+from models.render import campo, render_macro, tabla
+from models.trazas import trazado
+
 
 class Rol:
 
@@ -12,8 +16,16 @@ class Rol:
     title = "Roles"
     path = "/roles"
 
-    def __init__(self, cn):
+    # Columnas del listado: (encabezado, clave de la fila, tipo de celda)
+    list_columns = [("Nombre", "Nombre", "text"), ("Accion", "Accion", "text")]
+    # Tablas que alimentan el listado (su versión forma el ETag)
+    list_tables = ("roles",)
+
+    def __init__(self, cn, path: str | None = None):
         self.cn = cn
+        # Ruta base de los enlaces (p. ej. "/admin?m=usuarios" desde el dashboard)
+        if path is not None:
+            self.path = path
 
         self.IdRol: int | None = None
         self.Nombre: str = ""
@@ -47,7 +59,7 @@ class Rol:
             '<nav class="navbar navbar-expand-lg navbar-light bg-white shadow-sm py-2">'
             '<div class="container-fluid px-4">'
             '<a class="navbar-brand d-flex flex-column align-items-start" href="/">'
-            '<img src="/static/img/logo.png" alt="Logo Veris" class="img-fluid mb-1" '
+            f'<img src="{url_for("static", filename="img/logo.png")}" alt="Logo Veris" class="img-fluid mb-1" '
             'style="height: 35px; width: auto;">'
             "<span class='slogan'>Hacemos <strong>fácil cuidarte</strong></span>"
             "</a>"
@@ -62,54 +74,28 @@ class Rol:
         )
 
     def _msg_success(self, text: str) -> str:
-        return f'<div class="alert alert-success" role="alert">{html.escape(text)}</div>'
+        return render_macro("alert", "success", text)
 
     def _msg_error(self, text: str) -> str:
-        return f'<div class="alert alert-danger" role="alert">{html.escape(text)}</div>'
+        return render_macro("alert", "danger", text)
 
-    def _input(self, name: str, label: str, value: str, disabled: bool, type_: str = "text") -> str:
-        dis = " disabled" if disabled else ""
-        return (
-            '<div class="mb-3">'
-            f'<label class="form-label" for="{html.escape(name)}">{html.escape(label)}</label>'
-            f'<input class="form-control" id="{html.escape(name)}" name="{html.escape(name)}" '
-            f'type="{html.escape(type_)}" value="{html.escape(value)}"{dis} />'
-            "</div>"
-        )
+    def _input(self, name: str, label: str, value: str, disabled: bool, type_: str = "text") -> tuple:
+        return campo("input", name, label, value, disabled, type_)
 
+    @trazado
     def get_list(self) -> str:
         cur = self.cn.cursor(dictionary=True)
         cur.execute(self.sql_list)
         rows: List[Dict[str, Any]] = cur.fetchall() or []
         cur.close()
 
-        header = "".join(f"<th>{h}</th>" for h in ["Nombre", "Accion", "Acciones"])
-        body = ""
-        for r in rows:
-            pk = int(r["IdRol"])
-            d_det = self._d_encode("det", pk)
-            body += (
-                "<tr>"
-                f"<td>{html.escape(str(r.get('Nombre','')))}</td>"
-                f"<td>{html.escape(str(r.get('Accion','')))}</td>"
-                "<td>"
-                f"<a class='btn btn-sm btn-outline-secondary me-1' href='{self.path}?d={d_det}'>Detalle</a>"
-                "</td>"
-                "</tr>"
-            )
-
-        return (
-            "<main class='container my-4 veris-tabla-container'>"
-            f"<h2 class='veris-tabla-title'>{html.escape(self.title)}</h2>"
-            "<div class='veris-tabla-wrapper'>"
-            "<table class='table veris-tabla table-bordered table-striped'>"
-            f"<thead class='veris-tabla-thead'><tr>{header}</tr></thead>"
-            f"<tbody class='veris-tabla-body-content'>{body}</tbody>"
-            "</table>"
-            "</div>"
-            "</main>"
+        # Roles fijos: solo se permite ver el detalle
+        return tabla(
+            self.title, self.path, self.list_columns, rows, self.pk,
+            actions=("det",), allow_new=False,
         )
 
+    @trazado
     def get_form(self, id: int = 0) -> str:
         return self._msg_error("Los roles no pueden ser creados ni modificados")
 
@@ -121,18 +107,12 @@ class Rol:
         if not row:
             return self._msg_error("Registro no encontrado")
 
-        form = ""
+        form = []
         # No mostrar IdRol en detalle
-        form += self._input("Nombre", "Nombre", str(row.get("Nombre", "")), True)
-        form += self._input("Accion", "Accion", str(row.get("Accion", "")), True)
+        form.append(self._input("Nombre", "Nombre", str(row.get("Nombre", "")), True))
+        form.append(self._input("Accion", "Accion", str(row.get("Accion", "")), True))
 
-        return (
-            f"<h2 class='mb-3'>Detalle Rol</h2>"
-            f"<form>"
-            f"{form}"
-            f"<a class='btn btn-outline-secondary' href='{self.path}'>Volver</a>"
-            "</form>"
-        )
+        return render_macro("detail", "Detalle Rol", self.path, form)
 
     def save(self, form_data) -> str:
         return self._msg_error("Los roles no pueden ser creados ni modificados")
@@ -0,0 +1,224 @@
+from __future__ import annotations
+
+import functools
+import hashlib
+import json
+import os
+import random
+import re
+import time
+from contextlib import contextmanager
+
+from flask import before_render_template, current_app, g, has_app_context, request, template_rendered
+
+
+# Contexto entrante: W3C traceparent o, si no viene, X-Request-ID
+_TRACEPARENT_RE = re.compile(r"^00-([0-9a-f]{32})-([0-9a-f]{16})-([0-9a-f]{2})$")
+_HEX32_RE = re.compile(r"^[0-9a-f]{32}$")
+
+# Tipos de span de OTLP
+_INTERNO, _SERVIDOR, _CLIENTE = 1, 2, 3
+
+
+def _activa() -> bool:
+    return has_app_context() and "traza" in g
+
+
+def _nuevo_id() -> str:
+    return os.urandom(8).hex()
+
+
+def _abrir(nombre: str, tipo: int = _INTERNO, inicio_ns: int | None = None, **atributos) -> dict:
+    pila = g.traza_pila
+    s = {
+        "spanId": _nuevo_id(),
+        "parentSpanId": pila[-1]["spanId"] if pila else g.traza_padre,
+        "name": nombre,
+        "kind": tipo,
+        "inicio": inicio_ns or time.time_ns(),
+        "fin": None,
+        "atributos": atributos,
+        "error": None,
+    }
+    g.traza.append(s)
+    pila.append(s)
+    return s
+
+
+def _cerrar(s: dict) -> None:
+    s["fin"] = time.time_ns()
+    pila = g.traza_pila
+    if s in pila:
+        del pila[pila.index(s):]
+
+
+@contextmanager
+def span(nombre: str, **atributos):
+    """Span anidado bajo el actual; no hace nada si la petición no se traza."""
+
+    if not _activa():
+        yield None
+        return
+    s = _abrir(nombre, **atributos)
+    try:
+        yield s
+    except Exception as ex:
+        s["error"] = f"{type(ex).__name__}: {ex}"
+        raise
+    finally:
+        _cerrar(s)
+
+
+def trazado(fn):
+    """Decorador: cada llamada es un span con el nombre calificado de la función."""
+
+    nombre = fn.__qualname__
+
+    @functools.wraps(fn)
+    def envuelta(*args, **kwargs):
+        if not _activa():
+            return fn(*args, **kwargs)
+        with span(nombre):
+            return fn(*args, **kwargs)
+
+    return envuelta
+
+
+def _observar_sql(evento: str, sql: str, params, segundos: float, filas: int | None) -> None:
+    # El observador avisa al terminar: el span empieza `segundos` antes
+    fin = time.time_ns()
+    pila = g.traza_pila
+    g.traza.append(
+        {
+            "spanId": _nuevo_id(),
+            "parentSpanId": pila[-1]["spanId"] if pila else g.traza_padre,
+            "name": f"sql.{evento}",
+            "kind": _CLIENTE,
+            "inicio": fin - int(segundos * 1e9),
+            "fin": fin,
+            "atributos": {"db.system": "mysql", "db.statement": " ".join(sql.split())[:1000], "db.rows": filas},
+            "error": None,
+        }
+    )
+
+
+def _antes_de_render(sender, template, context, **extra) -> None:
+    if _activa():
+        _abrir(f"render {template.name}", template=template.name)
+
+
+def _despues_de_render(sender, template, context, **extra) -> None:
+    if _activa() and g.traza_pila and g.traza_pila[-1]["name"] == f"render {template.name}":
+        _cerrar(g.traza_pila[-1])
+
+
+def _contexto_entrante() -> tuple[str, str | None, bool]:
+    """(trace id, span padre, forzar muestreo) a partir de las cabeceras."""
+
+    m = _TRACEPARENT_RE.match(request.headers.get("traceparent", "").strip().lower())
+    if m and m.group(1) != "0" * 32:
+        return m.group(1), m.group(2), bool(int(m.group(3), 16) & 1)
+    rid = request.headers.get("X-Request-ID", "").strip()
+    if rid:
+        return (rid.lower() if _HEX32_RE.match(rid.lower()) else hashlib.md5(rid.encode()).hexdigest()), None, False
+    return os.urandom(16).hex(), None, False
+
+
+def _iniciar() -> None:
+    trace_id, padre, forzar = _contexto_entrante()
+    if not forzar and random.random() >= current_app.config["TRAZAS_MUESTREO"]:
+        return
+    g.traza = []
+    g.traza_pila = []
+    g.traza_id = trace_id
+    g.traza_padre = padre
+    g.traza_raiz = _abrir(
+        f"{request.method} {request.endpoint or request.path}",
+        _SERVIDOR,
+        **{"http.method": request.method, "http.target": request.full_path.rstrip("?"), "http.route": request.endpoint or ""},
+    )
+    if "X-Request-ID" in request.headers:
+        g.traza_raiz["atributos"]["request.id"] = request.headers["X-Request-ID"][:200]
+    g.sql_observadores = g.get("sql_observadores", []) + [_observar_sql]
+
+
+def _marcar(response):
+    if "traza" in g:
+        g.traza_raiz["atributos"]["http.status_code"] = response.status_code
+        response.headers["traceparent"] = f"00-{g.traza_id}-{g.traza_raiz['spanId']}-01"
+        response.headers.setdefault("X-Request-ID", request.headers.get("X-Request-ID", g.traza_id))
+    return response
+
+
+def _valor(v) -> dict:
+    if isinstance(v, bool):
+        return {"boolValue": v}
+    if isinstance(v, int):
+        return {"intValue": str(v)}
+    if isinstance(v, float):
+        return {"doubleValue": v}
+    return {"stringValue": str(v)}
+
+
+def _otlp(s: dict, trace_id: str) -> dict:
+    out = {
+        "traceId": trace_id,
+        "spanId": s["spanId"],
+        "name": s["name"],
+        "kind": s["kind"],
+        "startTimeUnixNano": str(s["inicio"]),
+        "endTimeUnixNano": str(s["fin"] or time.time_ns()),
+        "attributes": [{"key": k, "value": _valor(v)} for k, v in s["atributos"].items() if v is not None],
+    }
+    if s["parentSpanId"]:
+        out["parentSpanId"] = s["parentSpanId"]
+    if s["error"]:
+        out["status"] = {"code": 2, "message": s["error"]}
+    return out
+
+
+def _exportar(exc) -> None:
+    spans = g.pop("traza", None)
+    if spans is None:
+        return
+    raiz = g.traza_raiz
+    if exc is not None:
+        raiz["error"] = f"{type(exc).__name__}: {exc}"
+    elif raiz["atributos"].get("http.status_code", 500) >= 500:
+        raiz["error"] = "HTTP %s" % raiz["atributos"].get("http.status_code", 500)
+    _cerrar(raiz)
+
+    # Una línea por petición con el formato OTLP/JSON (ExportTraceServiceRequest)
+    linea = json.dumps(
+        {
+            "resourceSpans": [
+                {
+                    "resource": {"attributes": [
+                        {"key": "service.name", "value": {"stringValue": "veris"}},
+                        {"key": "process.pid", "value": {"intValue": str(os.getpid())}},
+                    ]},
+                    "scopeSpans": [{"scope": {"name": "veris"}, "spans": [_otlp(s, g.traza_id) for s in spans]}],
+                }
+            ]
+        },
+        separators=(",", ":"),
+    )
+    # O_APPEND y una sola escritura: las líneas de varios workers no se mezclan
+    fd = os.open(current_app.config["TRAZAS_ARCHIVO"], os.O_WRONLY | os.O_APPEND | os.O_CREAT, 0o644)
+    try:
+        os.write(fd, (linea + "\n").encode())
+    finally:
+        os.close(fd)
+
+
+def init_app(app) -> None:
+    """Con TRAZAS_ARCHIVO traza petición, SQL, modelos, plantillas y fotos en OTLP/JSON."""
+
+    if not app.config.get("TRAZAS_ARCHIVO"):
+        return
+    os.makedirs(os.path.dirname(os.path.abspath(app.config["TRAZAS_ARCHIVO"])), exist_ok=True)
+    app.before_request(_iniciar)
+    app.after_request(_marcar)
+    app.teardown_request(_exportar)
+    before_render_template.connect(_antes_de_render, app)
+    template_rendered.connect(_despues_de_render, app)
@@ -1,9 +1,29 @@
 from __future__ import annotations
 
 import base64
-import html
+import unicodedata
 from typing import Any, Dict, List, Tuple
 
+from flask import url_for
+
+from database.cache import bump_version, get_reference
+from models.render import campo, render_macro, tabla
+from models.trazas import trazado
+
+
+# Largo de usuarios.NombreClave: NFKC y casefold pueden alargar el nombre
+# (varchar(50)), p. ej. "ß" -> "ss" o las ligaduras
+LOGIN_KEY_MAX = 150
+
+
+def login_key(nombre: str) -> str:
+    """Clave de login: el nombre de usuario normalizado (NFKC, sin espacios en
+    los extremos y sin distinguir mayúsculas). Es la columna única
+    usuarios.NombreClave, por la que se busca en login y registro.
+    """
+
+    return unicodedata.normalize("NFKC", nombre or "").strip().casefold()
+
 
 class Usuario:
 
@@ -12,8 +32,16 @@ class Usuario:
     title = "Usuarios"
     path = "/usuarios"
 
-    def __init__(self, cn):
+    # Columnas del listado: (encabezado, clave de la fila, tipo de celda)
+    list_columns = [("Nombre", "Nombre", "text"), ("Rol", "NombreRol", "text")]
+    # Tablas que alimentan el listado (su versión forma el ETag)
+    list_tables = ("usuarios", "roles")
+
+    def __init__(self, cn, path: str | None = None):
         self.cn = cn
+        # Ruta base de los enlaces (p. ej. "/admin?m=usuarios" desde el dashboard)
+        if path is not None:
+            self.path = path
 
         # Columnas principales (respetan nombres de BD)
         self.IdUsuario: int | None = None
@@ -34,8 +62,8 @@ class Usuario:
             "LEFT JOIN roles r ON u.Rol = r.IdRol "
             "WHERE u.IdUsuario=%s"
         )
-        self.sql_insert = "INSERT INTO usuarios(Nombre, Password, Rol) VALUES(%s,%s,%s)"
-        self.sql_update = "UPDATE usuarios SET Nombre=%s, Password=%s, Rol=%s WHERE IdUsuario=%s"
+        self.sql_insert = "INSERT INTO usuarios(Nombre, NombreClave, Password, Rol) VALUES(%s,%s,%s,%s)"
+        self.sql_update = "UPDATE usuarios SET Nombre=%s, NombreClave=%s, Password=%s, Rol=%s WHERE IdUsuario=%s"
         self.sql_delete = "DELETE FROM usuarios WHERE IdUsuario=%s"
 
     # ----------------------------- Base64 d helpers -----------------------------
@@ -70,7 +98,7 @@ class Usuario:
             '<nav class="navbar navbar-expand-lg navbar-light bg-white shadow-sm py-2">'
             '<div class="container-fluid px-4">'
             '<a class="navbar-brand d-flex flex-column align-items-start" href="/">'
-            '<img src="/static/img/logo.png" alt="Logo Veris" class="img-fluid mb-1" '
+            f'<img src="{url_for("static", filename="img/logo.png")}" alt="Logo Veris" class="img-fluid mb-1" '
             'style="height: 35px; width: auto;">'
             "<span class='slogan'>Hacemos <strong>fácil cuidarte</strong></span>"
             "</a>"
@@ -85,88 +113,33 @@ class Usuario:
         )
 
     def _msg_success(self, text: str) -> str:
-        return f'<div class="alert alert-success" role="alert">{html.escape(text)}</div>'
+        return render_macro("alert", "success", text)
 
     def _msg_error(self, text: str) -> str:
-        return f'<div class="alert alert-danger" role="alert">{html.escape(text)}</div>'
+        return render_macro("alert", "danger", text)
 
-    def _input(self, name: str, label: str, value: str, disabled: bool, type_: str = "text") -> str:
-        dis = " disabled" if disabled else ""
-        return (
-            '<div class="mb-3">'
-            f'<label class="form-label" for="{html.escape(name)}">{html.escape(label)}</label>'
-            f'<input class="form-control" id="{html.escape(name)}" name="{html.escape(name)}" '
-            f'type="{html.escape(type_)}" value="{html.escape(value)}"{dis} />'
-            "</div>"
-        )
+    def _input(self, name: str, label: str, value: str, disabled: bool, type_: str = "text") -> tuple:
+        return campo("input", name, label, value, disabled, type_)
 
-    def _select(self, name: str, label: str, options: List[Dict[str, Any]], selected: str, disabled: bool) -> str:
-        dis = " disabled" if disabled else ""
-        out = '<div class="mb-3">'
-        out += f'<label class="form-label" for="{html.escape(name)}">{html.escape(label)}</label>'
-        out += f'<select class="form-select" id="{html.escape(name)}" name="{html.escape(name)}"{dis}>'
-        out += "<option value=''>Seleccione...</option>"
-        for opt in options:
-            vid = str(opt.get("IdRol", ""))
-            vname = str(opt.get("Nombre", ""))
-            sel = " selected" if vid and vid == (selected or "") else ""
-            out += f"<option value='{html.escape(vid)}'{sel}>{html.escape(vname)}</option>"
-        out += "</select></div>"
-        return out
+    def _select(self, name: str, label: str, options: List[Dict[str, Any]], selected: str, disabled: bool) -> tuple:
+        return campo("select", name, label, options, selected, disabled, value_key="IdRol")
 
     def _get_roles_medico_paciente(self) -> List[Dict[str, Any]]:
         """Retorna roles para asignación de usuarios (solo Médico=2 y Paciente=3)."""
 
-        cur = self.cn.cursor(dictionary=True)
-        cur.execute(
-            "SELECT IdRol, Nombre FROM roles WHERE IdRol IN (2,3) ORDER BY IdRol"
-        )
-        rows: List[Dict[str, Any]] = cur.fetchall() or []
-        cur.close()
-        return rows
+        return [r for r in get_reference("roles", self.cn) if r["IdRol"] in (2, 3)]
 
     # ----------------------------- CRUD methods --------------------------------
+    @trazado
     def get_list(self) -> str:
         cur = self.cn.cursor(dictionary=True)
         cur.execute(self.sql_list)
         rows: List[Dict[str, Any]] = cur.fetchall() or []
         cur.close()
 
-        d_new = self._d_encode("new", 0)
-        header = "".join(
-            f"<th>{h}</th>" for h in ["Nombre", "Rol", "Acciones"]
-        )
-        body = ""
-        for r in rows:
-            pk = int(r["IdUsuario"])
-            d_act = self._d_encode("act", pk)
-            d_det = self._d_encode("det", pk)
-            d_del = self._d_encode("del", pk)
-            body += (
-                "<tr>"
-                f"<td>{html.escape(str(r.get('Nombre','')))}</td>"
-                f"<td>{html.escape(str(r.get('NombreRol','')))}</td>"
-                "<td>"
-                f"<a class='btn btn-sm btn-primary me-1' href='{self.path}?d={d_act}'>Editar</a>"
-                f"<a class='btn btn-sm btn-outline-secondary me-1' href='{self.path}?d={d_det}'>Detalle</a>"
-                f"<a class='btn btn-sm btn-danger' href='{self.path}?d={d_del}' data-veris-confirm='¿Eliminar este registro?'>Eliminar</a>"
-                "</td>"
-                "</tr>"
-            )
-
-        return (
-            "<main class='container my-4 veris-tabla-container'>"
-            f"<h2 class='veris-tabla-title'>{html.escape(self.title)}</h2>"
-            f"<p class='veris-tabla-actions'><a class='btn veris-tabla-btn-crear' href='{self.path}?d={d_new}'>Crear nuevo</a></p>"
-            "<div class='veris-tabla-wrapper'>"
-            "<table class='table veris-tabla table-bordered table-striped'>"
-            f"<thead class='veris-tabla-thead'><tr>{header}</tr></thead>"
-            f"<tbody class='veris-tabla-body-content'>{body}</tbody>"
-            "</table>"
-            "</div>"
-            "</main>"
-        )
+        return tabla(self.title, self.path, self.list_columns, rows, self.pk)
 
+    @trazado
     def get_form(self, id: int = 0) -> str:
         is_new = id == 0
         op = "new" if is_new else "act"
@@ -186,24 +159,16 @@ class Usuario:
             }
 
         d = self._d_encode(op, id)
-        form = ""
+        form = []
         # No mostrar IdUsuario en el formulario (se maneja internamente con d)
-        form += self._input("Nombre", "Nombre", values["Nombre"], False)
-        form += self._input("Password", "Password", values["Password"], False, "password")
+        form.append(self._input("Nombre", "Nombre", values["Nombre"], False))
+        form.append(self._input("Password", "Password", values["Password"], False, "password"))
 
         roles = self._get_roles_medico_paciente()
-        form += self._select("Rol", "Rol", roles, values["Rol"], False)
+        form.append(self._select("Rol", "Rol", roles, values["Rol"], False))
 
         title = "Nuevo Usuario" if is_new else f"Actualizar Usuario"
-        return (
-            f"<h2 class='mb-3'>{html.escape(title)}</h2>"
-            f"<form method='post'>"
-            f"<input type='hidden' name='d' value='{html.escape(d)}' />"
-            f"{form}"
-            "<button class='btn btn-primary' type='submit'>Guardar</button> "
-            f"<a class='btn btn-outline-secondary' href='{self.path}'>Volver</a>"
-            "</form>"
-        )
+        return render_macro("form", title, self.path, d, form)
 
     def get_detail(self, id: int) -> str:
         cur = self.cn.cursor(dictionary=True)
@@ -213,19 +178,13 @@ class Usuario:
         if not row:
             return self._msg_error("Registro no encontrado")
 
-        form = ""
+        form = []
         # No mostrar IdUsuario en detalle
-        form += self._input("Nombre", "Nombre", str(row.get("Nombre", "")), True)
-        form += self._input("Password", "Password", str(row.get("Password", "")), True, "password")
-        form += self._input("Rol", "Rol", str(row.get("NombreRol", "")), True)
+        form.append(self._input("Nombre", "Nombre", str(row.get("Nombre", "")), True))
+        form.append(self._input("Password", "Password", str(row.get("Password", "")), True, "password"))
+        form.append(self._input("Rol", "Rol", str(row.get("NombreRol", "")), True))
 
-        return (
-            f"<h2 class='mb-3'>Detalle Usuario</h2>"
-            f"<form>"
-            f"{form}"
-            f"<a class='btn btn-outline-secondary' href='{self.path}'>Volver</a>"
-            "</form>"
-        )
+        return render_macro("detail", "Detalle Usuario", self.path, form)
 
     def save(self, form_data) -> str:
         d = form_data.get("d", "")
@@ -246,17 +205,21 @@ class Usuario:
         if rol not in ("2", "3"):
             return self._msg_error("Rol inválido: seleccione Médico o Paciente")
 
-        # Validar usuario único (case-insensitive) antes de insertar/actualizar
+        # Validar usuario único (case-insensitive) antes de insertar/actualizar:
+        # búsqueda por el índice único de NombreClave
+        clave = login_key(nombre)
+        if len(clave) > LOGIN_KEY_MAX:
+            return self._msg_error("El nombre de usuario es demasiado largo")
         curv = self.cn.cursor(dictionary=True)
         if op == "new":
             curv.execute(
-                "SELECT 1 FROM usuarios WHERE LOWER(Nombre)=LOWER(%s) LIMIT 1",
-                (nombre,),
+                "SELECT 1 FROM usuarios WHERE NombreClave=%s LIMIT 1",
+                (clave,),
             )
         else:
             curv.execute(
-                "SELECT 1 FROM usuarios WHERE LOWER(Nombre)=LOWER(%s) AND IdUsuario<>%s LIMIT 1",
-                (nombre, id_),
+                "SELECT 1 FROM usuarios WHERE NombreClave=%s AND IdUsuario<>%s LIMIT 1",
+                (clave, id_),
             )
         exists = curv.fetchone()
         curv.close()
@@ -266,14 +229,16 @@ class Usuario:
         try:
             cur = self.cn.cursor()
             if op == "new":
-                cur.execute(self.sql_insert, (nombre, password, rol))
+                cur.execute(self.sql_insert, (nombre, clave, password, rol))
                 self.cn.commit()
+                bump_version(self.table_name)
                 cur.close()
                 return self._msg_success("Usuario creado correctamente")
 
             if op == "act":
-                cur.execute(self.sql_update, (nombre, password, rol, id_))
+                cur.execute(self.sql_update, (nombre, clave, password, rol, id_))
                 self.cn.commit()
+                bump_version(self.table_name)
                 cur.close()
                 return self._msg_success("Usuario actualizado correctamente")
 
@@ -299,6 +264,7 @@ class Usuario:
             cur = self.cn.cursor()
             cur.execute(self.sql_delete, (id,))
             self.cn.commit()
+            bump_version(self.table_name)
             cur.close()
             return self._msg_success("Usuario eliminado correctamente")
         except Exception as ex:
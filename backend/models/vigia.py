@@ -0,0 +1,152 @@
+from __future__ import annotations
+
+import json
+import os
+import sys
+import threading
+import time
+import traceback
+from collections import deque
+from datetime import datetime
+
+from flask import Response, current_app, flash, g, redirect, request, session, url_for
+
+from database.connection import seguir_sql_en_curso, sql_en_curso
+
+
+# Peticiones en curso de este proceso: thread id -> datos de la petición
+_activas: dict[int, dict] = {}
+_lock = threading.Lock()
+_capturas: deque = deque(maxlen=50)
+_hilo: threading.Thread | None = None
+_hilo_pid = 0
+
+# Líneas de la pila que se guardan (las más internas)
+_MAX_LINEAS = 60
+
+
+def _capturar(app, tid: int, info: dict, segundos: float) -> dict:
+    frame = sys._current_frames().get(tid)
+    pila = traceback.format_stack(frame) if frame is not None else []
+    pila = "".join(pila).splitlines()[-_MAX_LINEAS:]
+    actual = sql_en_curso(tid)
+    captura = {
+        "fecha": datetime.now().isoformat(timespec="seconds"),
+        "pid": os.getpid(),
+        "metodo": info["metodo"],
+        "ruta": info["ruta"],
+        "endpoint": info["endpoint"],
+        "usuario": info["usuario"],
+        "segundos": round(segundos, 1),
+        "total_s": None,  # se completa cuando la petición termina
+        "sql": " ".join(actual[0].split())[:2000] if actual else None,
+        "sql_segundos": round(actual[1], 1) if actual else None,
+        "pila": pila,
+    }
+    app.logger.warning(
+        "Petición lenta %.1f s: %s %s [%s]%s\n%s",
+        segundos,
+        info["metodo"],
+        info["ruta"],
+        info["endpoint"],
+        f"\n  SQL ({captura['sql_segundos']} s): {captura['sql']}" if actual else "",
+        "\n".join(pila),
+    )
+    return captura
+
+
+def _vigilar(app, umbral: float) -> None:
+    intervalo = min(1.0, umbral / 4)
+    while True:
+        time.sleep(intervalo)
+        ahora = time.monotonic()
+        with _lock:
+            vencidas = [(tid, info) for tid, info in _activas.items() if not info["captura"] and ahora - info["inicio"] >= umbral]
+        for tid, info in vencidas:
+            try:
+                captura = _capturar(app, tid, info, ahora - info["inicio"])
+            except Exception:
+                app.logger.exception("No se pudo capturar la petición lenta")
+                continue
+            with _lock:
+                # La petición pudo terminar mientras se capturaba
+                if _activas.get(tid) is info:
+                    info["captura"] = captura
+                    _capturas.append(captura)
+
+
+def _asegurar_hilo(app) -> None:
+    """Arranca el vigía en este proceso (tras un fork de gunicorn el hilo no existe)."""
+
+    global _hilo, _hilo_pid
+    if _hilo is not None and _hilo.is_alive() and _hilo_pid == os.getpid():
+        return
+    with _lock:
+        if _hilo is not None and _hilo.is_alive() and _hilo_pid == os.getpid():
+            return
+        _activas.clear()
+        _hilo_pid = os.getpid()
+        _hilo = threading.Thread(
+            target=_vigilar, args=(app, app.config["VIGIA_SEGUNDOS"]), name="vigia", daemon=True
+        )
+        _hilo.start()
+
+
+def _inicio() -> None:
+    _asegurar_hilo(current_app._get_current_object())  # type: ignore[attr-defined]
+    g.vigia_tid = threading.get_ident()
+    info = {
+        "inicio": time.monotonic(),
+        "metodo": request.method,
+        "ruta": request.full_path.rstrip("?"),
+        "endpoint": request.endpoint,
+        "usuario": session.get("user_id"),
+        "captura": None,
+    }
+    with _lock:
+        _activas[g.vigia_tid] = info
+
+
+def _fin(exc) -> None:
+    tid = g.pop("vigia_tid", None)
+    if tid is None:
+        return
+    with _lock:
+        info = _activas.pop(tid, None)
+    if info and info["captura"]:
+        info["captura"]["total_s"] = round(time.monotonic() - info["inicio"], 1)
+
+
+def admin_vigia():
+    """JSON con las peticiones lentas capturadas por este worker, de la más reciente a la más antigua."""
+
+    if "user_id" not in session:
+        return redirect(url_for("crud.login", next=request.path))
+
+    if session.get("user_role") != 1:
+        flash("No tiene permiso para acceder al módulo Administrador", "danger")
+        return redirect(url_for("crud.index"))
+
+    ahora = time.monotonic()
+    with _lock:
+        capturas = list(reversed(_capturas))
+        en_curso = [
+            {"metodo": i["metodo"], "ruta": i["ruta"], "endpoint": i["endpoint"], "segundos": round(ahora - i["inicio"], 1)}
+            for i in _activas.values()
+        ]
+    data = {"umbral_s": current_app.config["VIGIA_SEGUNDOS"], "en_curso": en_curso, "capturas": capturas}
+    resp = Response(json.dumps(data), mimetype="application/json")
+    resp.headers["Cache-Control"] = "no-store"
+    return resp
+
+
+def init_app(app) -> None:
+    """Con VIGIA_SEGUNDOS > 0 captura pila y SQL de las peticiones que lo superan; ver `/admin/vigia`."""
+
+    global _capturas
+    app.add_url_rule("/admin/vigia", "admin_vigia", admin_vigia)
+    if app.config.get("VIGIA_SEGUNDOS", 0) > 0:
+        _capturas = deque(_capturas, maxlen=app.config["VIGIA_MAX"])
+        seguir_sql_en_curso()
+        app.before_request(_inicio)
+        app.teardown_request(_fin)
@@ -1,22 +1,43 @@
 from __future__ import annotations
 
 import calendar as pycalendar
-from pathlib import Path
-from datetime import date, datetime, timedelta
-
-from flask import Blueprint, current_app, render_template, request, redirect, url_for, flash, session
-from werkzeug.utils import secure_filename
-
+import csv
+import hashlib
+import io
+import json
+import zlib
+from datetime import date, datetime, timedelta, timezone
+
+from flask import (
+    Blueprint,
+    Response,
+    current_app,
+    render_template,
+    request,
+    redirect,
+    stream_with_context,
+    url_for,
+    flash,
+    g,
+    session,
+)
+from werkzeug.exceptions import RequestEntityTooLarge
+from werkzeug.http import is_resource_modified
+
+from database.cache import bump_version, get_reference, tables_stamp
 from database.connection import get_connection
 
-from models.consulta import Consulta
+from models.consulta import Consulta, hay_choque
 from models.especialidad import Especialidad
+from models.fotos import cola_stats, promote_foto, stage_foto
+from models.importacion import Importacion
 from models.medicamento import Medicamento
 from models.medico import Medico
 from models.paciente import Paciente
+from models.principal import cargar_principal, current_principal
 from models.receta import Receta
 from models.rol import Rol
-from models.usuario import Usuario
+from models.usuario import LOGIN_KEY_MAX, Usuario, login_key
 
 
 bp = Blueprint("crud", __name__)
@@ -39,32 +60,82 @@ def inject_session_info() -> dict:
     return {"session_info": get_session_info()}
 
 
+def _conditional_get(tables) -> Response | None:
+    """GET condicional de una página construida con las filas de `tables`.
+
+    El ETag combina las versiones de las tablas con el usuario, la URL y la
+    fecha (hay vistas que dependen de "hoy"). Si el cliente ya tiene esa
+    versión se responde 304 sin consultar ni renderizar; si no, los
+    validadores quedan en `g` y `_add_validators` los agrega a la respuesta.
+    """
+
+    # Con mensajes flash pendientes la página debe renderizarse para mostrarlos
+    if request.method != "GET" or session.get("_flashes"):
+        return None
+
+    stamp, last = tables_stamp(tables)
+    key = f"{session.get('user_id')}|{session.get('user_role')}|{date.today().isoformat()}|{request.full_path}|{stamp}"
+    etag = hashlib.sha1(key.encode("utf-8")).hexdigest()
+    last_modified = datetime.fromtimestamp(int(last), timezone.utc) if last else None
+
+    if not is_resource_modified(request.environ, etag=etag, last_modified=last_modified):
+        resp = Response(status=304)
+        resp.set_etag(etag)
+        # Un 304 repite el Cache-Control que tendría el 200 (RFC 9110, 15.4.5)
+        resp.headers["Cache-Control"] = "private, no-cache"
+        return resp
+
+    g.page_validators = (etag, last_modified)
+    return None
+
+
+@bp.after_request
+def _add_validators(response):
+    validators = g.pop("page_validators", None)
+    if validators and response.status_code == 200:
+        etag, last_modified = validators
+        response.set_etag(etag)
+        if last_modified:
+            response.last_modified = last_modified
+        # La página depende de la sesión: el navegador debe revalidar siempre
+        response.headers["Cache-Control"] = "private, no-cache"
+    return response
+
+
+@bp.app_errorhandler(RequestEntityTooLarge)
+def _upload_too_large(ex):
+    """Subida mayor que MAX_CONTENT_LENGTH: volver al formulario con un mensaje."""
+
+    limite_mb = (current_app.config.get("MAX_CONTENT_LENGTH") or 0) / (1024 * 1024)
+    flash(f"El archivo supera el tamaño máximo permitido ({limite_mb:.0f} MB)", "danger")
+    return redirect(request.full_path if request.query_string else request.path)
+
+
 _MAX_AGENDAR_FECHA = date(2030, 12, 31)
 
 
+def _jsonable_value(v):
+    """Convierte un valor date/datetime/timedelta a un tipo serializable por JSON."""
+
+    if isinstance(v, (date, datetime)):
+        return v.isoformat()
+    if isinstance(v, timedelta):
+        # MySQL TIME puede llegar como timedelta: formatear a HH:MM:SS
+        total = int(v.total_seconds())
+        h = total // 3600
+        m = (total % 3600) // 60
+        s = total % 60
+        return f"{h:02d}:{m:02d}:{s:02d}"
+    return v
+
+
 def _rows_to_jsonable(rows: list[dict] | None) -> list[dict]:
     """Convierte filas con date/datetime/timedelta a tipos serializables por JSON."""
 
     if not rows:
         return []
 
-    converted: list[dict] = []
-    for row in rows:
-        new_row: dict = {}
-        for k, v in row.items():
-            if isinstance(v, (date, datetime)):
-                new_row[k] = v.isoformat()
-            elif isinstance(v, timedelta):
-                # MySQL TIME puede llegar como timedelta: formatear a HH:MM:SS
-                total = int(v.total_seconds())
-                h = total // 3600
-                m = (total % 3600) // 60
-                s = total % 60
-                new_row[k] = f"{h:02d}:{m:02d}:{s:02d}"
-            else:
-                new_row[k] = v
-        converted.append(new_row)
-    return converted
+    return [{k: _jsonable_value(v) for k, v in row.items()} for row in rows]
 
 
 def _parse_int(value: str | None, default: int) -> int:
@@ -157,18 +228,28 @@ def _build_calendar(anio: int, mes: int, today: date, selected_iso: str | None,
     return weeks
 
 
-def _get_paciente_id_for_user(cn, user_id: int) -> int | None:
+def _ocupados_del_mes(cn, id_medico: int, anio: int, mes: int) -> dict[str, list[dict]]:
+    """HI/HF de las consultas del médico en el mes, por fecha ISO (una sola consulta)."""
+
+    _, days_in_month = pycalendar.monthrange(anio, mes)
     cur = cn.cursor(dictionary=True)
-    cur.execute("SELECT IdPaciente FROM pacientes WHERE IdUsuario=%s", (user_id,))
-    row = cur.fetchone()
+    cur.execute(
+        "SELECT FechaConsulta, HI, HF FROM consultas WHERE IdMedico=%s AND FechaConsulta BETWEEN %s AND %s",
+        (id_medico, date(anio, mes, 1).isoformat(), date(anio, mes, days_in_month).isoformat()),
+    )
+    por_dia: dict[str, list[dict]] = {}
+    for r in cur.fetchall() or []:
+        fecha = r.get("FechaConsulta")
+        por_dia.setdefault(fecha.isoformat() if hasattr(fecha, "isoformat") else str(fecha), []).append(r)
     cur.close()
-    if not row:
-        return None
-    return row.get("IdPaciente")
+    return por_dia
+
 
+def _get_available_slots_30m(cn, id_medico: int, fecha_iso: str, franja_hi, franja_hf, busy_rows: list[dict] | None = None) -> list[str]:
+    """Calcula horarios disponibles (inicio) en intervalos de 30 min.
 
-def _get_available_slots_30m(cn, id_medico: int, fecha_iso: str, franja_hi, franja_hf) -> list[str]:
-    """Calcula horarios disponibles (inicio) en intervalos de 30 min."""
+    `busy_rows` (de `_ocupados_del_mes`) evita la consulta a consultas del día.
+    """
 
     start_min = _time_to_minutes(franja_hi)
     end_min = _time_to_minutes(franja_hf)
@@ -185,13 +266,14 @@ def _get_available_slots_30m(cn, id_medico: int, fecha_iso: str, franja_hi, fran
         m += slot_len
 
     # Ocupados por consultas existentes
-    cur = cn.cursor(dictionary=True)
-    cur.execute(
-        "SELECT HI, HF FROM consultas WHERE IdMedico=%s AND FechaConsulta=%s",
-        (id_medico, fecha_iso),
-    )
-    busy_rows = cur.fetchall() or []
-    cur.close()
+    if busy_rows is None:
+        cur = cn.cursor(dictionary=True)
+        cur.execute(
+            "SELECT HI, HF FROM consultas WHERE IdMedico=%s AND FechaConsulta=%s",
+            (id_medico, fecha_iso),
+        )
+        busy_rows = cur.fetchall() or []
+        cur.close()
 
     busy: list[tuple[int, int]] = []
     for r in busy_rows:
@@ -224,6 +306,11 @@ def _render_crud_page(model, content_html: str):
 def _handle_model(ModelClass):
     """Manejador genérico para GET/POST usando navegación d=base64(op/id)."""
 
+    if not request.args.get("d"):
+        not_modified = _conditional_get(ModelClass.list_tables)
+        if not_modified:
+            return not_modified
+
     with get_connection(current_app) as cn:
         model = ModelClass(cn)
 
@@ -253,6 +340,26 @@ def _handle_model(ModelClass):
         return _render_crud_page(model, model.get_list())
 
 
+# Módulos que exigen un rol al iniciar sesión con `next`: prefijo, rol, nombre del rol
+_ROL_POR_MODULO = (
+    ("/medicos", 2, "Médico"),
+    ("/pacientes", 3, "Paciente"),
+    ("/usuarios", 1, "Administrador"),
+    ("/roles", 1, "Administrador"),
+    ("/especialidades", 1, "Administrador"),
+    ("/medicamentos", 1, "Administrador"),
+)
+
+
+def _rol_no_permitido(next_page: str, rol: int) -> str | None:
+    """Nombre del rol que exige `next_page` si el usuario no lo tiene; None si puede entrar."""
+
+    for prefijo, requerido, nombre in _ROL_POR_MODULO:
+        if next_page.startswith(prefijo) and rol != requerido:
+            return nombre
+    return None
+
+
 @bp.get("/")
 def index():
     # Landing simple (usa templates existentes)
@@ -275,11 +382,16 @@ def login():
             with get_connection(current_app) as cn:
                 cur = cn.cursor(dictionary=True)
                 cur.execute(
-                    "SELECT IdUsuario, Nombre, Rol FROM usuarios WHERE Nombre=%s AND Password=%s",
-                    (username, password),
+                    "SELECT IdUsuario, Nombre, Rol FROM usuarios WHERE NombreClave=%s AND Password=%s",
+                    (login_key(username), password),
                 )
                 user = cur.fetchone()
                 cur.close()
+                rechazo = _rol_no_permitido(next_page, user["Rol"]) if user else None
+                # Perfil del rol (médico/paciente) resuelto una sola vez por sesión,
+                # solo con el login ya aceptado
+                if user and not rechazo:
+                    cargar_principal(cn, user["IdUsuario"], user["Rol"])
         except Exception as ex:
             flash(f"Error al conectar con la base de datos: {ex}", "danger")
             return render_template("login.html", next_page=next_page)
@@ -289,29 +401,8 @@ def login():
             return render_template("login.html", next_page=next_page)
 
         # Validar que el rol del usuario coincida con el módulo al que intenta acceder.
-        requested_path = next_page or ""
-        if requested_path.startswith("/medicos") and user["Rol"] != 2:
-            flash("Las credenciales ingresadas pertenecen a un usuario que no es Médico.", "danger")
-            return render_template("login.html", next_page=next_page)
-
-        if requested_path.startswith("/pacientes") and user["Rol"] != 3:
-            flash("Las credenciales ingresadas pertenecen a un usuario que no es Paciente.", "danger")
-            return render_template("login.html", next_page=next_page)
-
-        if requested_path.startswith("/usuarios") and user["Rol"] != 1:
-            flash("Las credenciales ingresadas pertenecen a un usuario que no es Administrador.", "danger")
-            return render_template("login.html", next_page=next_page)
-
-        if requested_path.startswith("/roles") and user["Rol"] != 1:
-            flash("Las credenciales ingresadas pertenecen a un usuario que no es Administrador.", "danger")
-            return render_template("login.html", next_page=next_page)
-
-        if requested_path.startswith("/especialidades") and user["Rol"] != 1:
-            flash("Las credenciales ingresadas pertenecen a un usuario que no es Administrador.", "danger")
-            return render_template("login.html", next_page=next_page)
-
-        if requested_path.startswith("/medicamentos") and user["Rol"] != 1:
-            flash("Las credenciales ingresadas pertenecen a un usuario que no es Administrador.", "danger")
+        if rechazo:
+            flash(f"Las credenciales ingresadas pertenecen a un usuario que no es {rechazo}.", "danger")
             return render_template("login.html", next_page=next_page)
 
         session["user_id"] = user["IdUsuario"]
@@ -416,13 +507,8 @@ def register():
         return all(p[0].isupper() for p in parts)
 
     def load_form_data():
-        with get_connection(current_app) as cn:
-            cur = cn.cursor(dictionary=True)
-            cur.execute("SELECT IdRol, Nombre FROM roles WHERE IdRol IN (2,3) ORDER BY IdRol")
-            roles = cur.fetchall() or []
-            cur.execute("SELECT IdEsp, Descripcion FROM especialidades ORDER BY Descripcion")
-            especialidades = cur.fetchall() or []
-            cur.close()
+        roles = [r for r in get_reference("roles") if r["IdRol"] in (2, 3)]
+        especialidades = get_reference("especialidades")
         return roles, especialidades
 
     if request.method == "GET":
@@ -444,6 +530,10 @@ def register():
         flash("Usuario y contraseña son obligatorios", "danger")
         return render_template("register.html", roles=roles, especialidades=especialidades)
 
+    if len(login_key(username)) > LOGIN_KEY_MAX:
+        flash("El nombre de usuario es demasiado largo", "danger")
+        return render_template("register.html", roles=roles, especialidades=especialidades)
+
     if rol not in (2, 3):
         flash("Debe seleccionar un rol (Médico o Paciente)", "danger")
         return render_template("register.html", roles=roles, especialidades=especialidades)
@@ -454,7 +544,8 @@ def register():
         flash("El nombre completo es obligatorio", "danger")
         return render_template("register.html", roles=roles, especialidades=especialidades)
 
-    # Foto opcional
+    # Foto opcional: queda en staging hasta el commit; si el registro se rechaza,
+    # la borra el barrido de staging
     foto_filename = ""
     try:
         file = request.files.get("Foto")  # type: ignore[attr-defined]
@@ -463,19 +554,17 @@ def register():
 
     filename_raw = (getattr(file, "filename", "") or "") if file else ""
     if file and filename_raw:
-        filename = secure_filename(filename_raw)
-        if filename:
-            upload_dir = Path(current_app.static_folder) / "img" / "usuarios"  # type: ignore[attr-defined]
-            upload_dir.mkdir(parents=True, exist_ok=True)
-            file_path = upload_dir / filename
-            file.save(str(file_path))
-            foto_filename = filename
+        try:
+            foto_filename = stage_foto(file)
+        except ValueError as ex:
+            flash(str(ex), "danger")
+            return render_template("register.html", roles=roles, especialidades=especialidades)
 
     try:
         with get_connection(current_app) as cn:
             cur = cn.cursor(dictionary=True)
             # Usuario único por Nombre
-            cur.execute("SELECT 1 FROM usuarios WHERE LOWER(Nombre)=LOWER(%s) LIMIT 1", (username,))
+            cur.execute("SELECT 1 FROM usuarios WHERE NombreClave=%s LIMIT 1", (login_key(username),))
             if cur.fetchone():
                 cur.close()
                 flash("Ese usuario ya existe", "danger")
@@ -483,7 +572,10 @@ def register():
 
             # Insert usuario
             cur2 = cn.cursor()
-            cur2.execute("INSERT INTO usuarios(Nombre, Password, Rol) VALUES(%s,%s,%s)", (username, password, rol))
+            cur2.execute(
+                "INSERT INTO usuarios(Nombre, NombreClave, Password, Rol) VALUES(%s,%s,%s,%s)",
+                (username, login_key(username), password, rol),
+            )
             user_id = int(cur2.lastrowid)
             cur2.close()
 
@@ -555,6 +647,8 @@ def register():
                     (user_id, nombre_perfil, cedula, edad, genero, estatura, peso, foto_filename),
                 )
                 cn.commit()
+                bump_version("usuarios", "pacientes")
+                promote_foto(foto_filename, ("pacientes", cur.lastrowid))
                 cur.close()
                 flash("Registro de Paciente creado correctamente", "success")
                 return redirect(url_for("crud.login"))
@@ -578,6 +672,8 @@ def register():
                 (nombre_perfil, especialidad, user_id, foto_filename),
             )
             cn.commit()
+            bump_version("usuarios", "medicos")
+            promote_foto(foto_filename, ("medicos", cur.lastrowid))
             cur.close()
             flash("Registro de Médico creado correctamente", "success")
             return redirect(url_for("crud.login"))
@@ -620,6 +716,13 @@ def admin():
     module = request.args.get("m", "usuarios")
     d_param = request.args.get("d", "")
 
+    # Sin operación (d) el dashboard solo muestra los listados de cada modelo
+    if not d_param:
+        tables = {t for M in (Usuario, Rol, Paciente, Medico, Especialidad, Medicamento) for t in M.list_tables}
+        not_modified = _conditional_get(sorted(tables))
+        if not_modified:
+            return not_modified
+
     def handle_model(model, active: bool):
         """Versión interna de _handle_model adaptada al dashboard admin.
 
@@ -656,14 +759,18 @@ def admin():
 
         return model.get_list()
 
+    def admin_path(m: str) -> str:
+        # Los enlaces de cada modelo se generan ya dentro de /admin
+        return url_for("crud.admin", m=m)
+
     # Cargar tablas de cada módulo utilizando los modelos existentes
     with get_connection(current_app) as cn:
-        usuarios_model = Usuario(cn)
-        roles_model = Rol(cn)
-        pacientes_model = Paciente(cn)
-        medicos_model = Medico(cn)
-        especialidades_model = Especialidad(cn)
-        medicamentos_model = Medicamento(cn)
+        usuarios_model = Usuario(cn, admin_path("usuarios"))
+        roles_model = Rol(cn, admin_path("roles"))
+        pacientes_model = Paciente(cn, admin_path("pacientes"))
+        medicos_model = Medico(cn, admin_path("medicos"))
+        especialidades_model = Especialidad(cn, admin_path("especialidades"))
+        medicamentos_model = Medicamento(cn, admin_path("medicamentos"))
 
         usuarios_html = handle_model(usuarios_model, module == "usuarios")
         roles_html = handle_model(roles_model, module == "roles")
@@ -688,25 +795,6 @@ def admin():
         session["lista_pacientes"] = lista_pacientes
         session["lista_medicos"] = lista_medicos
 
-    # Reescribir enlaces para que las acciones sigan dentro de /admin
-    usuarios_html = usuarios_html.replace("/usuarios?d=", "/admin?m=usuarios&d=")
-    usuarios_html = usuarios_html.replace("href='/usuarios'", "href='/admin?m=usuarios'")
-
-    roles_html = roles_html.replace("/roles?d=", "/admin?m=roles&d=")
-    roles_html = roles_html.replace("href='/roles'", "href='/admin?m=roles'")
-
-    pacientes_html = pacientes_html.replace("/pacientes?d=", "/admin?m=pacientes&d=")
-    pacientes_html = pacientes_html.replace("href='/pacientes'", "href='/admin?m=pacientes'")
-
-    medicos_html = medicos_html.replace("/medicos?d=", "/admin?m=medicos&d=")
-    medicos_html = medicos_html.replace("href='/medicos'", "href='/admin?m=medicos'")
-
-    especialidades_html = especialidades_html.replace("/especialidades?d=", "/admin?m=especialidades&d=")
-    especialidades_html = especialidades_html.replace("href='/especialidades'", "href='/admin?m=especialidades'")
-
-    medicamentos_html = medicamentos_html.replace("/medicamentos?d=", "/admin?m=medicamentos&d=")
-    medicamentos_html = medicamentos_html.replace("href='/medicamentos'", "href='/admin?m=medicamentos'")
-
     return render_template(
         "admin_dashboard.html",
         usuarios_html=usuarios_html,
@@ -721,6 +809,195 @@ def admin():
     )
 
 
+# Exportaciones del administrador: modelo (sql_select/sql_order) y columna
+# de fecha para el filtro desde/hasta (None si la tabla no tiene fecha)
+_EXPORTS = {
+    "consultas": (Consulta, "c.FechaConsulta"),
+    "recetas": (Receta, "c.FechaConsulta"),
+    "pacientes": (Paciente, None),
+    "medicos": (Medico, None),
+}
+
+
+def _export_chunks(tabla: str, formato: str, desde: date | None, hasta: date | None, batch: int):
+    """Genera el archivo exportado por lotes desde un cursor sin buffer.
+
+    Cada lote de `fetchmany` se serializa y se entrega al cliente antes de leer
+    el siguiente, así la memoria no crece con el número de filas.
+    """
+
+    ModelClass, date_column = _EXPORTS[tabla]
+
+    with get_connection(current_app) as cn:
+        model = ModelClass(cn)
+
+        where: list[str] = []
+        params: list = []
+        if date_column and desde:
+            where.append(f"{date_column} >= %s")
+            params.append(desde)
+        if date_column and hasta:
+            where.append(f"{date_column} <= %s")
+            params.append(hasta)
+
+        sql = model.sql_select
+        if where:
+            sql += "WHERE " + " AND ".join(where) + " "
+        sql += model.sql_order
+
+        cur = cn.cursor(buffered=False)
+        try:
+            cur.execute(sql, tuple(params))
+            cols = list(cur.column_names)
+
+            buf = io.StringIO()
+            writer = csv.writer(buf)
+            if formato == "csv":
+                writer.writerow(cols)
+                yield buf.getvalue()
+                buf.seek(0)
+                buf.truncate()
+
+            while True:
+                rows = cur.fetchmany(batch)
+                if not rows:
+                    break
+
+                if formato == "csv":
+                    writer.writerows([_jsonable_value(v) for v in row] for row in rows)
+                else:
+                    for row in rows:
+                        buf.write(
+                            json.dumps(
+                                {k: _jsonable_value(v) for k, v in zip(cols, row)},
+                                ensure_ascii=False,
+                                default=str,
+                            )
+                        )
+                        buf.write("\n")
+
+                yield buf.getvalue()
+                buf.seek(0)
+                buf.truncate()
+        finally:
+            # Si el cliente corta la descarga quedan filas sin leer en el cursor
+            try:
+                cur.close()
+            except Exception:
+                pass
+
+
+def _gzip_chunks(chunks):
+    """Comprime al vuelo (formato gzip) los fragmentos de texto generados."""
+
+    z = zlib.compressobj(6, zlib.DEFLATED, 31)
+    for chunk in chunks:
+        data = z.compress(chunk.encode("utf-8"))
+        if data:
+            yield data
+    yield z.flush()
+
+
+@bp.get("/admin/exportar/<tabla>")
+def admin_exportar(tabla: str):
+    """Descarga CSV/NDJSON de consultas, recetas, pacientes o médicos.
+
+    Parámetros: formato=csv|ndjson, desde/hasta=YYYY-MM-DD (consultas y
+    recetas, por FechaConsulta) y gzip=1 para comprimir la salida.
+    """
+
+    if "user_id" not in session:
+        return redirect(url_for("crud.login", next=request.path))
+
+    if session.get("user_role") != 1:
+        flash("No tiene permiso para acceder al módulo Administrador", "danger")
+        return redirect(url_for("crud.index"))
+
+    formato = (request.args.get("formato") or "csv").lower()
+    if tabla not in _EXPORTS or formato not in ("csv", "ndjson"):
+        flash("Exportación no disponible", "danger")
+        return redirect(url_for("crud.admin"))
+
+    try:
+        desde = date.fromisoformat(request.args["desde"]) if request.args.get("desde") else None
+        hasta = date.fromisoformat(request.args["hasta"]) if request.args.get("hasta") else None
+    except ValueError:
+        flash("Rango de fechas inválido (use AAAA-MM-DD)", "danger")
+        return redirect(url_for("crud.admin"))
+
+    batch = current_app.config.get("EXPORT_BATCH_SIZE", 1000)
+    chunks = _export_chunks(tabla, formato, desde, hasta, batch)
+
+    filename = f"{tabla}.{formato}"
+    mimetype = "text/csv" if formato == "csv" else "application/x-ndjson"
+    if request.args.get("gzip") == "1":
+        body = _gzip_chunks(chunks)
+        filename += ".gz"
+        mimetype = "application/gzip"
+    else:
+        body = (chunk.encode("utf-8") for chunk in chunks)
+
+    resp = Response(stream_with_context(body), mimetype=mimetype)
+    resp.headers["Content-Disposition"] = f"attachment; filename={filename}"
+    # Evitar que un proxy acumule la respuesta completa antes de enviarla
+    resp.headers["X-Accel-Buffering"] = "no"
+    return resp
+
+
+@bp.route("/admin/importar", methods=["GET", "POST"], strict_slashes=False)
+def admin_importar():
+    """Carga masiva desde CSV (pacientes, médicos o medicamentos) con reporte por fila."""
+
+    if "user_id" not in session:
+        return redirect(url_for("crud.login", next=request.path))
+
+    if session.get("user_role") != 1:
+        flash("No tiene permiso para acceder al módulo Administrador", "danger")
+        return redirect(url_for("crud.index"))
+
+    columnas = Importacion.columnas
+    if request.method == "GET":
+        return render_template("admin_importar.html", columnas=columnas, reporte=None, tipo="pacientes")
+
+    tipo = (request.form.get("tipo") or "").strip()
+    archivo = request.files.get("archivo")
+    if tipo not in columnas or not archivo or not archivo.filename:
+        flash("Seleccione el tipo de datos y un archivo CSV", "danger")
+        return render_template("admin_importar.html", columnas=columnas, reporte=None, tipo=tipo)
+
+    # utf-8-sig: tolera el BOM que agrega Excel al guardar como CSV
+    lines = io.TextIOWrapper(archivo.stream, encoding="utf-8-sig", newline="")
+    try:
+        with get_connection(current_app) as cn:
+            importacion = Importacion(cn, current_app.config.get("IMPORT_CHUNK_SIZE", 500))
+            reporte = importacion.importar(tipo, lines)
+    except (ValueError, UnicodeDecodeError) as ex:
+        flash(f"Archivo inválido: {ex}", "danger")
+        return render_template("admin_importar.html", columnas=columnas, reporte=None, tipo=tipo)
+    except Exception as ex:
+        flash(f"Error al importar: {ex}", "danger")
+        return render_template("admin_importar.html", columnas=columnas, reporte=None, tipo=tipo)
+
+    flash(f"Importación terminada: {reporte['insertados']} de {reporte['total']} filas insertadas", "success")
+    return render_template("admin_importar.html", columnas=columnas, reporte=reporte, tipo=tipo)
+
+
+@bp.route("/admin/fotos/estado", methods=["GET"], strict_slashes=False)
+def admin_fotos_estado():
+    """JSON con la cola de procesamiento de fotos de este worker (pendientes y latencia)."""
+
+    if "user_id" not in session:
+        return redirect(url_for("crud.login", next=request.path))
+
+    if session.get("user_role") != 1:
+        flash("No tiene permiso para acceder al módulo Administrador", "danger")
+        return redirect(url_for("crud.index"))
+
+    resp = Response(json.dumps(cola_stats()), mimetype="application/json")
+    resp.headers["Cache-Control"] = "no-store"
+    return resp
+
+
 @bp.route("/roles", methods=["GET", "POST"], strict_slashes=False)
 def roles():
     # Solo administradores
@@ -734,13 +1011,16 @@ def roles():
     return redirect(url_for("crud.admin", m="roles"))
 
 
+# Tablas leídas por los dashboards de paciente y médico
+_DASHBOARD_TABLES = ("pacientes", "medicos", "especialidades", "consultas", "recetas", "medicamentos")
+
+
 @bp.route("/pacientes", methods=["GET", "POST"], strict_slashes=False)
 def pacientes():
     # Si no hay sesión, primero mostrar formulario de login
     if "user_id" not in session:
         return redirect(url_for("crud.login", next=request.path))
 
-    user_id = session.get("user_id")
     user_role = session.get("user_role")
 
     # Administrador: se gestiona desde el dashboard /admin
@@ -750,51 +1030,43 @@ def pacientes():
 
     # Paciente: dashboard de solo lectura vinculado a su usuario
     if user_role == 3:
+        # Si el usuario logeado no tiene registro en pacientes, no puede entrar al módulo
+        principal = current_principal()
+        if not principal:
+            flash("No tiene permiso para acceder al módulo Paciente", "danger")
+            return redirect(url_for("crud.index"))
+
+        not_modified = _conditional_get(_DASHBOARD_TABLES)
+        if not_modified:
+            return not_modified
+
         with get_connection(current_app) as cn:
             cur = cn.cursor(dictionary=True)
 
             # Datos personales del paciente vinculado al usuario
-            cur.execute("SELECT * FROM pacientes WHERE IdUsuario=%s", (user_id,))
-            paciente_row = cur.fetchone()
-
-            # Si el usuario logeado no tiene registro en pacientes, no puede entrar al módulo
-            if not paciente_row:
-                cur.close()
-                flash("No tiene permiso para acceder al módulo Paciente", "danger")
-                return redirect(url_for("crud.index"))
+            cur.execute("SELECT * FROM pacientes WHERE IdPaciente=%s", (principal["IdPaciente"],))
+            paciente_row = cur.fetchone() or {}
 
-            paciente_id = paciente_row["IdPaciente"]
+            paciente_id = principal["IdPaciente"]
 
             # Mis consultas (solo las del paciente actual)
             consultas = []
             consultas_recibidas = []
             recetas = []
             if paciente_id is not None:
-                # Consultas pendientes: sin diagnóstico real (vacío o marcado como 'Pendiente')
-                cur.execute(
-                    "SELECT c.IdConsulta, c.FechaConsulta, c.HI, c.HF, c.Diagnostico, "
-                    "m.Nombre AS NombreMedico "
-                    "FROM consultas c "
-                    "LEFT JOIN medicos m ON c.IdMedico = m.IdMedico "
-                    "WHERE c.IdPaciente=%s "
-                    "AND (c.Diagnostico = '' OR c.Diagnostico = 'Pendiente') "
-                    "ORDER BY c.FechaConsulta DESC",
-                    (paciente_id,),
-                )
-                consultas = cur.fetchall() or []
-
-                # Consultas recibidas: aquellas que ya tienen un diagnóstico registrado (distinto de 'Pendiente')
+                # Consultas pendientes (sin diagnóstico real: vacío o 'Pendiente') y
+                # recibidas (con diagnóstico registrado) en una sola consulta
                 cur.execute(
                     "SELECT c.IdConsulta, c.FechaConsulta, c.HI, c.HF, c.Diagnostico, "
-                    "m.Nombre AS NombreMedico "
+                    "m.Nombre AS NombreMedico, c.Diagnostico IN ('', 'Pendiente') AS Pendiente "
                     "FROM consultas c "
                     "LEFT JOIN medicos m ON c.IdMedico = m.IdMedico "
-                    "WHERE c.IdPaciente=%s "
-                    "AND c.Diagnostico NOT IN ('', 'Pendiente') "
+                    "WHERE c.IdPaciente=%s AND c.Diagnostico IS NOT NULL "
                     "ORDER BY c.FechaConsulta DESC",
                     (paciente_id,),
                 )
-                consultas_recibidas = cur.fetchall() or []
+                for row in cur.fetchall() or []:
+                    (consultas if row.pop("Pendiente") else consultas_recibidas).append(row)
 
                 # Mis recetas vinculadas a las consultas del paciente
                 cur.execute(
@@ -816,8 +1088,7 @@ def pacientes():
                 session["lista_recetas_paciente"] = _rows_to_jsonable(recetas)
 
             # Sección de agendar citas (solo lectura: se muestran especialidades y franjas)
-            cur.execute("SELECT * FROM especialidades ORDER BY Descripcion")
-            especialidades = cur.fetchall() or []
+            especialidades = get_reference("especialidades", cn)
 
             cur.close()
 
@@ -843,7 +1114,8 @@ def agendar_cita():
         flash("No tiene permiso para acceder al agendamiento de citas", "danger")
         return redirect(url_for("crud.index"))
 
-    user_id = int(session.get("user_id"))
+    # Datos para navbar (paciente), del perfil de la sesión
+    nav_user = current_principal() or {}
 
     today = date.today()
 
@@ -866,31 +1138,22 @@ def agendar_cita():
     if fecha_sel:
         try:
             fecha_obj = datetime.strptime(fecha_sel, "%Y-%m-%d").date()
-            if fecha_obj < today or fecha_obj > _MAX_AGENDAR_FECHA:
-                fecha_sel = ""
+            # strptime acepta "2030-1-5": las claves por día usan la forma ISO
+            fecha_sel = "" if fecha_obj < today or fecha_obj > _MAX_AGENDAR_FECHA else fecha_obj.isoformat()
         except Exception:
             fecha_sel = ""
 
     with get_connection(current_app) as cn:
         cur = cn.cursor(dictionary=True)
 
-        # Datos para navbar (paciente)
-        cur.execute("SELECT Nombre, Foto FROM pacientes WHERE IdUsuario=%s", (user_id,))
-        nav_user = cur.fetchone() or {}
-
         # Especialidades
-        cur.execute("SELECT IdEsp, Descripcion, Dias, Franja_HI, Franja_HF FROM especialidades ORDER BY Descripcion")
-        especialidades = cur.fetchall() or []
+        especialidades = get_reference("especialidades", cn)
 
         # Médicos filtrados por especialidad
         medicos: list[dict] = []
         especialidad_row = None
         if id_especialidad:
-            cur.execute(
-                "SELECT IdEsp, Descripcion, Dias, Franja_HI, Franja_HF FROM especialidades WHERE IdEsp=%s",
-                (id_especialidad,),
-            )
-            especialidad_row = cur.fetchone()
+            especialidad_row = next((e for e in especialidades if str(e["IdEsp"]) == id_especialidad), None)
 
             cur.execute(
                 "SELECT IdMedico, Nombre FROM medicos WHERE Especialidad=%s ORDER BY Nombre",
@@ -920,7 +1183,8 @@ def agendar_cita():
             franja_hi = medico_row.get("Franja_HI")
             franja_hf = medico_row.get("Franja_HF")
 
-            # Para cada día del mes, contar slots
+            # Para cada día del mes, contar slots (ocupados del mes en una sola consulta)
+            ocupados = _ocupados_del_mes(cn, int(medico_row["IdMedico"]), anio, mes)
             _, days_in_month = pycalendar.monthrange(anio, mes)
             for day in range(1, days_in_month + 1):
                 d = date(anio, mes, day)
@@ -929,7 +1193,9 @@ def agendar_cita():
                 if dias_permitidos and d.weekday() not in dias_permitidos:
                     continue
                 iso = d.isoformat()
-                slots = _get_available_slots_30m(cn, int(medico_row["IdMedico"]), iso, franja_hi, franja_hf)
+                slots = _get_available_slots_30m(
+                    cn, int(medico_row["IdMedico"]), iso, franja_hi, franja_hf, ocupados.get(iso, [])
+                )
 
                 # Si es hoy, filtrar slots ya pasados
                 if d == today:
@@ -954,6 +1220,7 @@ def agendar_cita():
                         fecha_sel,
                         franja_hi,
                         franja_hf,
+                        ocupados.get(dsel.isoformat(), []) if (dsel.year, dsel.month) == (anio, mes) else None,
                     )
                     if dsel == today:
                         now = datetime.now()
@@ -1033,14 +1300,13 @@ def agendar_cita_confirmar():
         flash("Horario inválido.", "warning")
         return redirect(url_for("crud.agendar_cita"))
 
-    user_id = int(session.get("user_id"))
+    principal = current_principal()
+    if not principal:
+        flash("No existe un paciente asociado a este usuario.", "danger")
+        return redirect(url_for("crud.pacientes"))
+    paciente_id = principal["IdPaciente"]
 
     with get_connection(current_app) as cn:
-        paciente_id = _get_paciente_id_for_user(cn, user_id)
-        if not paciente_id:
-            flash("No existe un paciente asociado a este usuario.", "danger")
-            return redirect(url_for("crud.pacientes"))
-
         cur = cn.cursor(dictionary=True)
         # Validar médico vs especialidad y obtener franja/días
         cur.execute(
@@ -1077,14 +1343,7 @@ def agendar_cita_confirmar():
             )
 
         # Validar choque (doble validación)
-        cur.execute(
-            "SELECT 1 FROM consultas "
-            "WHERE IdMedico=%s AND FechaConsulta=%s "
-            "AND NOT (HF <= %s OR HI >= %s) LIMIT 1",
-            (id_medico, fecha, hi_db, hf),
-        )
-        clash = cur.fetchone()
-        if clash:
+        if hay_choque(cn, "IdMedico", id_medico, fecha, hi_db, hf):
             cur.close()
             flash("Ese horario acaba de ocuparse. Seleccione otro.", "warning")
             return redirect(
@@ -1097,14 +1356,7 @@ def agendar_cita_confirmar():
             )
 
         # Validar choque del paciente (no puede tener dos citas en el mismo horario)
-        cur.execute(
-            "SELECT 1 FROM consultas "
-            "WHERE IdPaciente=%s AND FechaConsulta=%s "
-            "AND NOT (HF <= %s OR HI >= %s) LIMIT 1",
-            (paciente_id, fecha, hi_db, hf),
-        )
-        patient_clash = cur.fetchone()
-        if patient_clash:
+        if hay_choque(cn, "IdPaciente", paciente_id, fecha, hi_db, hf):
             cur.close()
             return redirect(
                 url_for(
@@ -1123,6 +1375,7 @@ def agendar_cita_confirmar():
             (id_medico, paciente_id, fecha, hi_db, hf, "Pendiente"),
         )
         cn.commit()
+        bump_version("consultas")
         cur.close()
 
     flash("Cita médica agendada correctamente.", "success")
@@ -1145,24 +1398,19 @@ def medicos():
 
     # Médico: ver su propio panel (similar a paciente)
     if user_role == 2:
-        with get_connection(current_app) as cn:
-            cur = cn.cursor(dictionary=True)
+        # Datos del médico vinculado al usuario logueado (perfil de la sesión)
+        medico_row = current_principal()
+        if not medico_row:
+            flash("No tiene un registro de médico asociado a este usuario", "danger")
+            return redirect(url_for("crud.index"))
+        medico_row["IdUsuario"] = user_id
 
-            # Datos del médico vinculado al usuario logueado (con nombre de especialidad)
-            cur.execute(
-                "SELECT m.IdMedico, m.Nombre, m.Especialidad, m.IdUsuario, m.Foto, "
-                "e.Descripcion AS NombreEspecialidad "
-                "FROM medicos m "
-                "LEFT JOIN especialidades e ON m.Especialidad = e.IdEsp "
-                "WHERE m.IdUsuario=%s",
-                (user_id,),
-            )
-            medico_row = cur.fetchone()
+        not_modified = _conditional_get(_DASHBOARD_TABLES)
+        if not_modified:
+            return not_modified
 
-            if not medico_row:
-                cur.close()
-                flash("No tiene un registro de médico asociado a este usuario", "danger")
-                return redirect(url_for("crud.index"))
+        with get_connection(current_app) as cn:
+            cur = cn.cursor(dictionary=True)
 
             medico_id = medico_row["IdMedico"]
 
@@ -1239,19 +1487,15 @@ def atender_consulta(id_consulta: int):
         flash("No tiene permiso para atender consultas", "danger")
         return redirect(url_for("crud.index"))
 
-    user_id = session.get("user_id")
+    # Médico vinculado a este usuario (perfil de la sesión)
+    medico_row = current_principal()
+    if not medico_row:
+        flash("No tiene un registro de médico asociado a este usuario", "danger")
+        return redirect(url_for("crud.index"))
 
     with get_connection(current_app) as cn:
         cur = cn.cursor(dictionary=True)
 
-        # Médico vinculado a este usuario
-        cur.execute("SELECT IdMedico, Nombre, Foto FROM medicos WHERE IdUsuario=%s", (user_id,))
-        medico_row = cur.fetchone()
-        if not medico_row:
-            cur.close()
-            flash("No tiene un registro de médico asociado a este usuario", "danger")
-            return redirect(url_for("crud.index"))
-
         medico_id = medico_row["IdMedico"]
 
         # Cargar consulta (solo si pertenece al médico)
@@ -1277,8 +1521,7 @@ def atender_consulta(id_consulta: int):
             return redirect(url_for("crud.medicos"))
 
         # Medicamentos para la receta
-        cur.execute("SELECT IdMedicamento, Nombre FROM medicamentos ORDER BY Nombre")
-        medicamentos = cur.fetchall() or []
+        medicamentos = get_reference("medicamentos", cn)
 
         if request.method == "POST":
             diagnostico = (request.form.get("Diagnostico") or "").strip()
@@ -1317,6 +1560,7 @@ def atender_consulta(id_consulta: int):
                     (id_consulta, int(id_medicamento), cantidad),
                 )
                 cn.commit()
+                bump_version("consultas", "recetas")
                 cur.close()
                 flash("Consulta atendida: diagnóstico actualizado y receta asignada", "success")
                 return redirect(url_for("crud.medicos"))
@@ -1356,28 +1600,30 @@ def siguiente_cita(id_consulta: int):
     if fecha_sel:
         try:
             fecha_obj = datetime.strptime(fecha_sel, "%Y-%m-%d").date()
-            if fecha_obj < today or fecha_obj > _MAX_AGENDAR_FECHA:
-                fecha_sel = ""
+            # strptime acepta "2030-1-5": las claves por día usan la forma ISO
+            fecha_sel = "" if fecha_obj < today or fecha_obj > _MAX_AGENDAR_FECHA else fecha_obj.isoformat()
         except Exception:
             fecha_sel = ""
 
-    user_id = int(session.get("user_id"))
+    # Médico (perfil de la sesión) y su especialidad (caché de referencia)
+    medico_row = current_principal()
+    if not medico_row:
+        flash("No tiene un registro de médico asociado a este usuario", "danger")
+        return redirect(url_for("crud.index"))
 
     with get_connection(current_app) as cn:
         cur = cn.cursor(dictionary=True)
 
-        # Médico
-        cur.execute(
-            "SELECT m.IdMedico, m.Nombre, m.Foto, m.Especialidad, e.IdEsp, e.Descripcion, e.Dias, e.Franja_HI, e.Franja_HF "
-            "FROM medicos m LEFT JOIN especialidades e ON m.Especialidad = e.IdEsp "
-            "WHERE m.IdUsuario=%s",
-            (user_id,),
+        especialidad = next(
+            (e for e in get_reference("especialidades", cn) if e["IdEsp"] == medico_row["Especialidad"]), {}
+        )
+        medico_row.update(
+            IdEsp=especialidad.get("IdEsp"),
+            Descripcion=especialidad.get("Descripcion"),
+            Dias=especialidad.get("Dias"),
+            Franja_HI=especialidad.get("Franja_HI"),
+            Franja_HF=especialidad.get("Franja_HF"),
         )
-        medico_row = cur.fetchone()
-        if not medico_row:
-            cur.close()
-            flash("No tiene un registro de médico asociado a este usuario", "danger")
-            return redirect(url_for("crud.index"))
 
         medico_id = int(medico_row["IdMedico"])
         id_especialidad = str(medico_row.get("IdEsp") or medico_row.get("Especialidad") or "").strip()
@@ -1424,6 +1670,7 @@ def siguiente_cita(id_consulta: int):
         franja_hi = medico_row.get("Franja_HI")
         franja_hf = medico_row.get("Franja_HF")
 
+        ocupados = _ocupados_del_mes(cn, medico_id, anio, mes)
         _, days_in_month = pycalendar.monthrange(anio, mes)
         for day in range(1, days_in_month + 1):
             d = date(anio, mes, day)
@@ -1432,7 +1679,7 @@ def siguiente_cita(id_consulta: int):
             if dias_permitidos and d.weekday() not in dias_permitidos:
                 continue
             iso = d.isoformat()
-            slots = _get_available_slots_30m(cn, medico_id, iso, franja_hi, franja_hf)
+            slots = _get_available_slots_30m(cn, medico_id, iso, franja_hi, franja_hf, ocupados.get(iso, []))
             if d == today:
                 now = datetime.now()
                 now_min = now.hour * 60 + now.minute
@@ -1447,7 +1694,10 @@ def siguiente_cita(id_consulta: int):
                 dsel = None
 
             if dsel and (not dias_permitidos or dsel.weekday() in dias_permitidos) and dsel >= today:
-                horarios = _get_available_slots_30m(cn, medico_id, fecha_sel, franja_hi, franja_hf)
+                mismo_mes = (dsel.year, dsel.month) == (anio, mes)
+                horarios = _get_available_slots_30m(
+                    cn, medico_id, fecha_sel, franja_hi, franja_hf, ocupados.get(dsel.isoformat(), []) if mismo_mes else None
+                )
                 if dsel == today:
                     now = datetime.now()
                     now_min = now.hour * 60 + now.minute
@@ -1527,24 +1777,19 @@ def siguiente_cita_confirmar(id_consulta: int):
         flash("Horario inválido.", "warning")
         return redirect(url_for("crud.siguiente_cita", id_consulta=id_consulta))
 
-    user_id = int(session.get("user_id"))
+    # Médico del usuario (evitar que agende con otro médico)
+    medico_row = current_principal()
+    if not medico_row:
+        flash("No tiene un registro de médico asociado a este usuario.", "danger")
+        return redirect(url_for("crud.medicos"))
+
+    if str(medico_row.get("IdMedico")) != str(id_medico):
+        flash("Médico inválido.", "danger")
+        return redirect(url_for("crud.medicos"))
 
     with get_connection(current_app) as cn:
         cur = cn.cursor(dictionary=True)
 
-        # Médico del usuario (evitar que agende con otro médico)
-        cur.execute("SELECT IdMedico, Especialidad FROM medicos WHERE IdUsuario=%s", (user_id,))
-        medico_row = cur.fetchone()
-        if not medico_row:
-            cur.close()
-            flash("No tiene un registro de médico asociado a este usuario.", "danger")
-            return redirect(url_for("crud.medicos"))
-
-        if str(medico_row.get("IdMedico")) != str(id_medico):
-            cur.close()
-            flash("Médico inválido.", "danger")
-            return redirect(url_for("crud.medicos"))
-
         # Consulta original y paciente (evitar manipulación de IdPaciente)
         cur.execute(
             "SELECT c.IdPaciente FROM consultas c WHERE c.IdConsulta=%s AND c.IdMedico=%s",
@@ -1596,25 +1841,13 @@ def siguiente_cita_confirmar(id_consulta: int):
             return redirect(url_for("crud.siguiente_cita", id_consulta=id_consulta, fecha=fecha))
 
         # Validar choque
-        cur.execute(
-            "SELECT 1 FROM consultas "
-            "WHERE IdMedico=%s AND FechaConsulta=%s "
-            "AND NOT (HF <= %s OR HI >= %s) LIMIT 1",
-            (id_medico, fecha, hi_db, hf),
-        )
-        if cur.fetchone():
+        if hay_choque(cn, "IdMedico", id_medico, fecha, hi_db, hf):
             cur.close()
             flash("Ese horario acaba de ocuparse. Seleccione otro.", "warning")
             return redirect(url_for("crud.siguiente_cita", id_consulta=id_consulta, fecha=fecha))
 
         # Validar choque del paciente (no puede tener dos citas en el mismo horario)
-        cur.execute(
-            "SELECT 1 FROM consultas "
-            "WHERE IdPaciente=%s AND FechaConsulta=%s "
-            "AND NOT (HF <= %s OR HI >= %s) LIMIT 1",
-            (int(id_paciente), fecha, hi_db, hf),
-        )
-        if cur.fetchone():
+        if hay_choque(cn, "IdPaciente", int(id_paciente), fecha, hi_db, hf):
             cur.close()
             flash("El paciente ya tiene una cita agendada en esa fecha y hora.", "warning")
             return redirect(url_for("crud.siguiente_cita", id_consulta=id_consulta, fecha=fecha, conflict=1))
@@ -1626,6 +1859,7 @@ def siguiente_cita_confirmar(id_consulta: int):
             (id_medico, int(id_paciente), fecha, hi_db, hf, "Pendiente"),
         )
         cn.commit()
+        bump_version("consultas")
         cur.close()
 
     flash("Siguiente cita agendada correctamente.", "success")